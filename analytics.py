@@ -0,0 +1,139 @@
+# ===============================================
+# analytics.py
+# -----------------------------------------------
+# Thống kê dòng thời gian cảm xúc đã ghi (session_recorder.py)
+#   - dwell_time: tổng thời gian mỗi cảm xúc là cảm xúc trội
+#   - transition_matrix: số lần chuyển cảm xúc A -> B (trong cùng 1 track)
+#   - rolling_mean: trung bình trượt theo cửa sổ thời gian
+#   - track_summary: mỗi người (track ID): thời gian xuất hiện, điểm trung bình, cảm xúc trội
+# Toàn bộ tính bằng phép toán mảng NumPy (sort + bincount + cumsum + reduceat),
+# không lặp Python theo từng dòng -> 1 triệu dòng tính trong chưa tới 1 giây.
+# ===============================================
+
+import numpy as np
+
+from labels import EMOTION_LABELS
+from session_recorder import load_session
+
+
+def align_labels(labels, scores):
+    """Đổi cột điểm số về đúng thứ tự EMOTION_LABELS (phiên ghi bằng thứ tự khác vẫn dùng được)."""
+    labels = list(labels)
+    if labels == list(EMOTION_LABELS):
+        return scores
+    return scores[:, [labels.index(k) for k in EMOTION_LABELS]]
+
+
+def sort_by_track(track, t):
+    """Chỉ số sắp xếp theo (track, thời gian) - các phép tính theo track cần dòng liền nhau."""
+    return np.lexsort((t, track))
+
+
+def frame_durations(track, t, max_gap=1.0):
+    """
+    Thời lượng của mỗi dòng = khoảng tới dòng kế tiếp CÙNG track (đã sort theo track, t).
+    Khoảng lớn hơn max_gap (người đi ra rồi quay lại, camera dừng) không tính vào.
+    Dòng cuối của mỗi track lấy trung vị các khoảng hợp lệ.
+    """
+    dt = np.zeros(len(t), dtype=np.float64)
+    if len(t) < 2:
+        return dt
+    gaps = np.diff(t)
+    same = track[1:] == track[:-1]
+    valid = same & (gaps <= max_gap)
+    dt[:-1] = np.where(valid, gaps, 0.0)
+    typical = float(np.median(gaps[valid])) if valid.any() else 0.0
+    last = np.append(~same, True)
+    dt[last] = typical
+    return dt
+
+
+def dwell_time(t, track, scores, max_gap=1.0, order=None):
+    """
+    -> mảng 7 phần tử: số giây mỗi cảm xúc là cảm xúc trội (cộng dồn mọi track).
+    order: kết quả sort_by_track đã tính sẵn (summarize dùng chung 1 lần sort cho mọi phép tính).
+    """
+    order = sort_by_track(track, t) if order is None else order
+    tr, tt, sc = track[order], t[order], scores[order]
+    dt = frame_durations(tr, tt, max_gap)
+    return np.bincount(sc.argmax(axis=1), weights=dt, minlength=len(EMOTION_LABELS))
+
+
+def transition_matrix(t, track, scores, normalize=False, include_self=False, order=None):
+    """
+    M[i, j] = số lần cảm xúc trội đổi từ i sang j giữa 2 lần phân tích liên tiếp của cùng 1 track.
+    normalize=True: mỗi hàng chia tổng -> xác suất chuyển.
+    """
+    k = len(EMOTION_LABELS)
+    order = sort_by_track(track, t) if order is None else order
+    tr, dom = track[order], scores[order].argmax(axis=1)
+    same = tr[1:] == tr[:-1]
+    src, dst = dom[:-1][same], dom[1:][same]
+    if not include_self:
+        changed = src != dst
+        src, dst = src[changed], dst[changed]
+    m = np.bincount(src * k + dst, minlength=k * k).reshape(k, k).astype(np.float64)
+    if normalize:
+        totals = m.sum(axis=1, keepdims=True)
+        m = np.divide(m, totals, out=np.zeros_like(m), where=totals > 0)
+    return m
+
+
+def rolling_mean(t, scores, window_s=5.0):
+    """Trung bình điểm số trong window_s giây gần nhất tại mỗi dòng (t phải tăng dần)."""
+    csum = np.zeros((len(t) + 1, scores.shape[1]), dtype=np.float64)
+    np.cumsum(scores, axis=0, dtype=np.float64, out=csum[1:])
+    end = np.arange(1, len(t) + 1)
+    start = np.searchsorted(t, t - window_s, side="left")
+    return (csum[end] - csum[start]) / (end - start)[:, None]
+
+
+def track_summary(t, track, scores, order=None):
+    """-> list dict mỗi track: số dòng, thời điểm đầu/cuối, điểm trung bình, cảm xúc trội."""
+    if len(t) == 0:
+        return []
+    order = sort_by_track(track, t) if order is None else order
+    tr, tt, sc = track[order], t[order], scores[order].astype(np.float64)
+    starts = np.flatnonzero(np.append(True, tr[1:] != tr[:-1]))
+    counts = np.diff(np.append(starts, len(tr)))
+    means = np.add.reduceat(sc, starts, axis=0) / counts[:, None]
+    first = tt[starts]
+    last = tt[np.append(starts[1:], len(tr)) - 1]
+    dom = means.argmax(axis=1)
+    return [
+        {
+            "track": int(tr[s]),
+            "rows": int(n),
+            "first": float(f),
+            "last": float(l),
+            "duration_s": round(float(l - f), 2),
+            "dominant": EMOTION_LABELS[d],
+            "mean_scores": {k: round(float(v), 4) for k, v in zip(EMOTION_LABELS, m)},
+        }
+        for s, n, f, l, d, m in zip(starts, counts, first, last, dom, means)
+    ]
+
+
+def summarize(path, window_s=5.0, max_gap=1.0):
+    """Đọc 1 phiên (memmap) và tính toàn bộ thống kê."""
+    labels, data = load_session(path)
+    t = np.asarray(data["t"])
+    track = np.asarray(data["track"])
+    scores = align_labels(labels, np.asarray(data["scores"]))
+    order = sort_by_track(track, t)
+    dwell = dwell_time(t, track, scores, max_gap, order)
+    roll = rolling_mean(t, scores, window_s) if len(t) else np.zeros((0, len(EMOTION_LABELS)))
+    per_track = track_summary(t, track, scores, order)
+    return {
+        "path": path,
+        "rows": int(len(t)),
+        # frame tăng dần theo thứ tự ghi -> đếm số lần đổi giá trị, khỏi sort
+        "frames": int(np.count_nonzero(np.diff(data["frame"])) + 1) if len(t) else 0,
+        "tracks": len(per_track),
+        "span_s": round(float(t[-1] - t[0]), 2) if len(t) else 0.0,
+        "dwell_s": {k: round(float(v), 2) for k, v in zip(EMOTION_LABELS, dwell)},
+        "transitions": transition_matrix(t, track, scores, order=order).astype(int).tolist(),
+        "rolling_window_s": window_s,
+        "rolling_last": {k: round(float(v), 4) for k, v in zip(EMOTION_LABELS, roll[-1])} if len(roll) else {},
+        "per_track": per_track,
+    }
@@ -0,0 +1,78 @@
+# ===============================================
+# analyze_session.py
+# -----------------------------------------------
+# Thống kê phiên camera đã ghi (sessions/<phiên>)
+#   python analyze_session.py                       # phiên mới nhất trong sessions/
+#   python analyze_session.py sessions/session_20250101_120000 --json report.json
+# In ra: thời gian mỗi cảm xúc chiếm ưu thế, ma trận chuyển cảm xúc, tóm tắt từng người
+# ===============================================
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from analytics import summarize
+from labels import EMOTION_LABELS
+
+
+def latest_session(root="sessions"):
+    sessions = sorted(glob.glob(os.path.join(root, "session_*")))
+    return sessions[-1] if sessions else None
+
+
+def print_report(r, elapsed):
+    print(f"Phiên: {r['path']}")
+    print(f"  {r['rows']} dòng, {r['frames']} frame, {r['tracks']} track, dài {r['span_s']} giây "
+          f"(tính trong {elapsed * 1000:.0f} ms)")
+    print("\nThời gian chiếm ưu thế (giây):")
+    total = sum(r["dwell_s"].values()) or 1.0
+    for k, v in sorted(r["dwell_s"].items(), key=lambda kv: -kv[1]):
+        print(f"  {k:9s} {v:9.1f}  {v / total * 100:5.1f}%")
+
+    print("\nChuyển cảm xúc (hàng: từ, cột: sang):")
+    print("  " + " " * 9 + "".join(f"{k[:7]:>8s}" for k in EMOTION_LABELS))
+    for k, row in zip(EMOTION_LABELS, r["transitions"]):
+        print(f"  {k:9s}" + "".join(f"{v:8d}" for v in row))
+
+    if r["rolling_last"]:
+        print(f"\nTrung bình {r['rolling_window_s']} giây cuối: "
+              + ", ".join(f"{k}:{v:.2f}" for k, v in r["rolling_last"].items()))
+
+    print("\nTừng người (track):")
+    for tr in sorted(r["per_track"], key=lambda d: -d["duration_s"])[:20]:
+        print(f"  #{tr['track']:<5d} {tr['duration_s']:8.1f}s  {tr['rows']:7d} dòng  trội: {tr['dominant']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Thống kê dòng thời gian cảm xúc của 1 phiên camera.")
+    parser.add_argument("session", nargs="?", help="Thư mục phiên (mặc định: phiên mới nhất trong sessions/)")
+    parser.add_argument("--window", type=float, default=5.0, help="Cửa sổ trung bình trượt (giây)")
+    parser.add_argument("--max-gap", type=float, default=1.0,
+                        help="Khoảng trống lớn hơn mức này (giây) không tính vào thời gian")
+    parser.add_argument("--json", help="Ghi báo cáo đầy đủ ra file JSON ('-' = stdout)")
+    args = parser.parse_args(argv)
+
+    path = args.session or latest_session()
+    if not path or not os.path.exists(os.path.join(path, "header.json")):
+        print("Không tìm thấy phiên nào (chạy màn hình camera để ghi phiên trước).", file=sys.stderr)
+        return 1
+
+    t0 = time.perf_counter()
+    report = summarize(path, window_s=args.window, max_gap=args.max_gap)
+    elapsed = time.perf_counter() - t0
+
+    if args.json == "-":
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print_report(report, elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# ===============================================
+# batch_analyze.py
+# -----------------------------------------------
+# Phân tích cảm xúc hàng loạt, không cần giao diện Flet
+#   python batch_analyze.py images/ -o results.jsonl
+#   python batch_analyze.py "archive/**/*.jpg" -o results.csv --workers 8
+#   - Chia ảnh cho nhiều tiến trình, mỗi tiến trình chỉ load mô hình 1 lần
+#   - Ghi kết quả dần dần (JSONL/CSV), không giữ tất cả trong RAM
+#   - --cache: ảnh đã phân tích (cùng nội dung + mô hình) lấy kết quả từ cache SQLite
+#   - Cuối cùng in tốc độ ảnh/giây và ảnh/giây/core
+#   - --metrics-port: mở /metrics (Prometheus) trong lúc chạy: số ảnh, mặt, lỗi, độ trễ, thời gian load mô hình
+# ===============================================
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from function import EMOTION_LABELS, find_and_score, get_classifier, get_face_finder
+from detectors import detector_choices, resolve_detector
+from metrics_exporter import METRICS, BatchMetrics, start_metrics_server
+from result_cache import DEFAULT_PATH, ResultCache
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def collect_paths(inputs):
+    """Thư mục (quét đệ quy), file hoặc glob -> danh sách đường dẫn ảnh (đã sắp xếp, không trùng)."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTS))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            paths.extend(p for p in glob.glob(item, recursive=True) if p.lower().endswith(IMAGE_EXTS))
+    return sorted(set(paths))
+
+
+# -------------------------------------------------
+# Phía worker: mỗi tiến trình lấy mô hình từ REGISTRY của chính nó (load 1 lần / tiến trình)
+# -------------------------------------------------
+_WORKER_FINDER = None
+_WORKER_CLASSIFIER = None
+_WORKER_CACHE = None
+_WORKER_LOAD_S = None   # thời gian load mô hình, gửi về tiến trình chính 1 lần kèm kết quả đầu tiên
+
+def _init_worker(detector, threads, backend, model_path, cache_path=None):
+    global _WORKER_FINDER, _WORKER_CLASSIFIER, _WORKER_CACHE, _WORKER_LOAD_S
+    os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+    if backend == "keras" or resolve_detector(detector) == "mtcnn":
+        try:
+            # Nhiều tiến trình cùng chạy -> giới hạn luồng TF mỗi tiến trình để không tranh CPU
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except Exception:
+            pass
+    # ONNX/TFLite + Haar/DNN của OpenCV: tiến trình không phải load TensorFlow
+    t0 = time.perf_counter()
+    _WORKER_FINDER = get_face_finder(detector)
+    _WORKER_CLASSIFIER = get_classifier(backend, model_path, threads)
+    _WORKER_LOAD_S = time.perf_counter() - t0
+    # Mỗi tiến trình mở 1 kết nối riêng tới cùng file cache
+    _WORKER_CACHE = ResultCache(cache_path) if cache_path else None
+
+
+def _analyze_one(path):
+    """Kết quả 1 ảnh + các trường "_..." nội bộ cho metrics (tiến trình chính bỏ đi trước khi ghi)."""
+    global _WORKER_LOAD_S
+    t0 = time.perf_counter()
+    record = _analyze_image(path)
+    record["_ms"] = (time.perf_counter() - t0) * 1000.0
+    if _WORKER_LOAD_S is not None:
+        record["_load_s"], record["_worker"] = _WORKER_LOAD_S, os.getpid()
+        _WORKER_LOAD_S = None
+    return record
+
+
+def _analyze_image(path):
+    img = cv2.imread(path)
+    if img is None:
+        return {"path": path, "error": "Không mở được ảnh"}
+    h, w = img.shape[:2]
+    try:
+        kept, scores = find_and_score(img, _WORKER_FINDER, _WORKER_CLASSIFIER, _WORKER_CACHE)
+    except Exception as e:
+        return {"path": path, "width": w, "height": h, "error": str(e)}
+    faces = [
+        {"box": list(box), "emotions": {k: round(float(v), 4) for k, v in zip(EMOTION_LABELS, row)}}
+        for box, row in zip(kept, scores)
+    ]
+    return {"path": path, "width": w, "height": h, "faces": faces}
+
+
+# -------------------------------------------------
+# Ghi kết quả
+# -------------------------------------------------
+def _windowed_map(pool, fn, items, chunksize, window):
+    """
+    Như pool.map nhưng chỉ gửi tối đa 2 cửa sổ (window ảnh) cho worker cùng lúc:
+    Executor.map gửi hết mọi phần tử ngay từ đầu -> thư mục triệu ảnh giữ triệu Future trong RAM.
+    Cửa sổ kế tiếp được gửi trước khi đọc kết quả cửa sổ hiện tại nên worker không phải chờ.
+    """
+    windows = (items[i:i + window] for i in range(0, len(items), window))
+    pending = None
+    for chunk in windows:
+        current, pending = pending, pool.map(fn, chunk, chunksize=chunksize)
+        if current is not None:
+            yield from current
+    if pending is not None:
+        yield from pending
+
+
+class JsonlWriter:
+    def __init__(self, fh):
+        self.fh = fh
+
+    def write(self, record):
+        self.fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class CsvWriter:
+    """Mỗi khuôn mặt 1 dòng; ảnh không có mặt vẫn có 1 dòng (face trống) để không bị mất dấu."""
+
+    def __init__(self, fh):
+        self.writer = csv.writer(fh)
+        self.writer.writerow(["path", "face", "x", "y", "w", "h", *EMOTION_LABELS, "error"])
+
+    def write(self, record):
+        faces = record.get("faces") or []
+        if not faces:
+            self.writer.writerow([record["path"], "", "", "", "", "", *[""] * len(EMOTION_LABELS), record.get("error", "")])
+        for i, face in enumerate(faces):
+            self.writer.writerow([record["path"], i, *face["box"],
+                                  *(f"{face['emotions'][k]:.4f}" for k in EMOTION_LABELS), ""])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nhận diện cảm xúc hàng loạt cho thư mục/glob ảnh.")
+    parser.add_argument("inputs", nargs="+", help="Thư mục, file ảnh hoặc glob (vd: 'images/*.jpg')")
+    parser.add_argument("-o", "--output", default="-", help="File .jsonl/.csv ('-' = stdout)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="Mặc định đoán theo đuôi file output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--detector", choices=detector_choices(), default="fast",
+                        help="Bộ tìm mặt: profile fast/balanced/accurate hoặc backend haar/dnn/mtcnn")
+    parser.add_argument("--mtcnn", action="store_true", help="Như --detector mtcnn (chính xác hơn, chậm hơn)")
+    parser.add_argument("--backend", choices=("keras", "onnx", "tflite"), default="keras",
+                        help="Backend bộ phân loại (onnx/tflite: xuất bằng export_models.py)")
+    parser.add_argument("--model", help="Đường dẫn file .onnx/.tflite")
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--cache", nargs="?", const=DEFAULT_PATH, default=None,
+                        help="Cache kết quả SQLite (mặc định .cache/results.sqlite): chạy lại thư mục cũ gần như tức thì")
+    parser.add_argument("--metrics-port", type=int, help="Mở http://127.0.0.1:<port>/metrics trong lúc chạy")
+    parser.add_argument("--metrics-linger", type=float, default=30.0,
+                        help="Giữ /metrics thêm N giây sau khi xong để Prometheus lấy được số liệu cuối (Ctrl+C để thoát sớm)")
+    args = parser.parse_args(argv)
+
+    paths = collect_paths(args.inputs)
+    if not paths:
+        print("Không tìm thấy ảnh nào.", file=sys.stderr)
+        return 1
+
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    fh = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    writer = CsvWriter(fh) if fmt == "csv" else JsonlWriter(fh)
+
+    workers = max(1, min(args.workers, len(paths)))
+    metrics = BatchMetrics(EMOTION_LABELS)
+    server = None
+    if args.metrics_port:
+        METRICS.register("batch", metrics.families)
+        server = start_metrics_server(args.metrics_port)
+    n_faces = n_errors = 0
+    t0 = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=("mtcnn" if args.mtcnn else args.detector, args.threads_per_worker, args.backend, args.model, args.cache)) as pool:
+            # Giữ đúng thứ tự và trả kết quả dần -> ghi ngay; chỉ ~2 cửa sổ ảnh nằm trong hàng đợi
+            window = max(args.chunksize * workers * 4, 256)
+            for record in _windowed_map(pool, _analyze_one, paths, args.chunksize, window):
+                ms = record.pop("_ms", None)
+                worker, load_s = record.pop("_worker", None), record.pop("_load_s", None)
+                metrics.observe(record, ms, worker, load_s)
+                writer.write(record)
+                n_faces += len(record.get("faces") or [])
+                n_errors += "error" in record
+    finally:
+        if fh is not sys.stdout:
+            fh.close()
+
+    elapsed = time.time() - t0
+    rate = len(paths) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"[INFO] {len(paths)} ảnh, {n_faces} khuôn mặt, {n_errors} lỗi trong {elapsed:.1f}s "
+        f"-> {rate:.2f} ảnh/giây ({rate / workers:.2f} ảnh/giây/core, {workers} worker)",
+        file=sys.stderr,
+    )
+    if server is not None:
+        try:
+            if args.metrics_linger > 0:
+                print(f"[INFO] Giữ /metrics thêm {args.metrics_linger:.0f}s (Ctrl+C để thoát)", file=sys.stderr)
+                time.sleep(args.metrics_linger)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+# ===============================================
+# benchmark.py
+# -----------------------------------------------
+# Đo hiệu năng các đoạn code nóng với ảnh mẫu trong images/
+#   python benchmark.py -o bench.json
+#   python benchmark.py --only encode --widths 640 1280
+#   - detect_emotion_from_frame, analyze_frame
+#   - frame_to_base64_png / frame_to_base64
+#   - Haar vs MTCNN ở nhiều độ phân giải
+#   - Phân loại theo batch: thời gian theo số mặt trong 1 frame (1 -> 20 mặt)
+#   - Tìm mặt theo ô song song (tiling.py) so với quét 1 lượt: tốc độ gấp mấy lần, số mặt
+#   - Xuất p50/p95/p99 (ms), faces/giây, RAM tăng thêm của từng case + peak RSS cả tiến trình dạng JSON
+# ===============================================
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detectors import default_detector, resolve_detector
+from model_registry import REGISTRY, _rss_bytes
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+# Ảnh giữ chỗ của UI, không có khuôn mặt
+SKIP_FIXTURES = {"camera-not-available.jpg"}
+
+
+def load_fixtures(folder=FIXTURE_DIR):
+    paths = sorted(
+        p for ext in ("*.jpg", "*.jpeg", "*.png")
+        for p in glob.glob(os.path.join(folder, ext))
+        if os.path.basename(p) not in SKIP_FIXTURES
+    )
+    images = []
+    for p in paths:
+        img = cv2.imread(p)
+        if img is not None:
+            images.append((os.path.basename(p), img))
+    return images
+
+
+def resize_to_width(img, width):
+    if not width:
+        return img
+    h, w = img.shape[:2]
+    return cv2.resize(img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+def peak_rss_mb():
+    """Bộ nhớ thường trú cao nhất của tiến trình (MB), None nếu không đo được."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả KB, macOS trả byte
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def rss_mb():
+    """RAM thường trú hiện tại (MB), None nếu không đo được."""
+    rss = _rss_bytes()
+    return rss / (1024 * 1024) if rss is not None else None
+
+
+def time_calls(fn, images, repeat, warmup):
+    """fn(img) -> số khuôn mặt (hoặc 0). Ảnh được copy ngoài vùng bấm giờ vì nhiều hàm vẽ đè lên ảnh."""
+    for _, img in images[:warmup]:
+        fn(img.copy())
+    latencies, faces = [], 0
+    for _ in range(repeat):
+        for _, img in images:
+            arg = img.copy()
+            t0 = time.perf_counter()
+            faces += fn(arg) or 0
+            latencies.append(time.perf_counter() - t0)
+    return np.asarray(latencies), faces
+
+
+def summarize(name, backend, width, latencies, faces, rss0=None):
+    """rss0: RAM lúc bắt đầu case (trước khi load mô hình) -> rss_delta_mb là phần case này thêm vào."""
+    ms = latencies * 1000.0
+    total = float(latencies.sum())
+    rss = rss_mb()
+    return {
+        "name": name,
+        "backend": backend,
+        "width": width or "native",
+        "calls": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "faces": int(faces),
+        "faces_per_sec": round(faces / total, 2) if total > 0 else 0.0,
+        "rss_delta_mb": round(rss - rss0, 1) if rss0 is not None and rss is not None else None,
+        # ru_maxrss: đỉnh của cả tiến trình từ lúc chạy, chỉ tăng -> không phải RAM riêng của case
+        "cumulative_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# -------------------------------------------------
+# Các trường hợp đo (import lười để --only không load mô hình thừa)
+# -------------------------------------------------
+def build_cases():
+    def detect_frame():
+        from function import detect_emotion_from_frame
+        return lambda img: len(detect_emotion_from_frame(img)[2])
+
+    def analyze():
+        from study import analyze_frame
+        return lambda img: len(analyze_frame(img)[3])
+
+    def encode_png():
+        from function import frame_to_base64_png
+        def run(img):
+            frame_to_base64_png(img)
+            return 0
+        return run
+
+    def encode_study():
+        from study import frame_to_base64
+        def run(img):
+            frame_to_base64(img)
+            return 0
+        return run
+
+    def encode_preview(fmt, quality):
+        def make():
+            from preview import PreviewEncoder
+            encoder = PreviewEncoder(fmt, quality=quality)
+            def run(img):
+                encoder.encode(img)
+                return 0
+            # Kích thước trung bình mỗi frame, reset sau mỗi độ phân giải
+            def extra():
+                avg = encoder.stats()["avg_bytes"]
+                encoder.reset_stats()
+                return {"avg_bytes": avg, "encoder_backend": encoder.backend}
+            run.extra = extra
+            return run
+        return make
+
+    def find_faces(name, max_side=None, tiled=False):
+        def make():
+            from function import detect_faces, get_face_finder, get_tiled_detector
+            from roi import detect_multiscale
+            if tiled:
+                return lambda img: len(get_tiled_detector(name).detect(img))
+            finder = get_face_finder(name)
+            if max_side:
+                # Tìm trên bản thu nhỏ, box trả về theo tọa độ ảnh gốc
+                return lambda img: len(detect_multiscale(img, lambda small: detect_faces(small, finder), max_side))
+            return lambda img: len(detect_faces(img, finder))
+        return make
+
+    # Backend thật mà 2 hàm này dùng (profile mặc định, có thể đổi sau khi chạy python detectors.py)
+    return [
+        ("detect_emotion_from_frame", resolve_detector(default_detector("live")), detect_frame),
+        ("analyze_frame", resolve_detector(default_detector("still")), analyze),
+        ("encode", "frame_to_base64_png", encode_png),
+        ("encode", "frame_to_base64", encode_study),
+        ("encode", "preview_jpeg_q80", encode_preview("jpeg", 80)),
+        ("encode", "preview_png_c1", encode_preview("png", 1)),
+        ("encode", "preview_bmp", encode_preview("bmp", 0)),
+        ("find_faces", "haar", find_faces("haar")),
+        ("find_faces", "mtcnn", find_faces("mtcnn")),
+        ("find_faces", "haar_multiscale_1280", find_faces("haar", 1280)),
+        ("find_faces", "mtcnn_multiscale_1280", find_faces("mtcnn", 1280)),
+        ("find_faces", "haar_tiled", find_faces("haar", tiled=True)),
+        ("find_faces", "mtcnn_tiled", find_faces("mtcnn", tiled=True)),
+    ]
+
+
+def batch_scaling_report(fixtures, counts=(1, 2, 5, 10, 20), repeat=5):
+    """Thời gian classify_boxes (cắt + chuẩn hóa + 1 lần gọi mô hình) theo số mặt trong frame."""
+    from function import classify_boxes, get_classifier
+    classifier = get_classifier()
+    _, img = fixtures[0]
+    h, w = img.shape[:2]
+    side = max(48, min(h, w) // 6)
+    # Lưới box cố định trên ảnh mẫu: chỉ đo chi phí phân loại, không phụ thuộc bộ tìm mặt
+    grid = [(x, y, side, side) for y in range(0, h - side + 1, side) for x in range(0, w - side + 1, side)]
+    rows = []
+    for n in counts:
+        boxes = (grid * (n // len(grid) + 1))[:n]
+        classify_boxes(img, boxes, classifier)
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            classify_boxes(img, boxes, classifier)
+            times.append((time.perf_counter() - t) * 1000)
+        ms = float(np.median(times))
+        rows.append({"faces": n, "ms": round(ms, 2), "ms_per_face": round(ms / n, 3)})
+        print(f"[BATCH] {n:3d} mặt: {ms:.1f} ms ({ms / n:.2f} ms/mặt)", file=sys.stderr)
+    return rows
+
+
+def tiling_report(fixtures, names=("haar", "mtcnn"), repeat=3):
+    """Tìm mặt theo ô vs quét 1 lượt trên từng ảnh mẫu (độ phân giải gốc)."""
+    from function import detect_faces, get_face_finder, get_tiled_detector
+    from tiling import compare
+    rows = []
+    for name in names:
+        finder, tiled = get_face_finder(name), get_tiled_detector(name)
+        for fixture, img in fixtures:
+            r = compare(img, tiled, lambda im: detect_faces(im, finder), repeat)
+            rows.append(dict(r, detector=name, fixture=fixture, size=[img.shape[1], img.shape[0]]))
+            print(f"[TILE] {name:6s} {fixture:24s} 1 lượt {r['single_ms']:.1f}ms/{r['single_faces']} mặt, "
+                  f"{r['tiles']} ô {r['tiled_ms']:.1f}ms/{r['tiled_faces']} mặt -> x{r['speedup']}", file=sys.stderr)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các đường xử lý nóng.")
+    parser.add_argument("-o", "--output", default="-", help="File JSON ('-' = stdout)")
+    parser.add_argument("--widths", type=int, nargs="+", default=[0, 320, 640, 1280],
+                        help="Chiều ngang ảnh cần đo (0 = giữ nguyên)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", nargs="+", help="Chỉ chạy case có tên/backend chứa chuỗi này")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"Không tìm thấy ảnh mẫu trong {FIXTURE_DIR}", file=sys.stderr)
+        return 1
+
+    results = []
+    tiling = batch_scaling = None
+    for name, backend, make in build_cases():
+        if args.only and not any(o in name or o in backend for o in args.only):
+            continue
+        rss0 = rss_mb()
+        fn = make()
+        for width in args.widths:
+            images = [(n, resize_to_width(img, width)) for n, img in fixtures]
+            latencies, faces = time_calls(fn, images, args.repeat, args.warmup)
+            row = summarize(name, backend, width, latencies, faces, rss0)
+            if hasattr(fn, "extra"):
+                row.update(fn.extra())
+            results.append(row)
+            print(f"[BENCH] {name:26s} {backend:20s} w={row['width']!s:6s} "
+                  f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms faces/s={row['faces_per_sec']}",
+                  file=sys.stderr)
+    if not args.only or any("classify" in o for o in args.only):
+        batch_scaling = batch_scaling_report(fixtures, repeat=args.repeat)
+    if not args.only or any("tiled" in o for o in args.only):
+        tiling = tiling_report(fixtures, repeat=args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "fixtures": [n for n, _ in fixtures],
+            "repeat": args.repeat,
+        },
+        "results": results,
+        "batch_scaling": batch_scaling,
+        "tiling": tiling,
+        "peak_rss_mb": peak_rss_mb(),
+        # RAM / trọng số từng mô hình đã load (model_registry.py)
+        "models": [dict(r, key=list(r["key"])) for r in REGISTRY.report()],
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# ===============================================
+# capture_writer.py
+# -----------------------------------------------
+# Ghi ảnh chụp xuống đĩa ở luồng nền (không chặn giao diện / luồng camera)
+#   - submit() chỉ copy frame vào hàng đợi rồi trả về ngay
+#   - Luồng ghi gom nhiều ảnh 1 lượt: mã hóa + ghi file, rồi ghi nhãn/điểm số/box
+#     của cả lượt vào chỉ mục (storage_index) trong CÙNG 1 transaction
+#   - Codec chọn được: png (mức nén 0-9), jpeg / webp (chất lượng 0-100, webp 101 = lossless)
+#   - stats(): số ảnh đang chờ (backlog), đã ghi, bỏ qua, tốc độ ghi
+# ===============================================
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+from storage_index import make_thumbnail
+
+CODECS = {
+    # fmt: (đuôi file, tham số imwrite, mức mặc định)
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION, 3),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, 92),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, 90),
+}
+
+
+class CaptureWriter:
+    """
+    fmt: "png" | "jpeg" | "webp"; quality: mức nén png hoặc chất lượng jpeg/webp (None = mặc định)
+    batch_size / flush_interval: gom tối đa batch_size ảnh hoặc chờ tối đa flush_interval giây mỗi lượt ghi
+    max_queue: hàng đợi đầy thì submit() bỏ ảnh (block=False) thay vì làm khựng luồng gọi
+    """
+
+    def __init__(self, storage_dir, index, fmt="png", quality=None, batch_size=8, flush_interval=0.5, max_queue=64):
+        if fmt not in CODECS:
+            raise ValueError(f"Định dạng lưu không hỗ trợ: {fmt}")
+        ext, param, default = CODECS[fmt]
+        self.storage_dir = storage_dir
+        self.index = index
+        self.fmt = fmt
+        self.ext = ext
+        self.params = [param, int(default if quality is None else quality)]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._q = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._last_name = None
+        self._seq = 0
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.batches = 0
+        self._busy_s = 0.0
+        self._t0 = time.monotonic()
+
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _filename(self, prefix):
+        # Chụp liên tục có thể nhiều ảnh trong cùng 1 giây -> thêm số thứ tự khi trùng tên
+        with self._lock:
+            name = f"{prefix}_{datetime.now():%Y%m%d_%H%M%S}"
+            if name == self._last_name:
+                self._seq += 1
+            else:
+                self._last_name, self._seq = name, 0
+            return f"{name}{'' if self._seq == 0 else f'_{self._seq}'}{self.ext}"
+
+    def submit(self, img_bgr, label, prefix, scores=None, boxes=None, block=False):
+        """Đưa ảnh vào hàng đợi -> đường dẫn file sẽ được ghi (None nếu hàng đợi đầy và block=False)."""
+        filename = self._filename(prefix)
+        # Copy: nơi gọi được phép vẽ đè / tái sử dụng buffer ngay sau khi submit
+        item = (filename, img_bgr.copy(), label, prefix, scores, boxes, time.time())
+        try:
+            self._q.put(item, block=block)
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return os.path.join(self.storage_dir, filename)
+
+    def _loop(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            t0 = time.perf_counter()
+            try:
+                self._write_batch(batch)
+            finally:
+                self._busy_s += time.perf_counter() - t0
+                for _ in batch:
+                    self._q.task_done()
+
+    def _write_batch(self, batch):
+        try:
+            for item in batch:
+                try:
+                    self._write_one(*item)
+                except Exception:
+                    # Đĩa đầy / mất quyền / thư mục bị xóa...: bỏ ảnh này, luồng ghi vẫn sống
+                    self.failed += 1
+        finally:
+            # Nhãn / điểm số / box của cả lượt ghi vào chỉ mục trong 1 transaction
+            try:
+                self.index.commit()
+            except Exception:
+                pass
+            self.batches += 1
+
+    def _write_one(self, filename, img, label, prefix, scores, boxes, created):
+        path = os.path.join(self.storage_dir, filename)
+        ok, buf = cv2.imencode(self.ext, img, self.params)
+        if not ok:
+            raise ValueError(f"Không mã hóa được ảnh {filename}")
+        # Ghi file tạm rồi đổi tên: không bao giờ để lại ảnh ghi dở trong kho
+        tmp = path + ".part"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(buf.tobytes())
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.index.add(filename, thumb=make_thumbnail(img), label=label, prefix=prefix,
+                       scores=scores, boxes=boxes, created=created, commit=False)
+        self.written += 1
+        self.bytes_written += len(buf)
+
+    def flush(self, timeout=None):
+        """Chờ ghi hết hàng đợi (vd: trước khi mở thư viện ảnh). True nếu đã ghi xong."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while self._q.unfinished_tasks:
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        elapsed = max(1e-9, time.monotonic() - self._t0)
+        return {
+            "format": self.fmt,
+            "backlog": self._q.unfinished_tasks,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "mb_written": round(self.bytes_written / 2**20, 2),
+            # Tốc độ khi luồng ghi đang làm việc và trung bình từ lúc khởi tạo
+            "images_per_sec_busy": round(self.written / self._busy_s, 1) if self._busy_s else 0.0,
+            "images_per_sec": round(self.written / elapsed, 2),
+        }
@@ -0,0 +1,299 @@
+# ===============================================
+# detectors.py
+# -----------------------------------------------
+# Các bộ tìm khuôn mặt (backend) + profile tốc độ/độ chính xác
+#   - haar : Haar Cascade của OpenCV (như FER() mặc định) - nhanh nhất, hay sót mặt nghiêng
+#   - dnn  : OpenCV DNN SSD ResNet-10 (res10_300x300) - nhanh gần bằng Haar, chính xác hơn nhiều
+#   - mtcnn: MTCNN (như FER(mtcnn=True)) - chính xác nhất, chậm nhất
+#   Mọi backend có cùng API: find_faces(img, bgr=True) -> list box (x, y, w, h)
+#   + min_face_size (mặt nhỏ nhất tìm được, px) và shared (True: 1 bản dùng chung cho mọi luồng,
+#     đã có khóa bên trong hoặc quá nặng để nhân bản; False: rẻ, mỗi luồng giữ 1 bản)
+#
+#   Profile (chọn theo từng lần gọi hoặc từng luồng camera):
+#     fast -> haar, balanced -> dnn, accurate -> mtcnn
+#     (backend thiếu thư viện / file mô hình thì lùi về backend kế tiếp trong PROFILES)
+#   Mặc định: camera dùng profile "live", ảnh tĩnh dùng "still" (xem default_detector)
+#
+#   Đo từng profile trên CPU máy này với ảnh mẫu trong images/:
+#   python detectors.py                 # in bảng + lưu .cache/detector_profiles.json
+# ===============================================
+
+import functools
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# -------------------------------------------------
+# Backend
+# -------------------------------------------------
+class HaarFaceFinder:
+    """Cùng tham số mặc định và API find_faces như FER(mtcnn=False)."""
+    name = "haar"
+    shared = False          # CascadeClassifier rẻ nhưng không an toàn đa luồng
+    min_face_size = 50
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5, min_face_size=50):
+        self._cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_face_size = min_face_size
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def find_faces(self, img, bgr=True):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if bgr else img
+        return self._cascade.detectMultiScale(
+            gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+            flags=cv2.CASCADE_SCALE_IMAGE, minSize=(self.min_face_size, self.min_face_size),
+        )
+
+
+DNN_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+DNN_PROTO = "deploy.prototxt"
+DNN_WEIGHTS = "res10_300x300_ssd_iter_140000.caffemodel"
+DNN_URLS = (
+    "https://raw.githubusercontent.com/opencv/opencv/master/samples/dnn/face_detector/deploy.prototxt",
+    "https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20170830/"
+    "res10_300x300_ssd_iter_140000.caffemodel",
+)
+
+
+class DnnFaceFinder:
+    """
+    SSD ResNet-10 của OpenCV (cv2.dnn, không cần TensorFlow). File mô hình (~10 MB) đặt trong
+    models/ hoặc thư mục FACE_DNN_DIR; tải từ DNN_URLS.
+    """
+    name = "dnn"
+    shared = True
+    min_face_size = 30
+
+    def __init__(self, model_dir=None, confidence=0.5, input_size=300, min_face_size=30):
+        model_dir = model_dir or self.model_dir()
+        proto, weights = os.path.join(model_dir, DNN_PROTO), os.path.join(model_dir, DNN_WEIGHTS)
+        if not (os.path.exists(proto) and os.path.exists(weights)):
+            raise FileNotFoundError(
+                f"Thiếu mô hình SSD ResNet-10 trong {model_dir}: tải {DNN_PROTO} và {DNN_WEIGHTS} từ\n  "
+                + "\n  ".join(DNN_URLS))
+        self._net = cv2.dnn.readNetFromCaffe(proto, weights)
+        self.confidence = confidence
+        self.input_size = input_size
+        self.min_face_size = min_face_size
+        self._lock = threading.Lock()  # cv2.dnn.Net không an toàn khi nhiều luồng gọi chung
+
+    @staticmethod
+    def model_dir():
+        return os.environ.get("FACE_DNN_DIR", DNN_MODEL_DIR)
+
+    @classmethod
+    def available(cls):
+        d = cls.model_dir()
+        return os.path.exists(os.path.join(d, DNN_PROTO)) and os.path.exists(os.path.join(d, DNN_WEIGHTS))
+
+    def find_faces(self, img, bgr=True):
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        h, w = img.shape[:2]
+        # Nơi gọi (detect_faces) đưa ảnh RGB -> swapRB để về BGR như lúc huấn luyện
+        blob = cv2.dnn.blobFromImage(img, 1.0, (self.input_size, self.input_size),
+                                     (104.0, 177.0, 123.0), swapRB=True, crop=False)
+        with self._lock:
+            self._net.setInput(blob)
+            out = self._net.forward()
+        det = out.reshape(-1, 7)
+        det = det[det[:, 2] >= self.confidence]
+        x0 = np.clip(det[:, 3] * w, 0, w)
+        y0 = np.clip(det[:, 4] * h, 0, h)
+        x1 = np.clip(det[:, 5] * w, 0, w)
+        y1 = np.clip(det[:, 6] * h, 0, h)
+        boxes = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1).round().astype(int)
+        keep = (boxes[:, 2] >= self.min_face_size) & (boxes[:, 3] >= self.min_face_size)
+        return [tuple(b) for b in boxes[keep]]
+
+
+class MtcnnFaceFinder:
+    """MTCNN riêng (gói mtcnn), không kéo theo bộ phân loại Keras như FER(mtcnn=True)."""
+    name = "mtcnn"
+    shared = True
+    min_face_size = 20      # mặc định của MTCNN
+
+    def __init__(self):
+        try:
+            from mtcnn import MTCNN
+            self._mtcnn = MTCNN()
+            self._fer = None
+        except ImportError:
+            # fer bản mới dùng facenet-pytorch: để FER tự lo (load thêm 1 bản Keras)
+            from fer.fer import FER
+            self._mtcnn = None
+            self._fer = FER(mtcnn=True)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def available(cls):
+        return any(importlib.util.find_spec(m) is not None for m in ("mtcnn", "fer"))
+
+    def find_faces(self, img, bgr=True):
+        # Giống FER: ảnh đưa thẳng vào MTCNN (nơi gọi đã đổi sang RGB)
+        with self._lock:
+            if self._fer is not None:
+                return self._fer.find_faces(img, bgr=bgr)
+            return [r["box"] for r in self._mtcnn.detect_faces(img)]
+
+
+FACE_FINDERS = {"haar": HaarFaceFinder, "dnn": DnnFaceFinder, "mtcnn": MtcnnFaceFinder}
+
+# -------------------------------------------------
+# Profile: tên -> các backend theo thứ tự ưu tiên
+# -------------------------------------------------
+PROFILES = {
+    "fast": ("haar",),
+    "balanced": ("dnn", "haar"),
+    "accurate": ("mtcnn", "dnn", "haar"),
+}
+# Camera cần nhanh, ảnh tĩnh cần chính xác (calibrate có thể đổi "live" nếu máy đủ mạnh)
+MODE_DEFAULTS = {"live": "fast", "still": "accurate"}
+CALIBRATION_PATH = os.path.join(".cache", "detector_profiles.json")
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_detector(name):
+    """Tên backend hoặc profile -> tên backend dùng được trên máy này."""
+    if name in FACE_FINDERS:
+        return name
+    if name not in PROFILES:
+        raise ValueError(f"Không có bộ tìm mặt '{name}' (chọn: {', '.join(detector_choices())})")
+    for backend in PROFILES[name]:
+        if FACE_FINDERS[backend].available():
+            return backend
+    raise RuntimeError(f"Profile '{name}' không có backend nào dùng được")
+
+
+def detector_choices():
+    return sorted(PROFILES) + sorted(FACE_FINDERS)
+
+
+@functools.lru_cache(maxsize=1)
+def load_calibration(path=CALIBRATION_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def default_detector(mode="live"):
+    """FACE_DETECTOR (nếu đặt) > khuyến nghị từ lần calibrate gần nhất > MODE_DEFAULTS."""
+    env = os.environ.get("FACE_DETECTOR")
+    if env:
+        return env
+    return load_calibration().get("recommended", {}).get(mode) or MODE_DEFAULTS[mode]
+
+
+# -------------------------------------------------
+# Calibrate: đo từng profile trên CPU máy này
+# -------------------------------------------------
+def _recall(reference, boxes, threshold=0.4):
+    """Tỉ lệ mặt của reference được boxes tìm thấy (IoU >= threshold)."""
+    from tracker import iou
+    if not reference:
+        return None
+    return sum(any(iou(r, b) >= threshold for b in boxes) for r in reference) / len(reference)
+
+
+def calibrate(images, detect_fn, profiles=None, repeat=3, live_budget_ms=60.0):
+    """
+    images: list (tên, ảnh BGR); detect_fn(img, finder) -> list box.
+    -> dict: thời gian load, p50/p95 mỗi ảnh, số mặt, độ phủ so với profile "accurate",
+       và profile khuyến nghị cho camera (chính xác nhất mà p50 <= live_budget_ms) / ảnh tĩnh.
+    """
+    profiles = list(profiles or PROFILES)
+    rows, found = {}, {}
+    for profile in profiles:
+        try:
+            backend = resolve_detector(profile)
+            t0 = time.perf_counter()
+            finder = FACE_FINDERS[backend]()
+            load_ms = (time.perf_counter() - t0) * 1000
+        except Exception as e:
+            rows[profile] = {"error": str(e)}
+            continue
+        detect_fn(images[0][1], finder)  # lần chạy đầu (khởi tạo bộ nhớ, JIT) không tính
+        times, found[profile] = [], []
+        for _, img in images:
+            for _ in range(repeat):
+                t = time.perf_counter()
+                boxes = detect_fn(img, finder)
+                times.append((time.perf_counter() - t) * 1000)
+            found[profile].append(boxes)
+        rows[profile] = {
+            "backend": backend,
+            "load_ms": round(load_ms, 1),
+            "p50_ms": round(float(np.percentile(times, 50)), 2),
+            "p95_ms": round(float(np.percentile(times, 95)), 2),
+            "faces": sum(len(b) for b in found[profile]),
+        }
+    reference = found.get("accurate")
+    for profile, boxes in found.items():
+        if reference is not None:
+            recalls = [r for r in (_recall(ref, b) for ref, b in zip(reference, boxes)) if r is not None]
+            rows[profile]["recall_vs_accurate"] = round(sum(recalls) / len(recalls), 3) if recalls else None
+
+    ok = [p for p in PROFILES if p in found]
+    fast_enough = [p for p in reversed(ok) if rows[p]["p50_ms"] <= live_budget_ms]
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "live_budget_ms": live_budget_ms,
+        "profiles": rows,
+        "recommended": {
+            "live": fast_enough[0] if fast_enough else MODE_DEFAULTS["live"],
+            "still": "accurate" if "accurate" in found else (ok[-1] if ok else MODE_DEFAULTS["still"]),
+        },
+    }
+
+
+def main(argv=None):
+    import argparse
+    from benchmark import load_fixtures, resize_to_width
+    from function import detect_faces
+
+    parser = argparse.ArgumentParser(description="Đo tốc độ / độ phủ từng profile tìm mặt trên máy này.")
+    parser.add_argument("--width", type=int, default=640, help="Chiều ngang ảnh khi đo (0 = giữ nguyên), ~ cỡ frame camera")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=60.0, help="ms tối đa cho 1 lần tìm mặt ở chế độ camera")
+    parser.add_argument("-o", "--output", default=CALIBRATION_PATH, help="File JSON kết quả ('-' = không lưu)")
+    args = parser.parse_args(argv)
+
+    images = [(n, resize_to_width(img, args.width)) for n, img in load_fixtures()]
+    if not images:
+        print("Không tìm thấy ảnh mẫu trong images/", file=sys.stderr)
+        return 1
+    result = calibrate(images, lambda img, finder: detect_faces(img, finder), repeat=args.repeat,
+                       live_budget_ms=args.budget)
+    for profile, r in result["profiles"].items():
+        if "error" in r:
+            print(f"{profile:9s} -- {r['error']}")
+            continue
+        recall = r.get("recall_vs_accurate")
+        print(f"{profile:9s} {r['backend']:6s} load {r['load_ms']:7.0f} ms | p50 {r['p50_ms']:7.1f} ms "
+              f"p95 {r['p95_ms']:7.1f} ms | {r['faces']:3d} mặt | phủ {'--' if recall is None else f'{recall:.0%}'}")
+    rec = result["recommended"]
+    print(f"Khuyến nghị: camera = {rec['live']}, ảnh tĩnh = {rec['still']}")
+    if args.output != "-":
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"Đã lưu {args.output} (FACE_DETECTOR=<tên> để bỏ qua khuyến nghị)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# ===============================================
+# engine.py
+# -----------------------------------------------
+# Bộ suy luận tập trung cho nhiều camera
+#   - Gom frame từ mọi CameraStreamer đang chạy
+#   - Mỗi tick: tìm mặt từng frame, phân loại tất cả
+#     khuôn mặt trong 1 batch duy nhất
+#   - Trả kết quả về đúng streamer đã gửi
+#   - Tùy chọn (opt-in): tạo 1 InferenceEngine() rồi truyền engine=... cho mọi CameraStreamer;
+#     không truyền thì mỗi streamer tự phân loại như trước
+# ===============================================
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from function import (
+    _get_classifier,
+    detect_faces,
+    results_from_scores,
+    summarize_results,
+)
+
+
+class InferenceEngine:
+    """
+    Một luồng duy nhất giữ mô hình FER, các streamer chỉ gửi frame và chờ kết quả.
+    - tick: thời gian tối đa (giây) chờ gom thêm frame trước khi chạy batch
+    - max_batch_frames: số frame tối đa trong 1 tick
+    - detector / classifier: bộ tìm mặt và bộ phân loại (mặc định theo function.py)
+    """
+
+    def __init__(self, detector=None, classifier=None, tick=0.02, max_batch_frames=8):
+        self._detector = detector
+        self._classifier = classifier
+        self.tick = tick
+        self.max_batch_frames = max_batch_frames
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop_event = None   # mỗi lần start() có cờ dừng riêng -> vòng cũ không bị "hồi sinh"
+        self._lock = threading.Lock()
+        self._users = 0
+        self.stats = {"ticks": 0, "frames": 0, "faces": 0, "last_batch_faces": 0, "last_tick_ms": 0.0}
+
+    # ---------- Vòng đời ----------
+    def start(self):
+        with self._lock:
+            if self._stop_event is not None:
+                return
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop_event,), daemon=True)
+            self._thread.start()
+
+    @property
+    def running(self):
+        return self._stop_event is not None
+
+    def stop(self, only_if_idle=False):
+        """only_if_idle: chỉ dừng nếu (ngay lúc giữ khóa) không còn streamer nào dùng engine."""
+        with self._lock:
+            if only_if_idle and self._users:
+                return
+            if self._stop_event is not None:
+                self._stop_event.set()
+            self._stop_event = None
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join(timeout=1.0)
+        # Không để streamer nào treo chờ kết quả (trừ khi engine vừa được start lại trong lúc join)
+        with self._lock:
+            if self._stop_event is not None:
+                return
+            while True:
+                try:
+                    _, fut, _ = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                fut.cancel()
+
+    def acquire(self):
+        """Streamer gọi khi bắt đầu; engine tự chạy khi có người dùng đầu tiên."""
+        with self._lock:
+            self._users += 1
+        self.start()
+
+    def release(self):
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            idle = self._users == 0
+        if idle:
+            # acquire() có thể chen vào giữa -> stop() kiểm tra lại số người dùng dưới khóa
+            self.stop(only_if_idle=True)
+
+    # ---------- API cho streamer ----------
+    def submit(self, frame_bgr, boxes=None):
+        """Future -> list {"box", "emotions"} giống FER.detect_emotions.
+        boxes: box đã có (từ tracker) -> bỏ qua bước tìm mặt."""
+        fut = Future()
+        self._queue.put((frame_bgr, fut, boxes))
+        return fut
+
+    def classify(self, frame_bgr, boxes=None, timeout=5.0):
+        return self.submit(frame_bgr, boxes).result(timeout=timeout)
+
+    def detect(self, frame_bgr, timeout=5.0, draw=True, boxes=None):
+        """Giống detect_emotion_from_frame nhưng chạy qua batch chung."""
+        results = self.classify(frame_bgr, boxes, timeout)
+        return summarize_results(frame_bgr, results, draw=draw)
+
+    # ---------- Luồng suy luận ----------
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.time() + self.tick
+        while len(batch) < self.max_batch_frames:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            batch = self._collect()
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch):
+        t0 = time.time()
+        classifier = self._classifier or _get_classifier()
+
+        jobs = []      # (fut, boxes)
+        crops = []
+        for frame, fut, boxes in batch:
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                if boxes is None:
+                    boxes = detect_faces(frame, self._detector)
+                faces, kept = classifier.prepare(frame, boxes)
+            except Exception as e:
+                fut.set_exception(e)
+                continue
+            jobs.append((fut, kept))
+            crops.append(faces)
+
+        if not jobs:
+            return
+
+        # Một lần gọi mô hình cho toàn bộ khuôn mặt của tick này
+        try:
+            scores = classifier.predict(np.concatenate(crops))
+        except Exception as e:
+            for fut, _ in jobs:
+                fut.set_exception(e)
+            return
+
+        start = 0
+        for fut, kept in jobs:
+            end = start + len(kept)
+            fut.set_result(results_from_scores(kept, scores[start:end]))
+            start = end
+
+        self.stats["ticks"] += 1
+        self.stats["frames"] += len(jobs)
+        self.stats["faces"] += len(scores)
+        self.stats["last_batch_faces"] = len(scores)
+        self.stats["last_tick_ms"] = (time.time() - t0) * 1000.0
+
+
+# -------------------------------------------------
+# Engine dùng chung cho cả tiến trình
+# -------------------------------------------------
+_ENGINE = None
+def get_engine():
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = InferenceEngine()
+    return _ENGINE
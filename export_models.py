@@ -0,0 +1,161 @@
+# ===============================================
+# export_models.py
+# -----------------------------------------------
+# Xuất mô hình cảm xúc sang ONNX / TFLite để chạy nhẹ trên CPU
+#   python export_models.py                 # mô hình mặc định của FER
+#   python export_models.py --model rafdb --int8
+#   - fer  : emotion_model.hdf5 đi kèm thư viện fer (64x64 xám)
+#   - rafdb: best_rafdb_model.keras / my_rgb_model.h5 từ train_emotion.py (96x96 RGB)
+#   - --int8: lượng tử hóa (ONNX: dynamic int8, TFLite: full int8 với dữ liệu hiệu chỉnh)
+# Mỗi file xuất ra kèm 1 file .json (nhãn, kích thước, số kênh, kiểu chuẩn hóa)
+# để function.py đọc lại khi chạy backend onnx/tflite.
+# ===============================================
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from detectors import HaarFaceFinder
+from function import EMOTION_LABELS, EmotionClassifier
+
+
+def fer_default_model_path():
+    import fer
+    return os.path.join(os.path.dirname(fer.__file__), "data", "emotion_model.hdf5")
+
+
+def rafdb_model_path():
+    for p in ("best_rafdb_model.keras", "my_rgb_model.h5"):
+        if os.path.exists(p):
+            return p
+    raise FileNotFoundError("Chưa có best_rafdb_model.keras / my_rgb_model.h5, hãy chạy train_emotion.py trước")
+
+
+def rafdb_labels():
+    # flow_from_directory đánh số lớp theo tên thư mục (A-Z); train_emotion.py lưu lại vào class_indices.json
+    if os.path.exists("class_indices.json"):
+        with open("class_indices.json", encoding="utf-8") as f:
+            indices = json.load(f)
+        return [name for name, _ in sorted(indices.items(), key=lambda kv: kv[1])]
+    return sorted(EMOTION_LABELS)
+
+
+def model_spec(name):
+    if name == "fer":
+        return fer_default_model_path(), {
+            "labels": list(EMOTION_LABELS), "input_size": [64, 64], "channels": 1, "normalization": "v2",
+        }
+    if name == "rafdb":
+        return rafdb_model_path(), {
+            "labels": rafdb_labels(), "input_size": [96, 96], "channels": 3, "normalization": "unit",
+        }
+    raise ValueError(name)
+
+
+def write_meta(model_path, meta):
+    with open(os.path.splitext(model_path)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+# -------------------------------------------------
+# Dữ liệu hiệu chỉnh cho int8: mặt cắt từ ảnh thật, tiền xử lý y hệt lúc chạy
+# -------------------------------------------------
+def representative_dataset(meta, calib_dir, limit=200):
+    prep = EmotionClassifier(meta["input_size"], meta["channels"], meta["normalization"], meta["labels"])
+    finder = HaarFaceFinder()
+    paths = sorted(
+        p for ext in ("jpg", "jpeg", "png")
+        for p in glob.glob(os.path.join(calib_dir, "**", f"*.{ext}"), recursive=True)
+    )
+
+    def gen():
+        count = 0
+        for p in paths:
+            img = cv2.imread(p)
+            if img is None:
+                continue
+            boxes = finder.find_faces(img)
+            # Ảnh dataset đã là ảnh mặt cắt sẵn -> dùng nguyên ảnh
+            if not len(boxes):
+                boxes = [(0, 0, img.shape[1], img.shape[0])]
+            batch, _ = prep.prepare(img, boxes)
+            if batch.ndim == 3:
+                batch = batch[..., np.newaxis]
+            for face in batch:
+                yield [face[np.newaxis]]
+                count += 1
+                if count >= limit:
+                    return
+    return gen
+
+
+def export_onnx(model, out_path, int8):
+    import tensorflow as tf
+    import tf2onnx
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=out_path)
+    outputs = [out_path]
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        q_path = out_path[:-len(".onnx")] + ".int8.onnx"
+        quantize_dynamic(out_path, q_path, weight_type=QuantType.QInt8)
+        outputs.append(q_path)
+    return outputs
+
+
+def export_tflite(model, out_path, int8, rep_data):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+    outputs = [out_path]
+    if int8:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = rep_data
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        q_path = out_path[:-len(".tflite")] + ".int8.tflite"
+        with open(q_path, "wb") as f:
+            f.write(converter.convert())
+        outputs.append(q_path)
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất mô hình cảm xúc sang ONNX/TFLite.")
+    parser.add_argument("--model", choices=("fer", "rafdb"), default="fer")
+    parser.add_argument("--formats", nargs="+", choices=("onnx", "tflite"), default=["onnx", "tflite"])
+    parser.add_argument("--int8", action="store_true", help="Xuất thêm bản lượng tử hóa int8")
+    parser.add_argument("--calib-dir", default=None,
+                        help="Thư mục ảnh hiệu chỉnh int8 (mặc định dataset/validation hoặc images)")
+    parser.add_argument("--out-dir", default=".")
+    args = parser.parse_args(argv)
+
+    import tensorflow as tf
+    src, meta = model_spec(args.model)
+    print(f"--> Đang load {src}")
+    model = tf.keras.models.load_model(src, compile=False)
+
+    calib_dir = args.calib_dir or ("dataset/validation" if os.path.isdir("dataset/validation") else "images")
+    stem = os.path.join(args.out_dir, "emotion_model" if args.model == "fer" else "rafdb_model")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    outputs = []
+    if "onnx" in args.formats:
+        outputs += export_onnx(model, stem + ".onnx", args.int8)
+    if "tflite" in args.formats:
+        outputs += export_tflite(model, stem + ".tflite", args.int8, representative_dataset(meta, calib_dir))
+
+    for path in outputs:
+        write_meta(path, meta)
+        print(f"--> {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
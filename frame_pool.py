@@ -0,0 +1,164 @@
+# ===============================================
+# frame_pool.py
+# -----------------------------------------------
+# Buffer frame cấp phát sẵn cho vòng lặp camera (không tạo mảng mới mỗi frame)
+#   - FramePool: vòng buffer, cap.read(image=buf) ghi thẳng vào buffer rảnh kế tiếp.
+#     Mỗi buffer có số "lease": frame còn nằm trong hàng đợi / đang được xử lý thì
+#     không bị ghi đè; nơi dùng xong gọi release(frame)
+#   - BufferCache: buffer đích dùng lại cho cvtColor / resize / bản sao để vẽ overlay;
+#     cvt_view cho ảnh đổi kích thước liên tục (vùng ROI quanh mặt): ghi vào 1 góc của buffer lớn
+#   - Mỗi đối tượng đếm số lần phải cấp phát (allocations); chạy ổn định thì con số
+#     này đứng yên -> total_allocations() để kiểm chứng
+# ===============================================
+
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+_INSTANCES = weakref.WeakSet()
+
+
+def total_allocations():
+    """Tổng số lần cấp phát buffer của mọi FramePool / BufferCache đang sống."""
+    return sum(o.allocations for o in list(_INSTANCES))
+
+
+class FramePool:
+    """
+    size: số buffer ban đầu (cấp phát lười ở lần đọc đầu tiên, theo kích thước camera)
+    max_size: consumer giữ frame lâu -> thêm buffer tới mức này; quá nữa thì đọc vào mảng mới
+    (không thuộc pool, release là no-op) thay vì ghi đè frame đang dùng.
+    """
+
+    def __init__(self, size=4, max_size=8):
+        self.max_size = max(size, max_size)
+        self._bufs = [None] * max(1, size)
+        self._leases = [0] * len(self._bufs)
+        self._index = {}          # id(buffer) -> vị trí trong pool
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reads = 0
+        _INSTANCES.add(self)
+
+    def _reserve(self, leases):
+        n = len(self._bufs)
+        for k in range(n):
+            i = (self._cursor + k) % n
+            if self._leases[i] == 0:
+                self._cursor = (i + 1) % n
+                self._leases[i] = leases
+                return i
+        if n < self.max_size:
+            self._bufs.append(None)
+            self._leases.append(leases)
+            return n
+        return None
+
+    def read(self, cap, leases=1):
+        """Đọc 1 frame vào buffer rảnh. leases: số nơi sẽ release frame này. -> frame hoặc None."""
+        with self._lock:
+            i = self._reserve(leases)
+        if i is None:
+            ok, frame = cap.read()
+            if ok:
+                self.allocations += 1
+            return frame if ok else None
+
+        buf = self._bufs[i]
+        ok, frame = cap.read(image=buf) if buf is not None else cap.read()
+        with self._lock:
+            if not ok or frame is None:
+                self._leases[i] = 0
+                return None
+            if frame is not buf:
+                # Lần đọc đầu hoặc camera đổi độ phân giải: OpenCV cấp phát mảng mới
+                if buf is not None:
+                    self._index.pop(id(buf), None)
+                self._bufs[i] = frame
+                self._index[id(frame)] = i
+                self.allocations += 1
+            self.reads += 1
+        return frame
+
+    def release(self, frame):
+        if frame is None:
+            return
+        with self._lock:
+            i = self._index.get(id(frame))
+            if i is not None and self._bufs[i] is frame and self._leases[i] > 0:
+                self._leases[i] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffers": len(self._bufs),
+                "in_use": sum(1 for n in self._leases if n),
+                "reads": self.reads,
+                "allocations": self.allocations,
+            }
+
+
+class BufferCache:
+    """
+    Buffer đích dùng lại theo (tên, shape, dtype của ảnh nguồn). Không an toàn đa luồng:
+    mỗi luồng (hoặc mỗi vòng lặp) giữ 1 BufferCache riêng.
+    Buffer trả về bị ghi đè ở lần gọi kế tiếp cùng tên -> ai cần giữ lâu thì tự copy.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._bufs = {}
+        self.allocations = 0
+        _INSTANCES.add(self)
+
+    def _store(self, key, out):
+        if len(self._bufs) >= self.max_entries and key not in self._bufs:
+            self._bufs.pop(next(iter(self._bufs)))
+        self._bufs[key] = out
+        self.allocations += 1
+
+    def cvt(self, name, src, code):
+        """cv2.cvtColor vào buffer dùng lại."""
+        key = (name, src.shape, src.dtype.str, code)
+        buf = self._bufs.get(key)
+        out = cv2.cvtColor(src, code, dst=buf)
+        if out is not buf:
+            self._store(key, out)
+        return out
+
+    def cvt_view(self, name, src, code, channels=3):
+        """
+        cv2.cvtColor vào góc trên-trái của 1 buffer dùng chung cho mọi kích thước nguồn:
+        chỉ cấp phát lại khi nguồn lớn hơn mọi lần trước (ROI quanh mặt đổi cỡ mỗi keyframe,
+        cvt() sẽ cấp phát 1 buffer cho mỗi cỡ mới). Trả về view h x w của buffer.
+        """
+        h, w = src.shape[:2]
+        key = (name, "view", src.dtype.str, channels)
+        buf = self._bufs.get(key)
+        if buf is None or buf.shape[0] < h or buf.shape[1] < w:
+            bh, bw = (0, 0) if buf is None else buf.shape[:2]
+            buf = np.empty((max(h, bh), max(w, bw), channels), dtype=src.dtype)
+            self._store(key, buf)
+        view = buf[:h, :w]
+        return cv2.cvtColor(src, code, dst=view)
+
+    def resize(self, name, src, size, interpolation=cv2.INTER_LINEAR):
+        key = (name, src.shape, src.dtype.str, tuple(size))
+        buf = self._bufs.get(key)
+        out = cv2.resize(src, tuple(size), dst=buf, interpolation=interpolation)
+        if out is not buf:
+            self._store(key, out)
+        return out
+
+    def copy(self, name, src):
+        """Bản sao của src trong buffer dùng lại (vd: nền để vẽ overlay mà không bẩn frame gốc)."""
+        key = (name, src.shape, src.dtype.str)
+        buf = self._bufs.get(key)
+        if buf is None:
+            buf = np.empty_like(src)
+            self._store(key, buf)
+        np.copyto(buf, src)
+        return buf
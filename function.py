@@ -7,24 +7,41 @@
 #   - Giữ smoothing + hysteresis
 # ===============================================
 
+import itertools
 import threading
 import time
 import base64
+import json
+import os
+import queue
 import cv2
-from fer.fer import FER
 import numpy as np
+import startup
+from tracker import FaceTracker
+from smoothing import TrackSmoothers
+from preview import FrameChangeDetector, boxes_stable
+from model_registry import REGISTRY
+from result_cache import default_cache
+from session_recorder import SessionRecorder, new_session_dir
+from scheduler import AdaptiveScheduler, box_motion
+from roi import RoiDetector, detect_multiscale
+from tiling import TiledDetector
+from frame_pool import FramePool, BufferCache, total_allocations
+from perf import PERF, RollingHistogram
+from metrics_exporter import METRICS, stream_families
+from detectors import FACE_FINDERS, default_detector, resolve_detector
+from labels import EMOTION_LABELS
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="keras")
 
 # -------------------------------------------------
 # Khởi tạo mô hình FER
+# Mọi mô hình đi qua REGISTRY (model_registry.py): mỗi tổ hợp backend/trọng số chỉ load 1 lần,
+# dùng chung cho CameraStreamer, study.py, batch_analyze.py...
+# (import fer ngay trong hàm: backend onnx/tflite không cần kéo TensorFlow vào)
 # -------------------------------------------------
-_DETECTOR = None
 def _get_detector():
-    global _DETECTOR
-    if _DETECTOR is None:
-        _DETECTOR = FER()
-    return _DETECTOR
+    return get_classifier("keras").detector
 
 # -------------------------------------------------
 # Quotes theo cảm xúc
@@ -49,18 +66,425 @@ def frame_to_base64_png(frame_bgr):
     return base64.b64encode(buf.tobytes()).decode("utf-8")
 
 # -------------------------------------------------
-# Nhận diện cảm xúc từ frame
+# Cắt mặt + phân loại theo batch (dùng chung cho nhiều frame)
+# Tiền xử lý giống FER: vuông hóa box, nới offset, resize, chuẩn hóa
 # -------------------------------------------------
-def detect_emotion_from_frame(frame_bgr, detector=None, debug=False):
-    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-    detector = detector or _get_detector()
-    try:
-        results = detector.detect_emotions(frame_rgb)
-    except Exception as e:
-        if debug:
-            print(f"[ERROR] detect_emotions failed: {e}")
-        return ("neutral", 0.0, [], {})
+FACE_OFFSETS = (10, 10)
+
+def _emotion_input_size(detector):
+    return getattr(detector, "_FER__emotion_target_size", (64, 64))
+
+def crop_face(image, box, offsets=FACE_OFFSETS):
+    x, y, w, h = box
+    if h > w:
+        x -= (h - w) // 2
+        w = h
+    elif w > h:
+        y -= (w - h) // 2
+        h = w
+    ox, oy = offsets
+    x1, y1, x2, y2 = x - ox, y - oy, x + w + ox, y + h + oy
+
+    H, W = image.shape[:2]
+    cx1, cy1, cx2, cy2 = max(0, x1), max(0, y1), min(W, x2), min(H, y2)
+    if cx2 <= cx1 or cy2 <= cy1:
+        return None
+    crop = image[cy1:cy2, cx1:cx2]
+    # Box tràn ra ngoài ảnh -> đệm viền đen như FER.pad
+    if (cx1, cy1, cx2, cy2) != (x1, y1, x2, y2):
+        crop = cv2.copyMakeBorder(crop, cy1 - y1, y2 - cy2, cx1 - x1, x2 - cx2,
+                                  cv2.BORDER_CONSTANT, value=0)
+    return crop
+
+class FaceBuffers:
+    """
+    Bộ đệm batch cấp phát sẵn, chỉ cấp phát lại khi số mặt vượt sức chứa (tăng theo lũy thừa 2).
+    stage: crop BGR đã resize (uint8), gray: bản xám, batch: đầu vào mô hình (float32).
+    """
+
+    def __init__(self, capacity=8):
+        self.capacity = max(1, capacity)
+        self._key = None
+        self.allocations = 0
+
+    def get(self, n, size, channels):
+        w, h = size
+        if self._key != (size, channels) or n > self.capacity:
+            while self.capacity < n:
+                self.capacity *= 2
+            self._key = (size, channels)
+            self.stage = np.empty((self.capacity, h, w, 3), dtype=np.uint8)
+            self.gray = np.empty((self.capacity, h, w), dtype=np.uint8) if channels == 1 else None
+            self.batch = np.empty((self.capacity, h, w) + ((3,) if channels == 3 else ()), dtype=np.float32)
+            self.allocations += 1
+        return self.stage[:n], None if self.gray is None else self.gray[:n], self.batch[:n]
+
+def prepare_faces(image, boxes, size=(64, 64), normalization="v2", channels=1, buffers=None, out=None):
+    """Trả về (batch float32 N x H x W [x C], các box hợp lệ).
+    image: ảnh BGR gốc - chỉ vùng mặt được đổi màu, không phải cả frame.
+    normalization: "v2" -> [-1, 1] (mô hình FER), "unit" -> [0, 1] (mô hình RAF-DB).
+    buffers: FaceBuffers dùng lại giữa các frame -> batch trả về chỉ dùng được tới lần gọi kế tiếp.
+    out: batch float32 có sẵn (ít nhất N phần tử)."""
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    w, h = size = tuple(size)
+    crops, kept = [], []
+    for box in boxes:
+        crop = crop_face(image, box)
+        if crop is None:
+            continue
+        crops.append(crop)
+        kept.append(tuple(int(v) for v in box))
+    n = len(crops)
+    shape = (n, h, w) + ((3,) if channels == 3 else ())
+    if not n:
+        return np.empty(shape, dtype=np.float32), kept
+
+    stage, gray, batch = (buffers or FaceBuffers(n)).get(n, size, channels)
+    # Resize thẳng vào ô của batch, không tạo mảng trung gian cho từng mặt
+    for i, crop in enumerate(crops):
+        slot = stage[i]
+        res = cv2.resize(crop, size, dst=slot)
+        if res is not slot:
+            slot[...] = res
+    # Các ô nằm liền nhau -> coi cả batch là 1 ảnh cao N*H, đổi màu trong 1 lần gọi
+    if channels == 1:
+        src = cv2.cvtColor(stage.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY, dst=gray.reshape(n * h, w))
+        src = src.reshape(n, h, w)
+    else:
+        src = stage[..., ::-1]  # BGR -> RGB ngay trong phép chuẩn hóa
+    if out is not None:
+        batch = out[:n]
+    # Chuẩn hóa vector hóa trên cả batch
+    if normalization == "v2":
+        np.multiply(src, np.float32(2.0 / 255.0), out=batch, casting="unsafe")
+        batch -= np.float32(1.0)
+    else:
+        np.multiply(src, np.float32(1.0 / 255.0), out=batch, casting="unsafe")
+    return batch, kept
+
+# -------------------------------------------------
+# Backend bộ phân loại cảm xúc
+#   keras : mô hình gốc của FER (TensorFlow)
+#   onnx  : ONNX Runtime trên CPU (file xuất bằng export_models.py)
+#   tflite: TFLite interpreter (tflite_runtime nếu có, không thì tf.lite)
+# Backend nào cũng trả xác suất theo đúng thứ tự EMOTION_LABELS.
+# Chọn backend: biến môi trường EMOTION_BACKEND / EMOTION_MODEL hoặc set_classifier().
+# -------------------------------------------------
+def _read_model_meta(path):
+    # File .json cạnh mô hình (export_models.py ghi ra): nhãn, kích thước, số kênh, chuẩn hóa
+    meta = {"labels": list(EMOTION_LABELS), "input_size": [64, 64], "channels": 1, "normalization": "v2"}
+    meta_path = os.path.splitext(path)[0] + ".json"
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta.update(json.load(f))
+    return meta
+
+class EmotionClassifier:
+    name = "base"
+
+    def __init__(self, input_size=(64, 64), channels=1, normalization="v2", labels=EMOTION_LABELS):
+        self.input_size = tuple(input_size)
+        self.channels = channels
+        self.normalization = normalization
+        # Cột đầu ra của mô hình -> thứ tự EMOTION_LABELS
+        labels = list(labels)
+        missing = [k for k in EMOTION_LABELS if k not in labels]
+        if missing:
+            raise ValueError(f"Nhãn của mô hình không khớp: cần {list(EMOTION_LABELS)}, mô hình có {labels} "
+                             f"(thiếu {missing}) - sửa 'labels' trong file metadata .json đi kèm mô hình")
+        self._order = [labels.index(k) for k in EMOTION_LABELS]
+        # Mô hình dùng chung giữa các luồng (TFLite interpreter không an toàn đa luồng)
+        self._lock = threading.Lock()
+        self._buffers = threading.local()
+
+    def prepare(self, frame_bgr, boxes, reuse=False):
+        """
+        Cắt + chuẩn hóa mọi mặt vào 1 batch. reuse=True: dùng bộ đệm riêng của luồng này
+        (không cấp phát mỗi frame), batch chỉ hợp lệ tới lần prepare(reuse=True) kế tiếp
+        -> chỉ dùng khi predict ngay sau đó.
+        """
+        buffers = None
+        if reuse:
+            buffers = getattr(self._buffers, "faces", None)
+            if buffers is None:
+                buffers = self._buffers.faces = FaceBuffers()
+        with PERF.span("preprocess"):
+            return prepare_faces(frame_bgr, boxes, self.input_size, self.normalization, self.channels, buffers)
+
+    def predict(self, batch):
+        """Một lần gọi mô hình cho cả batch -> mảng N x 7 xác suất."""
+        if len(batch) == 0:
+            return np.empty((0, len(EMOTION_LABELS)), dtype=np.float32)
+        if batch.ndim == 3:
+            batch = batch[..., np.newaxis]
+        with self._lock:
+            out = np.asarray(self._run(batch), dtype=np.float32)
+        return out[:, self._order]
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+    def weights_bytes(self):
+        return None
+
+    def model_id(self):
+        """Định danh mô hình + phiên bản trọng số (khóa cache kết quả)."""
+        return self.name
+
+class KerasClassifier(EmotionClassifier):
+    name = "keras"
+
+    def __init__(self, detector=None):
+        if detector is None:
+            from fer.fer import FER
+            detector = FER()
+        self.detector = detector
+        super().__init__(_emotion_input_size(self.detector))
+
+    def _run(self, batch):
+        return self.detector._classify_emotions(batch)
+
+    def weights_bytes(self):
+        # float32: 4 byte / tham số
+        return int(self.detector._FER__emotion_classifier.count_params()) * 4
+
+    def model_id(self):
+        import fer
+        return f"keras/fer-{getattr(fer, '__version__', '?')}"
+
+class OnnxClassifier(EmotionClassifier):
+    name = "onnx"
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+        meta = _read_model_meta(path)
+        super().__init__(meta["input_size"], meta["channels"], meta["normalization"], meta["labels"])
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self._input = self._session.get_inputs()[0].name
+        self.path = path
+
+    def weights_bytes(self):
+        return os.path.getsize(self.path)
+
+    def model_id(self):
+        st = os.stat(self.path)
+        return f"{self.name}/{os.path.basename(self.path)}/{st.st_size}-{int(st.st_mtime)}"
+
+    def _run(self, batch):
+        return self._session.run(None, {self._input: batch})[0]
+
+class TFLiteClassifier(EmotionClassifier):
+    name = "tflite"
+
+    def __init__(self, path, threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        meta = _read_model_meta(path)
+        super().__init__(meta["input_size"], meta["channels"], meta["normalization"], meta["labels"])
+        self._interp = Interpreter(model_path=path, num_threads=threads)
+        self._interp.allocate_tensors()
+        self._batch = None
+        self.path = path
+
+    def weights_bytes(self):
+        return os.path.getsize(self.path)
+
+    def model_id(self):
+        st = os.stat(self.path)
+        return f"{self.name}/{os.path.basename(self.path)}/{st.st_size}-{int(st.st_mtime)}"
+
+    def _run(self, batch):
+        interp = self._interp
+        # Chỉ cấp phát lại tensor khi số mặt trong batch thay đổi
+        if len(batch) != self._batch:
+            idx = interp.get_input_details()[0]["index"]
+            interp.resize_tensor_input(idx, list(batch.shape))
+            interp.allocate_tensors()
+            self._batch = len(batch)
+        inp = interp.get_input_details()[0]
+        out = interp.get_output_details()[0]
+
+        x = batch
+        if inp["dtype"] != np.float32:
+            # Mô hình int8 đầu vào nguyên: lượng tử hóa theo scale/zero_point của tensor
+            scale, zero = inp["quantization"]
+            x = np.clip(np.round(batch / scale + zero), np.iinfo(inp["dtype"]).min,
+                        np.iinfo(inp["dtype"]).max).astype(inp["dtype"])
+        interp.set_tensor(inp["index"], x)
+        interp.invoke()
+        y = interp.get_tensor(out["index"])
+        if out["dtype"] != np.float32:
+            scale, zero = out["quantization"]
+            y = (y.astype(np.float32) - zero) * scale
+        return y
+
+def load_classifier(backend="keras", path=None, threads=None):
+    if backend == "keras":
+        return KerasClassifier()
+    if backend == "onnx":
+        return OnnxClassifier(path or "emotion_model.onnx", threads)
+    if backend == "tflite":
+        return TFLiteClassifier(path or "emotion_model.tflite", threads)
+    raise ValueError(f"Backend không hỗ trợ: {backend}")
+
+def get_classifier(backend=None, path=None, threads=None):
+    """Bộ phân loại dùng chung theo (backend, file trọng số). threads chỉ có tác dụng ở lần load đầu."""
+    backend = backend or os.environ.get("EMOTION_BACKEND", "keras")
+    path = path or (os.environ.get("EMOTION_MODEL") if backend != "keras" else None)
+    return REGISTRY.get(("classifier", backend, path), lambda: load_classifier(backend, path, threads))
+
+_CLASSIFIER = None   # set_classifier() ghi đè lựa chọn mặc định
+def _get_classifier():
+    return _CLASSIFIER or get_classifier()
+
+def set_classifier(classifier):
+    global _CLASSIFIER
+    _CLASSIFIER = classifier
+
+# -------------------------------------------------
+# Tìm khuôn mặt
+# Haar / OpenCV DNN / MTCNN (detectors.py), chọn theo tên hoặc profile fast/balanced/accurate,
+# dùng chung qua REGISTRY
+# -------------------------------------------------
+def get_face_finder(name=None, mode="still"):
+    """
+    name: backend (haar/dnn/mtcnn) hoặc profile (fast/balanced/accurate).
+    None -> mặc định theo mode: "live" (camera) hoặc "still" (ảnh tĩnh), xem detectors.default_detector.
+    """
+    backend = resolve_detector(name or default_detector(mode))
+    return REGISTRY.get(("finder", backend), FACE_FINDERS[backend])
+
+def _get_face_finder(mode="live"):
+    return get_face_finder(None, mode)
+
+def _as_finder(finder, mode):
+    """finder có thể là đối tượng bộ tìm mặt, tên backend/profile, hoặc None (mặc định theo mode)."""
+    if finder is None or isinstance(finder, str):
+        return get_face_finder(finder, mode)
+    return finder
+
+# Backend dùng chung 1 bản (có khóa bên trong): thêm luồng chỉ xếp hàng chờ khóa,
+# 2 luồng đủ để đổi màu / cắt ô của ô này chạy song song với lúc mô hình chạy ô kia
+SHARED_TILE_WORKERS = 2
+
+def tile_finder_factory(name):
+    """
+    -> (finder_factory, workers) cho TiledDetector.
+    - Backend shared (dnn, mtcnn): mọi luồng dùng chung bộ tìm mặt trong REGISTRY, ít luồng
+      -> không load thêm bản MTCNN/FER nào ngoài bản REGISTRY đã đếm RAM
+    - Backend rẻ (haar): mỗi luồng 1 bản riêng, cũng tạo qua REGISTRY (key riêng từng luồng) để được tính RAM
+    """
+    name = resolve_detector(name)
+    cls = FACE_FINDERS[name]
+    if cls.shared:
+        return (lambda: get_face_finder(name)), SHARED_TILE_WORKERS
+    slots = itertools.count()
+    return (lambda: REGISTRY.get(("finder", name, "tile", next(slots)), cls)), None
+
+def get_tiled_detector(name="haar"):
+    """Tìm mặt theo ô song song (tiling.py), xem tile_finder_factory."""
+    name = resolve_detector(name)
+
+    def load():
+        factory, workers = tile_finder_factory(name)
+        return TiledDetector(factory, lambda finder, img: detect_faces(img, finder), workers=workers,
+                             min_face=FACE_FINDERS[name].min_face_size)
+
+    return REGISTRY.get(("tiled", name), load)
+
+def predict_emotions(batch, classifier=None):
+    """Một lần gọi mô hình cho cả batch -> mảng N x 7 xác suất."""
+    return (classifier or _get_classifier()).predict(batch)
+
+_BUFFERS = threading.local()
+
+def _thread_buffers():
+    """Buffer đổi màu dùng lại, mỗi luồng 1 bộ (tìm mặt theo ô chạy nhiều luồng cùng lúc)."""
+    cache = getattr(_BUFFERS, "cache", None)
+    if cache is None:
+        cache = _BUFFERS.cache = BufferCache()
+    return cache
+
+def detect_faces(frame_bgr, detector=None):
+    """Chỉ tìm khuôn mặt (không phân loại) -> list box (x, y, w, h). detector: bộ tìm mặt hoặc tên/profile."""
+    detector = _as_finder(detector, "live")
+    with PERF.span("color"):
+        # Khung đầy đủ và vùng ROI (đổi cỡ mỗi keyframe) dùng chung 1 buffer -> không cấp phát thêm
+        frame_rgb = _thread_buffers().cvt_view("rgb", frame_bgr, cv2.COLOR_BGR2RGB)
+    return [tuple(int(v) for v in b) for b in detector.find_faces(frame_rgb, bgr=True)]
+
+def classify_boxes(frame_bgr, boxes, classifier=None):
+    """Phân loại cảm xúc cho các box đã biết (bỏ qua bước tìm mặt)."""
+    classifier = classifier or _get_classifier()
+    faces, kept = classifier.prepare(frame_bgr, boxes, reuse=True)
+    return results_from_scores(kept, classifier.predict(faces))
+
+# Ảnh tĩnh lớn (4K, ảnh nhóm): tìm mặt trên bản thu nhỏ cạnh dài 1280, cắt mặt từ ảnh gốc
+STILL_MAX_SIDE = 1280
+
+def find_and_score(frame_bgr, finder=None, classifier=None, cache=None, max_side=None, tiled=False):
+    """
+    Tìm mặt + phân loại -> (boxes, scores N x 7).
+    cache (result_cache.ResultCache): ảnh đã phân tích với cùng mô hình thì trả kết quả ngay.
+    max_side: tìm mặt trên bản thu nhỏ (cạnh dài <= max_side); phân loại vẫn trên ảnh gốc.
+    tiled: ảnh đông người - tìm mặt theo ô chồng nhau ở độ phân giải gốc (bỏ qua max_side).
+    finder: bộ tìm mặt hoặc tên backend/profile; None -> profile cho ảnh tĩnh.
+    Mọi mặt tìm được phân loại chung 1 batch.
+    """
+    finder = _as_finder(finder, "still")
+    classifier = classifier or _get_classifier()
+    finder_name = getattr(finder, "name", type(finder).__name__)
+
+    def compute():
+        if tiled:
+            boxes = get_tiled_detector(finder_name if finder_name in FACE_FINDERS else "haar").detect(frame_bgr)
+        elif max_side:
+            boxes = detect_multiscale(frame_bgr, lambda img: detect_faces(img, finder), max_side)
+        else:
+            boxes = detect_faces(frame_bgr, finder)
+        faces, kept = classifier.prepare(frame_bgr, boxes, reuse=True)
+        return kept, classifier.predict(faces)
+
+    if cache is None:
+        return compute()
+    model = f"{finder_name}+{classifier.model_id()}"
+    if tiled:
+        model += "@tiled"
+    elif max_side:
+        model += f"@{max_side}"
+    return cache.get_or_compute(frame_bgr, model, compute)
+
+def results_from_scores(boxes, scores):
+    return [
+        {"box": box, "emotions": {EMOTION_LABELS[i]: round(float(s), 2) for i, s in enumerate(row)}}
+        for box, row in zip(boxes, scores)
+    ]
 
+# -------------------------------------------------
+# Chọn mặt nổi bật nhất + vẽ khung
+# -------------------------------------------------
+def draw_face_boxes(frame_bgr, boxes, best_box=None):
+    # Vẽ khung: xanh cho best, đỏ cho các mặt khác
+    for (x, y, w, h) in boxes:
+        color = (0, 255, 0) if (x, y, w, h) == best_box else (0, 0, 255)
+        cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), color, 2)
+
+def draw_tracked_faces(frame_bgr, faces, main_id=None):
+    # faces: list (track_id, box, emotion, score); mặt chính xanh, còn lại đỏ
+    for track_id, (x, y, w, h), name, score in faces:
+        color = (0, 255, 0) if track_id == main_id else (0, 0, 255)
+        cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(frame_bgr, f"#{track_id} {name}", (x, max(0, y - 8)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+def summarize_results(frame_bgr, results, debug=False, draw=True):
     if not results:
         return ("neutral", 0.0, [], {})
 
@@ -77,10 +501,8 @@ def detect_emotion_from_frame(frame_bgr, detector=None, debug=False):
 
     boxes = [tuple(r["box"]) for r in results]
 
-    # Vẽ khung: xanh cho best, đỏ cho các mặt khác
-    for r, (x, y, w, h) in zip(results, boxes):
-        color = (0, 255, 0) if r is best else (0, 0, 255)
-        cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), color, 2)
+    if draw:
+        draw_face_boxes(frame_bgr, boxes, tuple(best["box"]))
 
     if debug:
         bx, by, bw, bh = best["box"]
@@ -89,97 +511,382 @@ def detect_emotion_from_frame(frame_bgr, detector=None, debug=False):
     return (name, float(score), boxes, emotions)
 
 # -------------------------------------------------
-# CameraStreamer (giữ smoothing + hysteresis)
+# Nhận diện cảm xúc từ frame
+# -------------------------------------------------
+def detect_emotion_from_frame(frame_bgr, detector=None, debug=False, draw=True, boxes=None, max_side=None):
+    try:
+        # Box đã có sẵn (từ tracker) -> chỉ chạy bộ phân loại
+        # max_side: tìm mặt trên bản thu nhỏ rồi cắt mặt từ frame gốc (ảnh độ phân giải cao)
+        if boxes is None and max_side:
+            boxes = detect_multiscale(frame_bgr, lambda img: detect_faces(img, detector), max_side)
+        elif boxes is None:
+            boxes = detect_faces(frame_bgr, detector)
+        results = classify_boxes(frame_bgr, boxes)
+    except Exception as e:
+        if debug:
+            print(f"[ERROR] detect_emotions failed: {e}")
+        return ("neutral", 0.0, [], {})
+
+    return summarize_results(frame_bgr, results, debug=debug, draw=draw)
+
+# -------------------------------------------------
+# Hàng đợi size-1 "latest-wins": frame mới đẩy frame cũ ra
+# -------------------------------------------------
+class LatestSlot:
+    def __init__(self, on_drop=None):
+        self._q = queue.Queue(maxsize=1)
+        self.dropped = 0
+        # on_drop(item): gọi khi item cũ bị đẩy ra mà chưa ai lấy (vd trả buffer về FramePool)
+        self.on_drop = on_drop
+
+    def put(self, item):
+        while True:
+            try:
+                self._q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    old = self._q.get_nowait()
+                    self.dropped += 1
+                    if self.on_drop:
+                        self.on_drop(old)
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=0.1):
+        try:
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        try:
+            return self._q.get_nowait()
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._q.qsize()
+
+# -------------------------------------------------
+# CameraStreamer (smoothing + hysteresis theo từng track)
+#   capture ──(slot)──> inference ──(slot)──> delivery
+#        └──────────────(slot)──────────────────┘
+#   - capture: đọc camera liên tục, không bao giờ chờ AI
+#   - inference: luôn lấy frame mới nhất, giới hạn bởi fps;
+#     detector chỉ chạy mỗi keyframe_interval lần, còn lại FaceTracker dịch box
+#     cảnh đứng yên + box không đổi -> bỏ qua suy luận, giữ kết quả cũ
+#   - delivery: gọi callback theo tốc độ camera với kết quả mới nhất
 # -------------------------------------------------
 class CameraStreamer:
     def __init__(self, camera_index=0, callback=None, fps=10,
-                 smooth_window=5, hysteresis_delta=0.15):
+                 smooth_window=5, hysteresis_delta=0.15, engine=None,
+                 keyframe_interval=5, smooth_mode="window", smooth_alpha=0.3,
+                 max_static_skips=30, record_dir=None, scheduler=None, max_staleness=0.6,
+                 detector=None, hud=False, loop_video=True):
+        # camera_index: số thứ tự camera, hoặc đường dẫn file video (đọc theo đúng fps của file)
         self.camera_index = camera_index
+        self.loop_video = loop_video
+        self.ended = False   # file video đã hết (loop_video=False)
         self.callback = callback
+        # fps: tốc độ suy luận tối đa; callback chạy theo tốc độ camera.
+        # Tốc độ thật do scheduler quyết định theo thời gian suy luận, CPU rảnh và mức chuyển động.
         self.fps = fps
+        self.scheduler = scheduler or AdaptiveScheduler(
+            min_interval=1.0 / max(1, fps), max_staleness=max_staleness)
+        self._last_emotion = None
         self._running = False
-        self._thread = None
+        self._threads = []
         self.cap = None
         self.smooth_window = smooth_window
         self.hysteresis_delta = hysteresis_delta
-        self._emotion_history = []
-        self._last_emotion = ("neutral", 0.0)
+        # Mỗi khuôn mặt (track ID) có ring buffer làm mượt riêng
+        self._smoothers = TrackSmoothers(
+            EMOTION_LABELS, window=smooth_window, mode=smooth_mode,
+            alpha=smooth_alpha, hysteresis_delta=hysteresis_delta,
+        )
+        self._faces = []
+        # engine: InferenceEngine dùng chung (engine.py) khi chạy nhiều camera
+        self.engine = engine
+        # detector: tên backend/profile cho luồng này (None -> profile "live", thường là "fast")
+        self.detector = detector or default_detector("live")
+        # Keyframe: chỉ tìm lại quanh vị trí mặt cũ, thỉnh thoảng quét cả khung (roi.py)
+        self.tracker = FaceTracker(RoiDetector(self._detect), keyframe_interval=keyframe_interval)
+        # hud: vẽ bảng thời gian từng đoạn lên frame hiển thị (bật luôn PERF để có số liệu)
+        self.hud = hud
+        if hud:
+            PERF.enable()
+
+        # Frame đọc thẳng vào buffer cấp phát sẵn; mỗi frame có 2 lease (inference + delivery)
+        self.frame_pool = FramePool()
+        self._display_buffers = BufferCache()
+        self._infer_slot = LatestSlot(on_drop=self.frame_pool.release)
+        self._display_slot = LatestSlot(on_drop=self.frame_pool.release)
+        self._result_slot = LatestSlot()
+        self._counters = {"captured": 0, "inferred": 0, "delivered": 0, "skipped_static": 0, "faces": 0}
+        # Cho metrics_exporter (đọc lúc scrape): số lần mỗi cảm xúc + độ trễ suy luận (luôn bật, rất rẻ)
+        self._emotion_counts = dict.fromkeys(EMOTION_LABELS, 0)
+        self.latency = RollingHistogram()
+
+        # Bỏ qua suy luận khi cảnh tĩnh; tối đa max_static_skips lần liền để vẫn tự làm mới
+        self.max_static_skips = max_static_skips
+        self._infer_change = FrameChangeDetector()
+        self._last_boxes = None
+        self._boxes_stable = False
+        self._static_skips = 0
+
+        # record_dir: ghi dòng thời gian cảm xúc mỗi lần start() thành 1 phiên mới (session_recorder.py)
+        self.record_dir = record_dir
+        self.recorder = None
+
+    def _detect(self, img):
+        with PERF.span("detect"):
+            return detect_faces(img, self.detector)
 
     def start(self):
         if self._running:
             return
         self._running = True
-        self._thread = threading.Thread(target=self._run, daemon=True)
-        self._thread.start()
+        self.ended = False
+        if self.record_dir:
+            self.recorder = SessionRecorder(new_session_dir(self.record_dir), EMOTION_LABELS)
+        METRICS.register(("stream", id(self)), lambda: stream_families(self, str(self.camera_index)))
+        if self.engine:
+            self.engine.acquire()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._inference_loop, daemon=True),
+            threading.Thread(target=self._delivery_loop, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
 
     def stop(self):
+        was_running = self._running
         self._running = False
-        if self._thread:
-            self._thread.join(timeout=1.0)
+        for t in self._threads:
+            t.join(timeout=1.0)
+        if any(t.is_alive() for t in self._threads):
+            # Luồng suy luận có thể còn chờ engine.classify (tối đa 5 giây) -> chờ thêm trước khi đóng phiên
+            for t in self._threads:
+                t.join(timeout=5.0)
+        self._threads = []
+        METRICS.unregister(("stream", id(self)))
+        if self.engine and was_running:
+            self.engine.release()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
         if self.cap:
             try:
                 self.cap.release()
             except Exception:
                 pass
 
-    def _run(self):
+    def latest_faces(self):
+        """Kết quả mới nhất của từng mặt: list (track_id, box, emotion, score)."""
+        return list(self._faces)
+
+    def stats(self):
+        """Bộ đếm từng tầng: frame bị bỏ ở đâu, hàng đợi đang đầy bao nhiêu."""
+        return {
+            **self._counters,
+            "emotions": dict(self._emotion_counts),
+            "dropped_inference": self._infer_slot.dropped,
+            "dropped_display": self._display_slot.dropped,
+            "dropped_results": self._result_slot.dropped,
+            "queue_inference": self._infer_slot.qsize(),
+            "queue_display": self._display_slot.qsize(),
+            "scheduler": self.scheduler.decision(),
+            "detector": resolve_detector(self.detector),
+            "frame_pool": self.frame_pool.stats(),
+            "allocations": total_allocations(),
+            "perf": PERF.snapshot(),
+        }
+
+    @property
+    def is_file(self):
+        return isinstance(self.camera_index, str) and not self.camera_index.isdigit()
+
+    # ---------- Tầng 1: capture ----------
+    def _capture_loop(self):
         try:
-            self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
-            if not self.cap.isOpened():
+            if self.is_file:
                 self.cap = cv2.VideoCapture(self.camera_index)
-
-            time.sleep(0.2)
-            interval = 1.0 / max(1, self.fps)
-
+                if not self.cap.isOpened():
+                    self.ended = True
+                    return
+                # File video: phát theo fps gốc (không thì đọc hết file nhanh nhất có thể)
+                period = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 25.0)
+            else:
+                self.cap = cv2.VideoCapture(int(self.camera_index), cv2.CAP_DSHOW)
+                if not self.cap.isOpened():
+                    self.cap = cv2.VideoCapture(int(self.camera_index))
+                period = 0.0
+                time.sleep(0.2)
+
+            next_t = time.perf_counter()
             while self._running:
-                t0 = time.time()
-                ret, frame = self.cap.read()
-                if not ret:
+                if period:
+                    delay = next_t - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_t = max(next_t + period, time.perf_counter() - period)
+                with PERF.span("capture"):
+                    frame = self.frame_pool.read(self.cap, leases=2)
+                if frame is None:
+                    if self.is_file:
+                        if not self.loop_video:
+                            self.ended = True
+                            break
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)   # hết file -> phát lại từ đầu
+                        continue
                     time.sleep(0.1)
                     continue
-
-                try:
-                    emotion, score, boxes, emotions = detect_emotion_from_frame(frame)
-                except Exception:
-                    emotion, score, boxes, emotions = "neutral", 0.0, [], {}
-
-                # === Smoothing ===
-                self._emotion_history.append((emotion, score))
-                if len(self._emotion_history) > self.smooth_window:
-                    self._emotion_history.pop(0)
-
-                counts = {}
-                for e, s in self._emotion_history:
-                    counts[e] = counts.get(e, 0) + s
-                stable_emotion = max(counts.items(), key=lambda kv: kv[1])[0]
-                stable_score = counts[stable_emotion] / len(self._emotion_history)
-
-                # === Hysteresis ===
-                prev_name, prev_score = self._last_emotion
-                if stable_emotion != prev_name and stable_score < prev_score + self.hysteresis_delta:
-                    stable_emotion = prev_name
-                    stable_score = prev_score
-
-                emotion, score = stable_emotion, stable_score
-                self._last_emotion = (emotion, score)
-
-                if self.callback:
-                    self.callback(frame, emotion, score, boxes)
-
-                dt = time.time() - t0
-                to_sleep = interval - dt
-                if to_sleep > 0:
-                    time.sleep(to_sleep)
+                PERF.tick("capture")
+                self._counters["captured"] += 1
+                self._infer_slot.put(frame)
+                self._display_slot.put(frame)
         finally:
             if self.cap:
                 self.cap.release()
 
-def detect_emotion_from_image_path(path):
+    # ---------- Tầng 2: inference ----------
+    def _inference_loop(self):
+        while self._running:
+            frame = self._infer_slot.get()
+            if frame is None:
+                continue
+            try:
+                self._maybe_infer(frame)
+            finally:
+                self.frame_pool.release(frame)
+
+    def _maybe_infer(self, frame):
+        # Chưa tới lượt theo lịch thích nghi -> bỏ frame này, lấy frame mới nhất lần sau
+        if not self.scheduler.should_infer():
+            return
+        changed = self._infer_change.has_changed(frame)
+        if not changed and self._boxes_stable and self._static_skips < self.max_static_skips:
+            self._static_skips += 1
+            self._counters["skipped_static"] += 1
+            # Cảnh tĩnh vẫn báo cho scheduler (không chuyển động, cảm xúc không đổi) để khoảng cách giãn ra;
+            # dùng độ trễ gần nhất để không kéo ước lượng thời gian suy luận về 0
+            self.scheduler.report(self.scheduler.latency or 0.0, 0.0, False)
+        else:
+            t0 = time.perf_counter()
+            motion, emotion_changed = self._infer(frame)
+            latency = time.perf_counter() - t0
+            self.latency.add(latency * 1000.0)
+            PERF.record("infer", latency * 1000.0)
+            PERF.tick("infer")
+            self.scheduler.report(latency, motion, emotion_changed)
+
+    def _infer(self, frame):
+        try:
+            with PERF.span("track"):
+                tracks = self.tracker.update(frame)
+            tracked = [t.box for t in tracks]
+            with PERF.span("classify"):
+                if self.engine:
+                    results = self.engine.classify(frame, tracked)
+                else:
+                    results = classify_boxes(frame, tracked)
+        except Exception:
+            tracks, tracked, results = [], [], []
+
+        self._boxes_stable = boxes_stable(self._last_boxes, tracked)
+        motion = box_motion(self._last_boxes, tracked) if tracked else 0.0
+        self._last_boxes = tracked
+        self._static_skips = 0
+
+        with PERF.span("smooth"):
+            faces, raw = self._smooth(tracks, results)
+        recorder = self.recorder   # stop() có thể đặt về None giữa chừng
+        if recorder is not None and raw[0]:
+            recorder.record(*raw)
+        if faces:
+            # Nhãn chính = mặt lớn nhất trong khung hình
+            main = max(faces, key=lambda f: f[1][2] * f[1][3])
+            emotion, score = main[2], main[3]
+        else:
+            main, emotion, score = None, "neutral", 0.0
+
+        self._faces = faces
+        self._counters["inferred"] += 1
+        self._counters["faces"] += len(faces)
+        for f in faces:
+            self._emotion_counts[f[2]] += 1
+        self._result_slot.put((emotion, score, faces, main[0] if main else None))
+
+        emotion_changed = emotion != self._last_emotion
+        self._last_emotion = emotion
+        return motion, emotion_changed
+
+    def _smooth(self, tracks, results):
+        by_box = {tuple(r["box"]): r["emotions"] for r in results}
+        faces = []
+        ids, boxes, probs = [], [], []
+        for t in tracks:
+            emotions = by_box.get(t.box)
+            if emotions is None:
+                continue
+            p = [emotions.get(k, 0.0) for k in EMOTION_LABELS]
+            name, score = self._smoothers.update(t.track_id, p)
+            faces.append((t.track_id, t.box, name, score))
+            ids.append(t.track_id)
+            boxes.append(t.box)
+            probs.append(p)
+        self._smoothers.prune(t.track_id for t in tracks)
+        # Điểm thô (chưa làm mượt) để ghi phiên
+        return faces, (ids, boxes, probs)
+
+    # ---------- Tầng 3: delivery ----------
+    def _delivery_loop(self):
+        emotion, score, faces, main_id = "neutral", 0.0, [], None
+        while self._running:
+            frame = self._display_slot.get()
+            if frame is None:
+                continue
+            latest = self._result_slot.get_nowait()
+            if latest is not None:
+                emotion, score, faces, main_id = latest
+
+            boxes = [f[1] for f in faces]
+            shown = frame
+            with PERF.span("draw"):
+                if faces or self.hud:
+                    # Frame có thể vẫn đang được tầng inference đọc -> vẽ trên buffer hiển thị riêng
+                    shown = self._display_buffers.copy("display", frame)
+                    draw_tracked_faces(shown, faces, main_id)
+                if self.hud:
+                    PERF.gauge("q_infer", self._infer_slot.qsize())
+                    PERF.gauge("q_display", self._display_slot.qsize())
+                    PERF.gauge("dropped", self._infer_slot.dropped + self._display_slot.dropped)
+                    PERF.draw_hud(shown)
+
+            self._counters["delivered"] += 1
+            PERF.tick("display")
+            try:
+                # Frame chỉ hợp lệ trong lúc callback chạy (buffer được dùng lại) -> cần giữ thì copy
+                with PERF.span("deliver"):
+                    if self.callback:
+                        self.callback(shown, emotion, score, boxes)
+            finally:
+                self.frame_pool.release(frame)
+
+def detect_emotion_from_image_path(path, cache=True, max_side=STILL_MAX_SIDE, tiled=False):
     img = cv2.imread(path)
     if img is None:
         raise FileNotFoundError(f"Không mở được ảnh: {path}")
 
-    emotion, score, boxes, emotions = detect_emotion_from_frame(img)
+    # Mở lại ảnh đã phân tích -> lấy kết quả từ cache, không chạy lại mô hình
+    try:
+        results = results_from_scores(*find_and_score(img, cache=default_cache() if cache else None,
+                                                    max_side=max_side, tiled=tiled))
+    except Exception:
+        results = []
+    emotion, score, boxes, emotions = summarize_results(img, results, draw=False)
 
     if not boxes:
         return img, emotion, score, boxes, emotions
@@ -194,6 +901,36 @@ def detect_emotion_from_image_path(path):
 
     return img, emotion, score, boxes, emotions
 
+# -------------------------------------------------
+# Warm-up: load mô hình ở luồng nền ngay khi app mở
+# Màn hình chính hiện ngay, còn TensorFlow/FER được chuẩn bị song song
+# -------------------------------------------------
+def warm_up(verbose=True):
+    with startup.timed("import_fer"):
+        if os.environ.get("EMOTION_BACKEND", "keras") == "keras":
+            import fer.fer  # noqa: F401  (kéo theo TensorFlow - phần chậm nhất)
+    with startup.timed("model_load"):
+        _get_classifier()
+        _get_face_finder()
+    with startup.timed("first_inference"):
+        # Frame đen: tìm mặt 1 lần + ép bộ phân loại chạy 1 lần trên vùng giả
+        dummy = np.zeros((240, 320, 3), dtype=np.uint8)
+        detect_faces(dummy)
+        classify_boxes(dummy, [(100, 60, 120, 120)])
+    startup.mark("models_ready")
+    # MODEL_IDLE_UNLOAD=<giây>: gỡ mô hình không dùng quá lâu (load lại khi cần)
+    idle = float(os.environ.get("MODEL_IDLE_UNLOAD", "0"))
+    if idle > 0:
+        REGISTRY.start_idle_reaper(idle)
+    if verbose:
+        print(startup.report())
+        print(REGISTRY.format_report())
+
+def start_warm_up():
+    t = threading.Thread(target=warm_up, daemon=True)
+    t.start()
+    return t
+
 # -------------------------------------------------
 # Quote theo cảm xúc
 # -------------------------------------------------
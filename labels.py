@@ -0,0 +1,9 @@
+# ===============================================
+# labels.py
+# -----------------------------------------------
+# Nhãn cảm xúc dùng chung, không phụ thuộc thư viện nào
+# (analytics / analyze_session đọc phiên đã ghi mà không phải kéo theo cv2, mô hình...)
+# ===============================================
+
+# Thứ tự nhãn trùng với đầu ra của mô hình FER (0=angry ... 6=neutral)
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
@@ -4,16 +4,22 @@
 # File chính để khởi chạy ứng dụng Flet.
 # ===============================================
 
+import startup              # Import đầu tiên: bắt đầu bấm giờ khởi động.
 import flet as ft           # Thư viện Flet – dùng để tạo giao diện người dùng.
 from ui import AppUI        # Import lớp AppUI – phần giao diện chính của ứng dụng.
+from function import start_warm_up  # Load mô hình ở luồng nền (TensorFlow/FER chỉ được import tại đây).
+from metrics_exporter import start_from_env  # METRICS_PORT=9108 -> mở /metrics cho Prometheus.
 
 # -------------------------------------------------
 # Hàm main: điểm bắt đầu của ứng dụng Flet.
 # -------------------------------------------------
 def main(page: ft.Page):
+    start_warm_up()                    # Mô hình load song song trong lúc cửa sổ đang hiện.
+    start_from_env()                   # Không đặt METRICS_PORT thì bỏ qua.
     app = AppUI(page)                  # Tạo đối tượng giao diện (AppUI) và gắn vào trang Flet.
     page.on_close = lambda e: app.clean_up()  # Khi người dùng đóng app, gọi hàm dọn dẹp (giải phóng camera, v.v.).
     page.update()                      # Cập nhật lại giao diện (render nội dung mới).
+    startup.mark("ui_ready")           # Mốc: màn hình chính đã dùng được.
 
 # -------------------------------------------------
 # Cấu hình chạy ứng dụng Flet.
@@ -0,0 +1,235 @@
+# ===============================================
+# metrics_exporter.py
+# -----------------------------------------------
+# Endpoint HTTP /metrics (định dạng text của Prometheus) cho máy chạy không giao diện
+#   METRICS_PORT=9108 python main.py        # hoặc start_metrics_server(9108)
+#   curl http://127.0.0.1:9108/metrics
+#   - Số liệu được LẤY lúc có request (collector), vòng lặp camera không phải làm gì thêm
+#     ngoài tăng vài bộ đếm sẵn có
+#   - Nguồn: CameraStreamer (frame đọc/xử lý/bỏ, số mặt, cảm xúc, độ trễ suy luận, hàng đợi),
+#     batch_analyze (ảnh, mặt, lỗi, độ trễ), REGISTRY (thời gian load mô hình), PERF (nếu bật)
+#   - Server chạy trên luồng daemon riêng (ThreadingHTTPServer)
+# ===============================================
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_registry import REGISTRY
+from perf import PERF, RollingHistogram
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "emotion_"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value):
+    if value is None:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Family:
+    """1 metric (counter/gauge/histogram) + các mẫu theo nhãn."""
+
+    def __init__(self, name, kind, help_text):
+        self.name = PREFIX + name
+        self.kind = kind
+        self.help = help_text
+        self.samples = []   # (hậu tố tên, nhãn, giá trị)
+
+    def add(self, value, **labels):
+        self.samples.append(("", labels, value))
+        return self
+
+    def add_histogram(self, hist, **labels):
+        """hist: perf.RollingHistogram (ms) -> bucket theo giây, cộng dồn từ lúc bắt đầu."""
+        bounds, cumulative, total_ms, count = hist.cumulative()
+        for le, n in zip(bounds, cumulative):
+            self.samples.append(("_bucket", dict(labels, le=_fmt(le / 1000.0)), n))
+        self.samples.append(("_bucket", dict(labels, le="+Inf"), count))
+        self.samples.append(("_sum", labels, total_ms / 1000.0))
+        self.samples.append(("_count", labels, count))
+        return self
+
+
+class MetricsRegistry:
+    """collector(): -> list Family. Cùng tên metric từ nhiều nguồn được gộp chung 1 khối HELP/TYPE."""
+
+    def __init__(self):
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, key, collector):
+        with self._lock:
+            self._collectors[key] = collector
+
+    def unregister(self, key):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def collect(self):
+        with self._lock:
+            collectors = list(self._collectors.values())
+        merged = {}
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception:
+                continue  # 1 nguồn lỗi không làm hỏng cả trang metrics
+            for fam in families:
+                if fam.name in merged:
+                    merged[fam.name].samples.extend(fam.samples)
+                else:
+                    merged[fam.name] = fam
+        return list(merged.values())
+
+    def render(self):
+        lines = []
+        for fam in self.collect():
+            lines.append(f"# HELP {fam.name} {fam.help}")
+            lines.append(f"# TYPE {fam.name} {fam.kind}")
+            for suffix, labels, value in fam.samples:
+                lbl = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{fam.name}{suffix}{{{lbl}}} {_fmt(value)}" if lbl else f"{fam.name}{suffix} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+# -------------------------------------------------
+# Collector
+# -------------------------------------------------
+def stream_families(streamer, stream):
+    """Số liệu của 1 CameraStreamer (đọc lúc scrape)."""
+    st = streamer.stats()
+    frames = Family("frames_total", "counter", "Frame camera theo tầng xử lý")
+    for stage in ("captured", "inferred", "delivered", "skipped_static"):
+        frames.add(st[stage], stream=stream, stage=stage)
+    dropped = Family("frames_dropped_total", "counter", "Frame bị bỏ vì tầng sau chưa kịp lấy")
+    for stage in ("inference", "display", "results"):
+        dropped.add(st[f"dropped_{stage}"], stream=stream, stage=stage)
+    queue = Family("queue_depth", "gauge", "Số frame đang chờ trong hàng đợi")
+    queue.add(st["queue_inference"], stream=stream, queue="inference")
+    queue.add(st["queue_display"], stream=stream, queue="display")
+    faces = Family("faces_detected_total", "counter", "Số khuôn mặt đã phân loại")
+    faces.add(st["faces"], stream=stream)
+    emotions = Family("predictions_total", "counter", "Số lần mỗi cảm xúc là kết quả của 1 khuôn mặt")
+    for name, n in st["emotions"].items():
+        emotions.add(n, stream=stream, emotion=name)
+    latency = Family("inference_latency_seconds", "histogram", "Thời gian 1 lần suy luận (tìm/bám mặt + phân loại)")
+    latency.add_histogram(streamer.latency, stream=stream)
+    interval = Family("scheduler_interval_seconds", "gauge", "Khoảng cách hiện tại giữa 2 lần chạy AI")
+    interval.add(st["scheduler"]["interval_ms"] / 1000.0, stream=stream)
+    allocations = Family("buffer_allocations_total", "counter", "Số lần cấp phát buffer frame từ lúc chạy")
+    allocations.add(st["allocations"], stream=stream)
+    return [frames, dropped, queue, faces, emotions, latency, interval, allocations]
+
+
+def model_families():
+    load = Family("model_load_seconds", "gauge", "Thời gian load từng mô hình")
+    weights = Family("model_weights_bytes", "gauge", "Kích thước trọng số mô hình")
+    hits = Family("model_requests_total", "counter", "Số lần lấy mô hình từ REGISTRY")
+    for r in REGISTRY.report():
+        key = "/".join(str(k) for k in r["key"] if k is not None)
+        load.add(r["load_s"], model=key)
+        if r["weights_mb"] is not None:
+            weights.add(r["weights_mb"] * 2**20, model=key)
+        hits.add(r["hits"], model=key)
+    return [load, weights, hits]
+
+
+def perf_families():
+    if not PERF.enabled:
+        return []
+    stages = Family("stage_latency_seconds", "histogram", "Thời gian từng đoạn của vòng lặp camera (PERF)")
+    for name, hist in sorted(PERF.histograms().items()):
+        stages.add_histogram(hist, stage=name)
+    return [stages]
+
+
+class BatchMetrics:
+    """Bộ đếm cho batch_analyze (tiến trình chính cập nhật khi nhận kết quả từ worker)."""
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self.images = {"ok": 0, "error": 0}
+        self.faces = 0
+        self.emotions = dict.fromkeys(self.labels, 0)
+        self.latency = RollingHistogram()
+        self.load_s = {}
+        self._lock = threading.Lock()
+
+    def observe(self, record, latency_ms=None, worker=None, load_s=None):
+        with self._lock:
+            self.images["error" if "error" in record else "ok"] += 1
+            for face in record.get("faces") or []:
+                self.faces += 1
+                em = face["emotions"]
+                self.emotions[max(em, key=em.get)] += 1
+            if load_s is not None:
+                self.load_s[worker] = load_s
+        if latency_ms is not None:
+            self.latency.add(latency_ms)
+
+    def families(self):
+        with self._lock:
+            images = Family("batch_images_total", "counter", "Ảnh batch đã xử lý").add(self.images["ok"], status="ok")
+            images.add(self.images["error"], status="error")
+            faces = Family("faces_detected_total", "counter", "Số khuôn mặt đã phân loại").add(self.faces, stream="batch")
+            emotions = Family("predictions_total", "counter", "Số lần mỗi cảm xúc là kết quả của 1 khuôn mặt")
+            for name, n in self.emotions.items():
+                emotions.add(n, stream="batch", emotion=name)
+            # Tên riêng: model_load_seconds (REGISTRY) chỉ có nhãn model, đây là theo từng tiến trình worker
+            load = Family("batch_worker_load_seconds", "gauge", "Thời gian load mô hình của từng worker batch")
+            for worker, s in self.load_s.items():
+                load.add(s, worker=worker)
+        latency = Family("inference_latency_seconds", "histogram", "Thời gian 1 lần suy luận (tìm/bám mặt + phân loại)")
+        latency.add_histogram(self.latency, stream="batch")
+        return [images, faces, emotions, load, latency]
+
+
+METRICS.register("models", model_families)
+METRICS.register("perf", perf_families)
+
+
+# -------------------------------------------------
+# HTTP server
+# -------------------------------------------------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # không in mỗi lần Prometheus scrape
+
+
+def start_metrics_server(port=9108, host="127.0.0.1", registry=METRICS):
+    """Mở /metrics trên luồng daemon riêng. host="0.0.0.0" nếu Prometheus ở máy khác."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_from_env():
+    """METRICS_PORT (và METRICS_HOST) được đặt -> mở endpoint, không thì bỏ qua. -> server hoặc None."""
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    return start_metrics_server(int(port), os.environ.get("METRICS_HOST", "127.0.0.1"))
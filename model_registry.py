@@ -0,0 +1,137 @@
+# ===============================================
+# model_registry.py
+# -----------------------------------------------
+# Kho mô hình dùng chung cho cả tiến trình
+#   - Mỗi khóa (vd: ("classifier", "keras", None), ("finder", "mtcnn"))
+#     chỉ load đúng 1 lần, mọi luồng dùng chung
+#   - Ghi lại thời gian load, RAM tăng thêm khi load, dung lượng trọng số
+#   - Gỡ mô hình không dùng quá lâu (unload_idle / luồng dọn nền)
+# ===============================================
+
+import gc
+import os
+import sys
+import threading
+import time
+
+
+def _rss_bytes():
+    """RAM thường trú hiện tại của tiến trình (byte), None nếu không đo được."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Entry:
+    def __init__(self, model, load_s, rss_delta, weights_bytes):
+        self.model = model
+        self.load_s = load_s
+        self.rss_delta = rss_delta
+        self.weights_bytes = weights_bytes
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.hits = 0
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._reaper = None
+
+    def get(self, key, loader):
+        """Trả mô hình của key; lần đầu gọi loader() để tạo. Luồng khác đang load cùng key thì chờ."""
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            # Khóa riêng từng key: load MTCNN không chặn luồng đang lấy Haar
+            with key_lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._load(key, loader)
+        entry.last_used = time.monotonic()
+        entry.hits += 1
+        return entry.model
+
+    def _load(self, key, loader):
+        rss0 = _rss_bytes()
+        t0 = time.perf_counter()
+        model = loader()
+        load_s = time.perf_counter() - t0
+        rss1 = _rss_bytes()
+        weights = model.weights_bytes() if hasattr(model, "weights_bytes") else None
+        entry = _Entry(model, load_s, rss1 - rss0 if rss0 is not None and rss1 is not None else None, weights)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def loaded(self):
+        return list(self._entries)
+
+    def unload(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        del entry
+        gc.collect()
+        return True
+
+    def unload_idle(self, max_idle_s):
+        now = time.monotonic()
+        idle = [k for k, e in list(self._entries.items()) if now - e.last_used > max_idle_s]
+        for key in idle:
+            self.unload(key)
+        return idle
+
+    def start_idle_reaper(self, max_idle_s, interval_s=30.0):
+        """Luồng nền gỡ mô hình không được dùng quá max_idle_s giây."""
+        if self._reaper is not None:
+            return self._reaper
+
+        def loop():
+            while True:
+                time.sleep(interval_s)
+                for key in self.unload_idle(max_idle_s):
+                    # stderr: stdout có thể đang là dữ liệu kết quả (batch_analyze -o -)
+                    print(f"[INFO] Unloaded idle model {key}", file=sys.stderr)
+
+        self._reaper = threading.Thread(target=loop, daemon=True)
+        self._reaper.start()
+        return self._reaper
+
+    def report(self):
+        now = time.monotonic()
+        rows = []
+        for key, e in list(self._entries.items()):
+            rows.append({
+                "key": key,
+                "load_s": round(e.load_s, 3),
+                "rss_delta_mb": round(e.rss_delta / 2**20, 1) if e.rss_delta is not None else None,
+                "weights_mb": round(e.weights_bytes / 2**20, 2) if e.weights_bytes is not None else None,
+                "idle_s": round(now - e.last_used, 1),
+                "hits": e.hits,
+            })
+        return rows
+
+    def format_report(self):
+        lines = ["--- Models ---"]
+        for r in self.report():
+            rss = f"{r['rss_delta_mb']} MB" if r["rss_delta_mb"] is not None else "?"
+            weights = f"{r['weights_mb']} MB" if r["weights_mb"] is not None else "?"
+            lines.append(f"{r['key']}: load {r['load_s']}s, RAM +{rss}, weights {weights}, idle {r['idle_s']}s")
+        lines.append("--------------")
+        return "\n".join(lines)
+
+
+# Kho dùng chung cho cả tiến trình
+REGISTRY = ModelRegistry()
@@ -0,0 +1,214 @@
+# ===============================================
+# perf.py
+# -----------------------------------------------
+# Đo thời gian từng đoạn của vòng lặp camera (capture, đổi màu, tìm mặt, phân loại,
+# làm mượt, vẽ, mã hóa, page.update...)
+#   with PERF.span("detect"):
+#       boxes = detect_faces(frame)
+#   - Mỗi đoạn: histogram trượt (N mẫu gần nhất -> p50/p95/max) + bộ đếm bucket cộng dồn
+#   - tick(): đếm FPS; gauge(): giá trị tức thời (độ dài hàng đợi...)
+#   - snapshot(): toàn bộ số liệu dạng dict; draw_hud(): vẽ bảng số liệu lên frame
+#   - Tắt (mặc định, bật bằng PERF=1 hoặc PERF.enable()): span() trả 1 đối tượng rỗng dùng chung,
+#     gần như không tốn gì
+# ===============================================
+
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Biên bucket (ms) cho bộ đếm cộng dồn (metrics_exporter dùng làm histogram Prometheus)
+BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class RollingHistogram:
+    """N mẫu gần nhất (mảng cấp phát sẵn) + bucket/tổng/số lần cộng dồn từ lúc bắt đầu."""
+
+    def __init__(self, window=256, buckets=BUCKETS_MS):
+        self._samples = np.zeros(window, dtype=np.float64)
+        self._n = 0
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)   # phần tử cuối: > bucket lớn nhất
+        self.count = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        with self._lock:
+            self._samples[self._n % len(self._samples)] = ms
+            self._n += 1
+            self.bucket_counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.last_ms = ms
+
+    def cumulative(self):
+        """-> (biên bucket ms, số mẫu <= mỗi biên, tổng ms, số mẫu) - cộng dồn từ lúc bắt đầu."""
+        with self._lock:
+            counts, total, count = list(self.bucket_counts), self.total_ms, self.count
+        running, out = 0, []
+        for n in counts[:-1]:
+            running += n
+            out.append(running)
+        return self.buckets, out, total, count
+
+    def summary(self):
+        with self._lock:
+            window = self._samples[:min(self._n, len(self._samples))].copy()
+            last = self.last_ms
+        if not len(window):
+            return {"count": 0}
+        p50, p95 = np.percentile(window, (50, 95))
+        return {
+            "count": self.count,
+            "last_ms": round(last, 3),
+            "mean_ms": round(float(window.mean()), 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "max_ms": round(float(window.max()), 3),
+        }
+
+
+class _Span:
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.add((time.perf_counter() - self._t0) * 1000.0)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Perf:
+    """
+    Bộ đo dùng chung cho cả tiến trình (PERF). enabled=None -> đọc biến môi trường PERF.
+    window: số mẫu giữ lại cho mỗi đoạn (p50/p95 tính trên cửa sổ này).
+    """
+
+    def __init__(self, enabled=None, window=256):
+        if enabled is None:
+            enabled = os.environ.get("PERF", "0").lower() not in ("0", "", "off", "false")
+        self.enabled = enabled
+        self.window = window
+        self._hists = {}
+        self._ticks = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def enable(self, on=True):
+        self.enabled = on
+
+    def reset(self):
+        with self._lock:
+            self._hists, self._ticks, self._gauges = {}, {}, {}
+
+    def _hist(self, name):
+        hist = self._hists.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._hists.setdefault(name, RollingHistogram(self.window))
+        return hist
+
+    # ---------- Ghi số liệu ----------
+    def span(self, name):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self._hist(name))
+
+    def record(self, name, ms):
+        if self.enabled:
+            self._hist(name).add(ms)
+
+    def tick(self, name="frame"):
+        """Đánh dấu 1 sự kiện (frame hiển thị, lần suy luận...) để tính FPS trên ~2 giây gần nhất."""
+        if not self.enabled:
+            return
+        ticks = self._ticks.get(name)
+        if ticks is None:
+            with self._lock:
+                ticks = self._ticks.setdefault(name, deque(maxlen=120))
+        ticks.append(time.perf_counter())
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self._gauges[name] = value
+
+    # ---------- Đọc số liệu ----------
+    def fps(self, name="frame", horizon=2.0):
+        ticks = self._ticks.get(name)
+        if not ticks:
+            return 0.0
+        now = time.perf_counter()
+        recent = [t for t in list(ticks) if now - t <= horizon]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(1e-6, recent[-1] - recent[0])
+
+    def histograms(self):
+        """name -> RollingHistogram (bucket cộng dồn cho exporter)."""
+        with self._lock:
+            return dict(self._hists)
+
+    def snapshot(self):
+        with self._lock:
+            names, ticks, gauges = list(self._hists), list(self._ticks), dict(self._gauges)
+        return {
+            "enabled": self.enabled,
+            "fps": {n: round(self.fps(n), 1) for n in ticks},
+            "stages": {n: self._hists[n].summary() for n in names},
+            "gauges": gauges,
+        }
+
+    def hud_lines(self):
+        snap = self.snapshot()
+        lines = [" ".join(f"{n} {v:.1f}fps" for n, v in snap["fps"].items()) or "fps --"]
+        for name, s in snap["stages"].items():
+            if s.get("count"):
+                lines.append(f"{name:10s} {s['p50_ms']:6.1f} / {s['p95_ms']:6.1f} ms")
+        if snap["gauges"]:
+            lines.append(" ".join(f"{k}={v}" for k, v in snap["gauges"].items()))
+        return lines
+
+    def draw_hud(self, frame, origin=(8, 8), scale=0.45):
+        """Vẽ bảng số liệu (FPS, p50/p95 từng đoạn, hàng đợi) lên góc trái frame (vẽ đè tại chỗ)."""
+        lines = self.hud_lines()
+        sizes = [cv2.getTextSize(s, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)[0] for s in lines]
+        line_h = max(th for _, th in sizes) + 6
+        x, y = origin
+        width = max(tw for tw, _ in sizes) + 12
+        height = line_h * len(lines) + 8
+        h, w = frame.shape[:2]
+        x1, y1 = min(w, x + width), min(h, y + height)
+        # Nền tối mờ cho dễ đọc
+        roi = frame[y:y1, x:x1]
+        roi //= 3
+        for i, text in enumerate(lines):
+            cv2.putText(frame, text, (x + 6, y + line_h * (i + 1)), cv2.FONT_HERSHEY_SIMPLEX,
+                        scale, (0, 255, 255), 1, cv2.LINE_AA)
+        return frame
+
+
+PERF = Perf()
@@ -0,0 +1,175 @@
+# ===============================================
+# preview.py
+# -----------------------------------------------
+# Mã hóa frame xem trước để đẩy lên giao diện Flet
+#   - JPEG chỉnh được chất lượng (nhanh hơn PNG nhiều lần, nhỏ hơn nhiều)
+#   - Dùng TurboJPEG nếu có cài (pip install PyTurboJPEG)
+#   - PNG (mức nén chỉnh được) / BMP (gần như buffer thô, không nén)
+#   - Thu nhỏ trước khi mã hóa, tái sử dụng buffer resize
+#   - Đo thời gian mã hóa + kích thước mỗi frame
+# ===============================================
+
+import base64
+import threading
+import time
+
+import cv2
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+except ImportError:  # PyTurboJPEG là tùy chọn
+    TurboJPEG = None
+
+FORMATS = ("jpeg", "png", "webp", "bmp")
+
+
+class PreviewEncoder:
+    """
+    fmt: "jpeg" | "png" | "webp" | "bmp"
+    quality: 0-100 cho jpeg/webp; với png là mức nén 0-9 (0 = nhanh nhất)
+    max_width: thu nhỏ frame về chiều ngang này trước khi mã hóa (None = giữ nguyên)
+    backend: "auto" (turbo nếu có) | "turbo" | "opencv"
+    """
+
+    def __init__(self, fmt="jpeg", quality=80, max_width=None, backend="auto"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Định dạng preview không hỗ trợ: {fmt}")
+        self.fmt = fmt
+        self.quality = quality
+        self.max_width = max_width
+
+        self._turbo = None
+        if fmt == "jpeg" and backend in ("auto", "turbo"):
+            if TurboJPEG is not None:
+                try:
+                    self._turbo = TurboJPEG()
+                except Exception:
+                    # Có gói Python nhưng thiếu thư viện libturbojpeg
+                    self._turbo = None
+            if self._turbo is None and backend == "turbo":
+                raise RuntimeError("Không tìm thấy libturbojpeg (pip install PyTurboJPEG)")
+        self.backend = "turbo" if self._turbo else "opencv"
+
+        self._params = {
+            "jpeg": [cv2.IMWRITE_JPEG_QUALITY, int(quality)],
+            "webp": [cv2.IMWRITE_WEBP_QUALITY, int(quality)],
+            "png": [cv2.IMWRITE_PNG_COMPRESSION, min(9, int(quality))],
+            "bmp": [],
+        }[fmt]
+        self._ext = "." + ("jpg" if fmt == "jpeg" else fmt)
+        self._resized = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def mime(self):
+        return f"image/{self.fmt}"
+
+    def reset_stats(self):
+        self._frames = 0
+        self._total_ms = 0.0
+        self._total_bytes = 0
+        self.last_ms = 0.0
+        self.last_bytes = 0
+
+    def stats(self):
+        n = max(1, self._frames)
+        return {
+            "format": self.fmt,
+            "backend": self.backend,
+            "frames": self._frames,
+            "last_ms": round(self.last_ms, 3),
+            "last_bytes": self.last_bytes,
+            "avg_ms": round(self._total_ms / n, 3),
+            "avg_bytes": int(self._total_bytes / n),
+        }
+
+    def _downscale(self, frame):
+        h, w = frame.shape[:2]
+        if not self.max_width or w <= self.max_width:
+            return frame
+        size = (self.max_width, max(1, round(h * self.max_width / w)))
+        # Tái sử dụng buffer đích khi kích thước không đổi (luồng video)
+        if self._resized is not None and self._resized.shape[:2] != (size[1], size[0]):
+            self._resized = None
+        self._resized = cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        return self._resized
+
+    def encode(self, frame_bgr):
+        """Frame BGR -> bytes đã mã hóa."""
+        with self._lock:
+            t0 = time.perf_counter()
+            img = self._downscale(frame_bgr)
+            if self._turbo is not None and img.ndim == 3:
+                data = self._turbo.encode(img, quality=int(self.quality), pixel_format=TJPF_BGR)
+            else:
+                ok, buf = cv2.imencode(self._ext, img, self._params)
+                if not ok:
+                    raise ValueError(f"Failed to encode frame to {self.fmt.upper()}")
+                data = buf.tobytes()
+            self.last_ms = (time.perf_counter() - t0) * 1000.0
+            self.last_bytes = len(data)
+            self._frames += 1
+            self._total_ms += self.last_ms
+            self._total_bytes += self.last_bytes
+            return data
+
+    def to_base64(self, frame_bgr):
+        return base64.b64encode(self.encode(frame_bgr)).decode("ascii")
+
+
+# -------------------------------------------------
+# Phát hiện frame không đổi -> khỏi mã hóa / đẩy UI / suy luận lại
+# -------------------------------------------------
+class FrameChangeDetector:
+    """
+    Thu nhỏ frame thành ảnh xám size (mặc định 32x24, lấy trung bình vùng nên lọc bớt nhiễu camera)
+    rồi so độ lệch tuyệt đối trung bình với frame tham chiếu (frame gần nhất đã được chấp nhận).
+    threshold: ngưỡng trên thang 0-255; dưới ngưỡng coi như cảnh đứng yên.
+    """
+
+    def __init__(self, threshold=3.0, size=(32, 24)):
+        self.threshold = threshold
+        self.size = size
+        self._gray = None
+        self._small = None
+        self._ref = None
+        self.changed = 0
+        self.skipped = 0
+
+    def reset(self):
+        self._ref = None
+
+    def _signature(self, frame):
+        if frame.ndim == 3:
+            self._gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            src = self._gray
+        else:
+            src = frame
+        self._small = cv2.resize(src, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        return self._small
+
+    def difference(self, frame):
+        small = self._signature(frame)
+        if self._ref is None:
+            return float("inf")
+        return float(cv2.absdiff(small, self._ref).mean())
+
+    def has_changed(self, frame):
+        """True nếu frame khác tham chiếu (và lấy frame này làm tham chiếu mới)."""
+        if self.difference(frame) < self.threshold:
+            self.skipped += 1
+            return False
+        if self._ref is None:
+            self._ref = self._small.copy()
+        else:
+            self._ref[...] = self._small
+        self.changed += 1
+        return True
+
+
+def boxes_stable(prev, cur, tol=2):
+    """Hai danh sách box coi như trùng nhau nếu mỗi cạnh lệch không quá tol pixel."""
+    if prev is None or len(prev) != len(cur):
+        return False
+    return all(abs(a - b) <= tol for p, c in zip(prev, cur) for a, b in zip(p, c))
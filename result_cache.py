@@ -0,0 +1,147 @@
+# ===============================================
+# result_cache.py
+# -----------------------------------------------
+# Cache kết quả nhận diện ảnh tĩnh (SQLite, lưu trên đĩa)
+#   - Khóa = hash nội dung ảnh ĐÃ GIẢI MÃ (đổi tên / nén lại file cũng trúng)
+#            + định danh mô hình (bộ tìm mặt, bộ phân loại, phiên bản trọng số)
+#   - Giá trị = box + xác suất 7 cảm xúc (độ chính xác đầy đủ)
+#   - LRU: quá số dòng / dung lượng thì xóa các dòng lâu không dùng nhất
+# Mở lại ảnh cũ hoặc chạy batch lại thư mục gần như không đổi -> trả kết quả ngay.
+# ===============================================
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(".cache", "results.sqlite")
+
+
+def image_hash(img):
+    """Hash nội dung ảnh (kèm kích thước + kiểu dữ liệu để 2 ảnh cùng byte khác shape không trùng)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.shape}:{img.dtype}".encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    max_entries / max_bytes: giới hạn số dòng và tổng dung lượng payload.
+    Dùng chung được giữa nhiều luồng; nhiều tiến trình (batch) mỗi bên mở 1 ResultCache cùng file.
+    """
+
+    EVICT_EVERY = 32   # kiểm tra giới hạn sau mỗi N lần ghi
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=20000, max_bytes=64 * 2**20):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " image TEXT NOT NULL, model TEXT NOT NULL, payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (image, model))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_lru ON results (last_used)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image, model):
+        """(boxes, scores) đã lưu hoặc None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM results WHERE image = ? AND model = ?", (image, model)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE results SET last_used = ? WHERE image = ? AND model = ?", (time.time(), image, model)
+            )
+            self._db.commit()
+            self.hits += 1
+        data = json.loads(row[0])
+        scores = np.asarray(data["scores"], dtype=np.float32).reshape(-1, data["n_classes"])
+        return [tuple(b) for b in data["boxes"]], scores
+
+    def put(self, image, model, boxes, scores):
+        scores = np.asarray(scores, dtype=np.float32)
+        payload = json.dumps({
+            "boxes": [[int(v) for v in b] for b in boxes],
+            "scores": np.round(scores, 6).tolist(),
+            "n_classes": scores.shape[1] if scores.ndim == 2 else 0,
+        })
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (image, model, payload, len(payload), time.time()),
+            )
+            self._db.commit()
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def get_or_compute(self, img, model, compute):
+        """compute() -> (boxes, scores). Trúng cache thì không gọi compute."""
+        key = image_hash(img)
+        cached = self.get(key, model)
+        if cached is not None:
+            return cached
+        boxes, scores = compute()
+        self.put(key, model, boxes, scores)
+        return boxes, scores
+
+    def _evict(self):
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            # Xóa 10% dòng cũ nhất mỗi lượt
+            n = max(1, count - self.max_entries, count // 10)
+            self._db.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used LIMIT ?)", (n,)
+            )
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        self._db.commit()
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+def default_cache():
+    """Cache dùng chung của ứng dụng. RESULT_CACHE=<đường dẫn> đổi file, RESULT_CACHE=off để tắt."""
+    global _DEFAULT
+    path = os.environ.get("RESULT_CACHE", DEFAULT_PATH)
+    if path.lower() in ("", "0", "off"):
+        return None
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ResultCache(path)
+    return _DEFAULT
@@ -0,0 +1,142 @@
+# ===============================================
+# roi.py
+# -----------------------------------------------
+# Tìm mặt nhanh trên ảnh lớn
+#   - Đa tỉ lệ: tìm mặt trên bản thu nhỏ (cạnh dài <= max_side), nhân box ngược về
+#     ảnh gốc; bước phân loại vẫn cắt mặt từ ảnh GỐC độ phân giải đầy đủ
+#   - ROI (video): chỉ tìm lại trong vùng quanh vị trí mặt cũ, thỉnh thoảng
+#     quét cả khung để bắt mặt mới xuất hiện
+# detect_fn(frame_bgr) -> list box (x, y, w, h) là bộ tìm mặt bất kỳ (Haar, MTCNN...).
+# ===============================================
+
+import cv2
+
+from tracker import iou
+
+
+def downscale(frame, max_side):
+    """-> (ảnh thu nhỏ, tỉ lệ gốc/nhỏ). Ảnh đã đủ nhỏ thì trả nguyên."""
+    h, w = frame.shape[:2]
+    side = max(h, w)
+    if not max_side or side <= max_side:
+        return frame, 1.0
+    s = max_side / side
+    small = cv2.resize(frame, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_AREA)
+    return small, side / max_side
+
+
+def scale_boxes(boxes, factor, dx=0, dy=0, bounds=None):
+    """Nhân box theo factor rồi dịch (dx, dy); bounds=(w, h) để kẹp trong ảnh."""
+    out = []
+    for x, y, w, h in boxes:
+        x, y = round(x * factor) + dx, round(y * factor) + dy
+        w, h = round(w * factor), round(h * factor)
+        if bounds is not None:
+            # Kẹp cả 2 góc: box thò ra mép trái/trên bị cắt bớt chứ không bị đẩy lệch sang phải/xuống
+            x2, y2 = min(x + w, bounds[0]), min(y + h, bounds[1])
+            x, y = max(0, x), max(0, y)
+            w, h = x2 - x, y2 - y
+        if w > 0 and h > 0:
+            out.append((int(x), int(y), int(w), int(h)))
+    return out
+
+
+def containment(small, big):
+    """Tỉ lệ diện tích của small nằm trong big."""
+    sx, sy, sw, sh = small
+    bx, by, bw, bh = big
+    ix = max(0, min(sx + sw, bx + bw) - max(sx, bx))
+    iy = max(0, min(sy + sh, by + bh) - max(sy, by))
+    return ix * iy / (sw * sh) if sw * sh > 0 else 0.0
+
+
+def nms(boxes, iou_threshold=0.4, contain_threshold=None):
+    """
+    Bỏ box trùng (IoU > ngưỡng), ưu tiên giữ box lớn hơn.
+    contain_threshold: bỏ luôn box nằm gần trọn trong box đã giữ (mảnh mặt bị cắt ở mép ô).
+    """
+    kept = []
+    for b in sorted(boxes, key=lambda b: b[2] * b[3], reverse=True):
+        if all(iou(b, k) <= iou_threshold for k in kept) and (
+                contain_threshold is None or all(containment(b, k) <= contain_threshold for k in kept)):
+            kept.append(b)
+    return kept
+
+
+def detect_multiscale(frame, detect_fn, max_side=1280):
+    """Tìm mặt trên bản thu nhỏ, trả box theo tọa độ ảnh gốc."""
+    small, factor = downscale(frame, max_side)
+    boxes = detect_fn(small)
+    if factor == 1.0:
+        return [tuple(int(v) for v in b) for b in boxes]
+    return scale_boxes(boxes, factor, bounds=(frame.shape[1], frame.shape[0]))
+
+
+def expand_box(box, margin, bounds):
+    """Nới box ra mỗi phía margin * cạnh, kẹp trong ảnh -> (x0, y0, x1, y1)."""
+    x, y, w, h = box
+    mx, my = int(w * margin), int(h * margin)
+    return max(0, x - mx), max(0, y - my), min(bounds[0], x + w + mx), min(bounds[1], y + h + my)
+
+
+def merge_rois(rois):
+    """Gộp các vùng chồng lên nhau (để 2 mặt sát nhau chỉ tốn 1 lần tìm)."""
+    rois = sorted(rois)
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for r in rois:
+            for i, m in enumerate(out):
+                if r[0] < m[2] and m[0] < r[2] and r[1] < m[3] and m[1] < r[3]:
+                    out[i] = (min(r[0], m[0]), min(r[1], m[1]), max(r[2], m[2]), max(r[3], m[3]))
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        rois = out
+    return rois
+
+
+def detect_in_rois(frame, detect_fn, prev_boxes, margin=0.6, max_side=640):
+    """Chỉ tìm mặt trong vùng quanh các box cũ."""
+    h, w = frame.shape[:2]
+    found = []
+    for x0, y0, x1, y1 in merge_rois([expand_box(b, margin, (w, h)) for b in prev_boxes]):
+        crop = frame[y0:y1, x0:x1]
+        small, factor = downscale(crop, max_side)
+        found.extend(scale_boxes(detect_fn(small), factor, x0, y0, bounds=(w, h)))
+    return nms(found)
+
+
+class RoiDetector:
+    """
+    Bộ tìm mặt cho video, dùng làm detect_fn của FaceTracker:
+    - Có mặt ở lần trước -> chỉ tìm trong ROI quanh các mặt đó
+    - Mỗi full_every lần (hoặc ROI không thấy mặt nào) -> quét cả khung (đã thu nhỏ về max_side)
+    """
+
+    accepts_hints = True   # FaceTracker truyền vị trí box đang bám (sau optical flow) qua hints
+
+    def __init__(self, detect_fn, max_side=640, margin=0.6, full_every=4):
+        self.detect_fn = detect_fn
+        self.max_side = max_side
+        self.margin = margin
+        self.full_every = max(1, int(full_every))
+        self._calls = 0
+        self._prev = []
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def __call__(self, frame, hints=None):
+        prev = list(hints) if hints is not None else self._prev
+        self._calls += 1
+        boxes = None
+        if prev and self._calls % self.full_every:
+            boxes = detect_in_rois(frame, self.detect_fn, prev, self.margin, self.max_side)
+            self.roi_scans += 1
+        if not boxes:
+            boxes = detect_multiscale(frame, self.detect_fn, self.max_side)
+            self.full_scans += 1
+        self._prev = boxes
+        return boxes
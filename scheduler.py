@@ -0,0 +1,168 @@
+# ===============================================
+# scheduler.py
+# -----------------------------------------------
+# Lịch chạy AI thích nghi cho màn hình camera (thay cho "mỗi 3 frame" / fps cố định)
+#   - Đo thời gian suy luận thật (trung bình trượt) + thời gian xử lý 1 frame hiển thị
+#   - Đo CPU còn rảnh (psutil nếu có, không thì load average / CPU của tiến trình)
+#   - Khoảng cách giữa 2 lần chạy AI (giây) được chỉnh liên tục để:
+#       * vẫn giữ được FPS hiển thị mục tiêu
+#       * kết quả không cũ hơn max_staleness giây
+#       * chạy dày khi mặt di chuyển / cảm xúc đang đổi, giãn ra khi cảnh ổn định
+#   - decision(): trạng thái hiện tại để hiện lên giao diện
+# ===============================================
+
+import math
+import os
+import time
+
+try:
+    import psutil
+except ImportError:  # psutil là tùy chọn
+    psutil = None
+
+
+def box_motion(prev, cur):
+    """Mức dịch chuyển lớn nhất của tâm box (tính theo bề rộng box). Số mặt đổi -> 1.0."""
+    if prev is None or len(prev) != len(cur):
+        return 1.0
+    motion = 0.0
+    for (px, py, pw, ph), (x, y, w, h) in zip(prev, cur):
+        dx = (x + w / 2) - (px + pw / 2)
+        dy = (y + h / 2) - (py + ph / 2)
+        motion = max(motion, math.hypot(dx, dy) / max(1, w))
+    return motion
+
+
+class CpuMonitor:
+    """Tỉ lệ CPU còn rảnh (0-1), đo lại tối đa mỗi `period` giây."""
+
+    def __init__(self, period=1.0):
+        self.period = period
+        self._last = 0.0
+        self._proc = (time.process_time(), time.monotonic())
+        self.headroom = 1.0
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)  # lần gọi đầu luôn trả 0 -> mồi trước
+
+    def sample(self):
+        now = time.monotonic()
+        if now - self._last < self.period:
+            return self.headroom
+        self._last = now
+        if psutil is not None:
+            busy = psutil.cpu_percent(interval=None) / 100.0
+        elif hasattr(os, "getloadavg"):
+            busy = os.getloadavg()[0] / (os.cpu_count() or 1)
+        else:
+            # Windows không có psutil: chỉ tính được CPU của chính tiến trình
+            cpu, wall = time.process_time(), now
+            busy = (cpu - self._proc[0]) / max(1e-6, wall - self._proc[1]) / (os.cpu_count() or 1)
+            self._proc = (cpu, wall)
+        self.headroom = min(1.0, max(0.0, 1.0 - busy))
+        return self.headroom
+
+
+class AdaptiveScheduler:
+    """
+    target_fps: FPS hiển thị mong muốn (chỉ có ý nghĩa khi AI chạy chung luồng với hiển thị)
+    max_staleness: kết quả cảm xúc không được cũ hơn mức này (giây) - trừ khi máy quá yếu
+    min_interval: khoảng cách nhỏ nhất giữa 2 lần chạy AI (giây), vd 1/fps tối đa
+    cpu_budget: tỉ lệ thời gian tối đa dành cho AI
+    motion_threshold: box dịch quá tỉ lệ này (so với bề rộng mặt) coi là đang di chuyển
+    backoff: cảnh ổn định thì mỗi lần chạy AI nhân khoảng cách lên hệ số này
+    """
+
+    def __init__(self, target_fps=15.0, max_staleness=0.6, min_interval=0.05, cpu_budget=0.6,
+                 motion_threshold=0.08, backoff=1.3, alpha=0.2):
+        self.target_fps = target_fps
+        self.max_staleness = max_staleness
+        self.min_interval = min_interval
+        self.cpu_budget = cpu_budget
+        self.motion_threshold = motion_threshold
+        self.backoff = backoff
+        self.alpha = alpha
+
+        self.cpu = CpuMonitor()
+        self.latency = None          # thời gian suy luận trung bình (giây)
+        self.frame_cost = 0.0        # thời gian xử lý 1 frame KHÔNG tính AI (giây)
+        self.interval = min_interval
+        self.reason = "start"
+        self._last_infer = 0.0
+        self._frame_t0 = None
+        self._infer_in_frame = 0.0
+        self.inferences = 0
+        self.frames = 0
+
+    # ---------- Quyết định ----------
+    def should_infer(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self._last_infer >= self.interval
+
+    def _min_feasible(self):
+        """Khoảng cách nhỏ nhất máy gánh được: AI chỉ dùng phần thời gian còn lại sau hiển thị."""
+        if self.latency is None:
+            return self.min_interval
+        display_share = self.frame_cost * self.target_fps if self.target_fps else 0.0
+        share = min(self.cpu_budget, max(0.05, 1.0 - display_share))
+        headroom = self.cpu.sample()
+        if headroom < 0.2:
+            # Máy đang bận việc khác -> nhường bớt
+            share *= max(0.25, headroom / 0.2)
+        return max(self.min_interval, self.latency / share)
+
+    def report(self, latency, motion=0.0, emotion_changed=False, now=None):
+        """Gọi sau mỗi lần chạy AI: thời gian chạy, mức di chuyển, cảm xúc có đổi không."""
+        now = time.monotonic() if now is None else now
+        self._last_infer = now
+        self._infer_in_frame += latency
+        self.inferences += 1
+        self.latency = latency if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * latency
+
+        floor = self._min_feasible()
+        ceiling = max(floor, self.max_staleness)
+        if motion > self.motion_threshold:
+            interval, reason = floor, "motion"
+        elif emotion_changed:
+            interval, reason = floor, "emotion_change"
+        else:
+            interval, reason = self.interval * self.backoff, "stable"
+        if floor > self.max_staleness:
+            reason = "cpu_bound"
+        elif self.cpu.headroom < 0.2:
+            reason = "low_headroom"
+        self.interval = min(ceiling, max(floor, interval))
+        self.reason = reason
+
+    # ---------- Nhịp hiển thị (khi AI chạy chung luồng với vòng lặp camera) ----------
+    def begin_frame(self):
+        self._frame_t0 = time.perf_counter()
+        self._infer_in_frame = 0.0
+
+    def end_frame(self, sleep=True):
+        """Đo chi phí frame (trừ phần AI) rồi ngủ cho đủ 1/target_fps. Trả số giây đã ngủ."""
+        if self._frame_t0 is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._frame_t0
+        cost = max(0.0, elapsed - self._infer_in_frame)
+        self.frame_cost = (1 - self.alpha) * self.frame_cost + self.alpha * cost
+        self.frames += 1
+        delay = (1.0 / self.target_fps - elapsed) if self.target_fps else 0.0
+        if sleep and delay > 0:
+            time.sleep(delay)
+        return max(0.0, delay)
+
+    def decision(self):
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "infer_fps": round(1.0 / self.interval, 1) if self.interval else None,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "frame_ms": round(self.frame_cost * 1000, 1),
+            "cpu_headroom": round(self.cpu.headroom, 2),
+            "reason": self.reason,
+        }
+
+    def describe(self):
+        d = self.decision()
+        latency = f"{d['latency_ms']:.0f} ms" if d["latency_ms"] is not None else "--"
+        return (f"AI mỗi {d['interval_ms']:.0f} ms ({d['reason']}) | suy luận {latency} "
+                f"| CPU rảnh {d['cpu_headroom'] * 100:.0f}%")
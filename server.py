@@ -0,0 +1,323 @@
+# ===============================================
+# server.py
+# -----------------------------------------------
+# Chạy không giao diện: CameraStreamer (camera hoặc file video) -> phát qua HTTP
+#   python server.py                          # camera 0, http://127.0.0.1:8080/
+#   python server.py --source clip.mp4 --host 0.0.0.0
+#   - /stream.mjpg : video MJPEG đã vẽ khung + nhãn (mở thẳng trong trình duyệt / VLC)
+#   - /ws          : WebSocket, mỗi frame 1 tin JSON (cảm xúc chính + từng mặt)
+#   - /snapshot.jpg, /stats, /metrics (Prometheus), / (trang xem thử)
+#   - Mỗi frame chỉ mã hóa JPEG + JSON 1 lần rồi phát cho mọi client (asyncio)
+#     -> thêm người xem gần như không tốn thêm CPU; không ai xem thì không mã hóa
+#   - Client chậm không bị dồn hàng đợi: luôn nhận frame mới nhất, frame cũ bỏ qua
+# ===============================================
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import sys
+import time
+
+from function import CameraStreamer
+from metrics_exporter import CONTENT_TYPE, METRICS, Family
+from preview import PreviewEncoder
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+BOUNDARY = "frame"
+MAX_WS_MESSAGE = 1 << 16   # tin từ client (ping/close) không cần lớn
+
+INDEX_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Emotion stream</title></head>
+<body style="background:#111;color:#eee;font-family:sans-serif">
+<img src="/stream.mjpg" style="max-width:100%"><pre id="out"></pre>
+<script>
+const ws = new WebSocket((location.protocol === "https:" ? "wss://" : "ws://") + location.host + "/ws");
+ws.onmessage = e => { document.getElementById("out").textContent = JSON.stringify(JSON.parse(e.data), null, 2); };
+</script>
+</body></html>
+"""
+
+
+def ws_accept_key(key):
+    """Giá trị Sec-WebSocket-Accept cho Sec-WebSocket-Key của client (RFC 6455)."""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def ws_frame(payload, opcode=0x1):
+    """1 frame WebSocket từ server (không mask). opcode: 0x1 text, 0x8 close, 0xA pong."""
+    n = len(payload)
+    if n < 126:
+        header = bytes((0x80 | opcode, n))
+    elif n < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + n.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + n.to_bytes(8, "big")
+    return header + payload
+
+
+async def ws_read(reader):
+    """Đọc 1 frame từ client -> (opcode, payload). Client luôn mask dữ liệu."""
+    b1, b2 = await reader.readexactly(2)
+    n = b2 & 0x7F
+    if n == 126:
+        n = int.from_bytes(await reader.readexactly(2), "big")
+    elif n == 127:
+        n = int.from_bytes(await reader.readexactly(8), "big")
+    if n > MAX_WS_MESSAGE:
+        raise ValueError("Tin WebSocket quá lớn")
+    mask = await reader.readexactly(4) if b2 & 0x80 else b"\0\0\0\0"
+    data = await reader.readexactly(n)
+    if n:
+        # XOR cả khối bằng số nguyên lớn thay vì từng byte
+        key = (mask * (n // 4 + 1))[:n]
+        data = (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+    return b1 & 0x0F, data
+
+
+class Broadcaster:
+    """
+    Giữ frame mới nhất (JPEG + tin WebSocket đã đóng gói sẵn) và đánh thức mọi client.
+    on_frame() được gọi từ luồng delivery của CameraStreamer; client chạy trên event loop.
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.loop = None
+        self.seq = 0
+        self.jpeg = None
+        self.jpeg_seq = 0   # seq của frame đã mã hóa JPEG gần nhất (chỉ WebSocket xem thì không mã hóa)
+        self.ws_message = None
+        self._event = None
+        self.clients = {"mjpeg": 0, "ws": 0, "snapshot": 0}
+        self.counters = {"published": 0, "skipped_idle": 0, "bytes_sent": 0}
+
+    def bind(self, loop):
+        self.loop = loop
+        self._event = asyncio.Event()
+
+    def on_frame(self, streamer, frame, emotion, score):
+        """Callback delivery: frame chỉ hợp lệ trong lúc gọi -> mã hóa ngay tại đây, 1 lần."""
+        if self.loop is None:
+            return
+        want_jpeg = self.clients["mjpeg"] > 0 or self.clients["snapshot"] > 0
+        if not (want_jpeg or self.clients["ws"]):
+            self.counters["skipped_idle"] += 1
+            return
+        jpeg = self.encoder.encode(frame) if want_jpeg else None
+        result = (time.time(), emotion, float(score), streamer.latest_faces())
+        self.loop.call_soon_threadsafe(self._publish, jpeg, result)
+
+    def _publish(self, jpeg, result):
+        # Chạy trên event loop: seq chỉ tăng ở đây nên mỗi frame có 1 seq riêng
+        self.seq += 1
+        if jpeg is not None:
+            self.jpeg, self.jpeg_seq = jpeg, self.seq
+        self.ws_message = self._pack(result) if self.clients["ws"] else None
+        self.counters["published"] += 1
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def _pack(self, result):
+        """Tin WebSocket đóng gói 1 lần cho mọi client."""
+        t, emotion, score, faces = result
+        payload = {"seq": self.seq, "t": round(t, 3), "emotion": emotion, "score": round(score, 4),
+                   "faces": [{"id": int(tid), "box": [int(v) for v in box], "emotion": name, "score": round(float(s), 4)}
+                             for tid, box, name, s in faces]}
+        return ws_frame(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    async def next(self, seq, jpeg=False):
+        """
+        Chờ tới khi có frame mới hơn seq -> seq mới. Bỏ qua các frame đã lỡ (client chậm).
+        jpeg=True: chờ tới khi có cả JPEG mới hơn seq (client MJPEG / snapshot).
+        """
+        while self.seq <= seq or (jpeg and self.jpeg_seq <= seq):
+            await self._event.wait()
+        return self.seq
+
+    def stats(self):
+        return {**self.counters, "seq": self.seq, "clients": dict(self.clients), "encoder": self.encoder.stats()}
+
+    def families(self):
+        clients = Family("server_clients", "gauge", "Số client đang kết nối server")
+        for kind, n in self.clients.items():
+            clients.add(n, kind=kind)
+        published = Family("server_frames_total", "counter", "Frame đã mã hóa và phát / bỏ vì không ai xem")
+        published.add(self.counters["published"], status="published")
+        published.add(self.counters["skipped_idle"], status="skipped_idle")
+        sent = Family("server_sent_bytes_total", "counter", "Tổng số byte đã gửi cho client")
+        sent.add(self.counters["bytes_sent"])
+        return [clients, published, sent]
+
+
+class StreamServer:
+    def __init__(self, streamer, broadcaster, host="127.0.0.1", port=8080):
+        self.streamer = streamer
+        self.broadcaster = broadcaster
+        self.host = host
+        self.port = port
+
+    # ---------- HTTP ----------
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            method, target = lines[0].split(" ")[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+            path = target.split("?", 1)[0]
+            if method != "GET":
+                await self._respond(writer, 405, b"", "text/plain")
+            elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await self._websocket(reader, writer, headers)
+            elif path == "/stream.mjpg":
+                await self._mjpeg(writer)
+            elif path == "/snapshot.jpg":
+                await self._snapshot(writer)
+            elif path == "/stats":
+                body = {"stream": self.streamer.stats(), "server": self.broadcaster.stats()}
+                await self._respond(writer, 200, json.dumps(body, default=str).encode("utf-8"), "application/json")
+            elif path == "/metrics":
+                await self._respond(writer, 200, METRICS.render().encode("utf-8"), CONTENT_TYPE)
+            elif path == "/":
+                await self._respond(writer, 200, INDEX_HTML.encode("utf-8"), "text/html; charset=utf-8")
+            else:
+                await self._respond(writer, 404, b"not found", "text/plain")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  503: "Service Unavailable"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def _snapshot(self, writer):
+        """Chờ frame kế tiếp (không ai xem thì server không mã hóa -> frame cũ có thể đã rất cũ)."""
+        b = self.broadcaster
+        b.clients["snapshot"] += 1
+        try:
+            await asyncio.wait_for(b.next(b.seq, jpeg=True), timeout=2.0)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            b.clients["snapshot"] -= 1
+        if b.jpeg is None:
+            await self._respond(writer, 503, b"no frame yet", "text/plain")
+        else:
+            await self._respond(writer, 200, b.jpeg, b.encoder.mime)
+
+    # ---------- MJPEG ----------
+    async def _mjpeg(self, writer):
+        b = self.broadcaster
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary={BOUNDARY}\r\n"
+                     "Cache-Control: no-cache\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        b.clients["mjpeg"] += 1
+        try:
+            seq = 0
+            while True:
+                seq = await b.next(seq, jpeg=True)
+                jpeg = b.jpeg
+                writer.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                             f"Content-Length: {len(jpeg)}\r\n\r\n".encode("latin-1"))
+                writer.write(jpeg)
+                writer.write(b"\r\n")
+                # drain chờ client nhận xong; trong lúc đó frame mới chỉ thay frame cũ, không dồn lại
+                await writer.drain()
+                b.counters["bytes_sent"] += len(jpeg)
+        finally:
+            b.clients["mjpeg"] -= 1
+
+    # ---------- WebSocket ----------
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            await self._respond(writer, 400, b"missing Sec-WebSocket-Key", "text/plain")
+            return
+        writer.write("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {ws_accept_key(key)}\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        b = self.broadcaster
+        b.clients["ws"] += 1
+        listener = asyncio.ensure_future(self._ws_listen(reader, writer))
+        try:
+            seq = 0
+            while not listener.done():
+                waiter = asyncio.ensure_future(b.next(seq))
+                await asyncio.wait((waiter, listener), return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    break
+                seq = waiter.result()
+                message = b.ws_message
+                if message is None:
+                    continue   # frame đến lúc chưa có client WebSocket nào
+                writer.write(message)
+                await writer.drain()
+                b.counters["bytes_sent"] += len(message)
+        finally:
+            b.clients["ws"] -= 1
+            listener.cancel()
+
+    async def _ws_listen(self, reader, writer):
+        """Trả lời ping, kết thúc khi client gửi close hoặc mất kết nối."""
+        try:
+            while True:
+                opcode, data = await ws_read(reader)
+                if opcode == 0x8:
+                    writer.write(ws_frame(data[:2], 0x8))
+                    return
+                if opcode == 0x9:
+                    writer.write(ws_frame(data, 0xA))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            return
+
+    # ---------- Vòng đời ----------
+    async def serve(self):
+        self.broadcaster.bind(asyncio.get_running_loop())
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        METRICS.register("server", self.broadcaster.families)
+        self.streamer.start()
+        print(f"Đang phát: http://{self.host}:{self.port}/  (MJPEG /stream.mjpg, WebSocket /ws)")
+        try:
+            async with server:
+                while not self.streamer.ended:
+                    await asyncio.sleep(0.5)
+        finally:
+            self.streamer.stop()
+            METRICS.unregister("server")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phát video đã nhận diện cảm xúc qua MJPEG + WebSocket.")
+    parser.add_argument("--source", default="0", help="Số thứ tự camera hoặc đường dẫn file video")
+    parser.add_argument("--host", default="127.0.0.1", help='"0.0.0.0" để máy khác trong mạng xem được')
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fps", type=int, default=10, help="Số lần chạy AI tối đa mỗi giây")
+    parser.add_argument("--detector", default=None, help="Backend/profile tìm mặt (mặc định: profile live)")
+    parser.add_argument("--quality", type=int, default=80, help="Chất lượng JPEG")
+    parser.add_argument("--max-width", type=int, default=960, help="Thu nhỏ frame trước khi mã hóa")
+    parser.add_argument("--no-loop", action="store_true", help="File video: hết file thì dừng server")
+    parser.add_argument("--hud", action="store_true", help="Vẽ bảng thời gian từng đoạn lên video")
+    args = parser.parse_args(argv)
+
+    broadcaster = Broadcaster(PreviewEncoder("jpeg", quality=args.quality, max_width=args.max_width))
+    streamer = CameraStreamer(args.source, fps=args.fps, detector=args.detector,
+                              hud=args.hud, loop_video=not args.no_loop)
+    streamer.callback = lambda frame, emotion, score, boxes: broadcaster.on_frame(streamer, frame, emotion, score)
+    try:
+        asyncio.run(StreamServer(streamer, broadcaster, args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# ===============================================
+# session_recorder.py
+# -----------------------------------------------
+# Ghi lại dòng thời gian cảm xúc của 1 phiên camera (mỗi frame, mỗi khuôn mặt 1 dòng)
+#   - Lưu dạng cột, chỉ ghi nối thêm (append-only): mỗi trường 1 file nhị phân thô
+#       sessions/<tên phiên>/t.bin      float64  thời điểm (unix time)
+#                            frame.bin  uint32   số thứ tự frame được phân tích
+#                            track.bin  int32    track ID của khuôn mặt
+#                            box.bin    int32x4  x, y, w, h
+#                            scores.bin float32x7 xác suất 7 cảm xúc
+#     + header.json (kiểu dữ liệu, nhãn, số dòng) -> ~60 byte/dòng, vài MB mỗi giờ
+#   - Bộ đệm cố định trong RAM, đầy hoặc quá flush_interval giây thì ghi xuống đĩa
+#   - load_session(): đọc lại bằng np.memmap (không nạp cả file vào RAM)
+# ===============================================
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def columns_for(n_classes):
+    """Tên cột -> (dtype, shape mỗi dòng)."""
+    return {
+        "t": (np.dtype("<f8"), ()),
+        "frame": (np.dtype("<u4"), ()),
+        "track": (np.dtype("<i4"), ()),
+        "box": (np.dtype("<i4"), (4,)),
+        "scores": (np.dtype("<f4"), (n_classes,)),
+    }
+
+
+def new_session_dir(root="sessions"):
+    return os.path.join(root, f"session_{datetime.now():%Y%m%d_%H%M%S}")
+
+
+class SessionRecorder:
+    """
+    path: thư mục phiên (tạo mới nếu chưa có; phiên cũ cùng tên thì ghi nối tiếp)
+    buffer_rows: số dòng tối đa giữ trong RAM trước khi ghi xuống đĩa
+    flush_interval: ghi xuống đĩa ít nhất mỗi N giây (mất điện chỉ mất vài giây cuối)
+    """
+
+    def __init__(self, path, labels, buffer_rows=4096, flush_interval=2.0):
+        self.path = path
+        self.labels = list(labels)
+        self.columns = columns_for(len(self.labels))
+        self.buffer_rows = buffer_rows
+        self.flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+
+        # Bộ đệm cấp phát 1 lần, dùng lại suốt phiên
+        self._buf = {name: np.zeros((buffer_rows, *shape), dtype) for name, (dtype, shape) in self.columns.items()}
+        self._n = 0
+        self._lock = threading.Lock()
+        # Ghi nối phiên cũ: cắt các cột về cùng số dòng hoàn chỉnh (phòng lần trước bị ngắt giữa lúc ghi)
+        self.rows = _rows_on_disk(path, self.columns)
+        for name, (dtype, shape) in self.columns.items():
+            p = os.path.join(path, f"{name}.bin")
+            if os.path.exists(p):
+                os.truncate(p, self.rows * dtype.itemsize * int(np.prod(shape, dtype=np.int64)))
+        self._files = {name: open(os.path.join(path, f"{name}.bin"), "ab") for name in self.columns}
+        self.frames = 0
+        self._last_flush = time.monotonic()
+        self._started = time.time()
+        self._write_header(closed=False)
+
+    def record(self, track_ids, boxes, scores, t=None):
+        """Ghi các khuôn mặt của 1 frame. scores: N x 7 (thứ tự labels)."""
+        t = time.time() if t is None else t
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1, len(self.labels))
+        track_ids = np.asarray(track_ids, dtype=np.int32)
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        n = len(scores)
+        with self._lock:
+            if self._files is None:
+                return   # đã close(): luồng suy luận chậm chân không làm hỏng phiên đã đóng
+            frame = self.frames
+            self.frames += 1
+            start = 0
+            while start < n:
+                if self._n == self.buffer_rows:
+                    self._flush()
+                take = min(n - start, self.buffer_rows - self._n)
+                sl = slice(self._n, self._n + take)
+                self._buf["t"][sl] = t
+                self._buf["frame"][sl] = frame
+                self._buf["track"][sl] = track_ids[start:start + take]
+                self._buf["box"][sl] = boxes[start:start + take]
+                self._buf["scores"][sl] = scores[start:start + take]
+                self._n += take
+                start += take
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        if self._n:
+            for name, f in self._files.items():
+                f.write(self._buf[name][:self._n].tobytes())
+                f.flush()
+            self.rows += self._n
+            self._n = 0
+            self._write_header(closed=False)
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._files is not None:
+                self._flush()
+
+    def _write_header(self, closed):
+        header = {
+            "version": FORMAT_VERSION,
+            "labels": self.labels,
+            "rows": self.rows,
+            "started": self._started,
+            "closed": closed,
+            "columns": {name: {"dtype": dtype.str, "shape": list(shape)} for name, (dtype, shape) in self.columns.items()},
+        }
+        tmp = os.path.join(self.path, "header.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, "header.json"))
+
+    def close(self):
+        with self._lock:
+            if self._files is None:
+                return
+            self._flush()
+            for f in self._files.values():
+                f.close()
+            self._files = None
+            self._write_header(closed=True)
+
+
+def _rows_on_disk(path, columns):
+    """Số dòng hoàn chỉnh = cột ngắn nhất (phiên bị ngắt giữa chừng vẫn đọc được)."""
+    rows = []
+    for name, (dtype, shape) in columns.items():
+        p = os.path.join(path, f"{name}.bin")
+        size = os.path.getsize(p) if os.path.exists(p) else 0
+        rows.append(size // (dtype.itemsize * int(np.prod(shape, dtype=np.int64))))
+    return min(rows)
+
+
+def load_session(path):
+    """-> (labels, {tên cột: np.memmap chỉ đọc}). Không nạp dữ liệu vào RAM cho tới khi dùng."""
+    with open(os.path.join(path, "header.json"), encoding="utf-8") as f:
+        header = json.load(f)
+    columns = {name: (np.dtype(c["dtype"]), tuple(c["shape"])) for name, c in header["columns"].items()}
+    rows = _rows_on_disk(path, columns)
+    data = {}
+    for name, (dtype, shape) in columns.items():
+        p = os.path.join(path, f"{name}.bin")
+        if rows == 0:
+            data[name] = np.zeros((0, *shape), dtype)
+        else:
+            data[name] = np.memmap(p, dtype=dtype, mode="r", shape=(rows, *shape))
+    return header["labels"], data
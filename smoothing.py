@@ -0,0 +1,88 @@
+# ===============================================
+# smoothing.py
+# -----------------------------------------------
+# Làm mượt cảm xúc theo từng khuôn mặt (track ID)
+#   - Ring buffer NumPy cố định chứa vector 7 xác suất
+#   - Tổng chạy (running sum) -> cập nhật O(1) dù cửa sổ lớn
+#   - 2 chế độ: "window" (trung bình trượt) / "ema" (giảm dần theo mũ)
+#   - Hysteresis: chỉ đổi nhãn khi nhãn mới vượt hẳn nhãn cũ
+# ===============================================
+
+import numpy as np
+
+
+class EmotionSmoother:
+    def __init__(self, n_classes=7, window=5, mode="window", alpha=0.3, hysteresis_delta=0.15):
+        if mode not in ("window", "ema"):
+            raise ValueError(f"Chế độ làm mượt không hợp lệ: {mode}")
+        self.mode = mode
+        self.alpha = alpha
+        self.hysteresis_delta = hysteresis_delta
+        self.window = max(1, int(window))
+
+        self._buf = np.zeros((self.window, n_classes), dtype=np.float32)
+        self._sum = np.zeros(n_classes, dtype=np.float64)
+        self._avg = np.zeros(n_classes, dtype=np.float64)
+        self._idx = 0
+        self._count = 0
+        self.label = -1      # chỉ số nhãn ổn định hiện tại (-1 = chưa có)
+
+    def update(self, probs):
+        """Thêm 1 vector xác suất, trả về (chỉ số nhãn ổn định, điểm trung bình của nhãn đó)."""
+        v = np.asarray(probs, dtype=np.float32)
+
+        if self.mode == "window":
+            # Trừ phần tử sắp bị ghi đè, cộng phần tử mới: không phải duyệt lại cả cửa sổ
+            self._sum += v
+            self._sum -= self._buf[self._idx]
+            self._buf[self._idx] = v
+            self._idx += 1
+            if self._idx == self.window:
+                self._idx = 0
+                # Tính lại tổng 1 lần mỗi vòng để không tích lũy sai số float
+                self._buf.sum(axis=0, dtype=np.float64, out=self._sum)
+            self._count = min(self._count + 1, self.window)
+            np.divide(self._sum, self._count, out=self._avg)
+        else:
+            if self._count == 0:
+                self._avg[:] = v
+            else:
+                self._avg += self.alpha * (v - self._avg)
+            self._count += 1
+
+        top = int(self._avg.argmax())
+        prev = self.label
+        # === Hysteresis ===
+        if prev >= 0 and top != prev and self._avg[top] < self._avg[prev] + self.hysteresis_delta:
+            top = prev
+        self.label = top
+        return top, float(self._avg[top])
+
+    @property
+    def average(self):
+        return self._avg
+
+
+class TrackSmoothers:
+    """Mỗi track ID một EmotionSmoother riêng -> người này không làm nhiễu nhãn của người kia."""
+
+    def __init__(self, labels, **kwargs):
+        self.labels = tuple(labels)
+        self._kwargs = kwargs
+        self._smoothers = {}
+
+    def update(self, track_id, probs):
+        sm = self._smoothers.get(track_id)
+        if sm is None:
+            sm = self._smoothers[track_id] = EmotionSmoother(len(self.labels), **self._kwargs)
+        idx, score = sm.update(probs)
+        return self.labels[idx], score
+
+    def prune(self, active_ids):
+        """Bỏ trạng thái của các track đã biến mất."""
+        active = set(active_ids)
+        for tid in [t for t in self._smoothers if t not in active]:
+            del self._smoothers[tid]
+
+    def __len__(self):
+        return len(self._smoothers)
@@ -0,0 +1,46 @@
+# ===============================================
+# startup.py
+# -----------------------------------------------
+# Đo thời gian khởi động ứng dụng
+#   - Mốc (milestone): tính từ lúc import module này (đầu chương trình)
+#     vd: ui_ready (cửa sổ hiện ra), models_ready (mô hình sẵn sàng)
+#   - Khoảng (duration): import thư viện, load mô hình, lần suy luận đầu
+# Import module này càng sớm càng tốt (dòng đầu của main.py / study.py).
+# ===============================================
+
+import threading
+import time
+from contextlib import contextmanager
+
+_T0 = time.perf_counter()
+_lock = threading.Lock()
+
+MILESTONES = {}
+DURATIONS = {}
+
+
+def mark(name):
+    """Ghi mốc thời gian (giây kể từ lúc chương trình bắt đầu). Chỉ ghi lần đầu."""
+    with _lock:
+        MILESTONES.setdefault(name, time.perf_counter() - _T0)
+
+
+@contextmanager
+def timed(name):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            DURATIONS[name] = DURATIONS.get(name, 0.0) + time.perf_counter() - t
+
+
+def report():
+    with _lock:
+        lines = ["--- Startup ---"]
+        for name, sec in sorted(MILESTONES.items(), key=lambda kv: kv[1]):
+            lines.append(f"{name:18s}: t+{sec * 1000:8.1f} ms")
+        for name, sec in DURATIONS.items():
+            lines.append(f"{name:18s}: {sec * 1000:9.1f} ms")
+        lines.append("---------------")
+    return "\n".join(lines)
@@ -0,0 +1,128 @@
+# ===============================================
+# storage_index.py
+# -----------------------------------------------
+# Chỉ mục kho ảnh đã lưu (storage/index.sqlite)
+#   - Mỗi ảnh 1 dòng: tên file, nhãn cảm xúc, điểm số, thời điểm lưu
+#   - Thumbnail JPEG (base64) tạo 1 lần lúc lưu, không phải mở lại ảnh gốc
+#   - Lấy theo trang (page) -> mở thư viện nhanh như nhau dù có hàng nghìn ảnh
+#   - sync(): đưa ảnh cũ (lưu trước khi có chỉ mục) vào chỉ mục, bỏ dòng của file đã mất
+# ===============================================
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+THUMB_SIZE = (180, 140)
+
+
+def make_thumbnail(img_bgr, size=THUMB_SIZE, quality=80):
+    """Thu nhỏ giữ tỉ lệ cho vừa khung size -> JPEG base64."""
+    h, w = img_bgr.shape[:2]
+    scale = min(size[0] / w, size[1] / h, 1.0)
+    thumb = cv2.resize(img_bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode thumbnail")
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def split_label(label):
+    """'happy (0.95)' -> ('happy', 0.95); nhãn không có điểm -> (label, None)."""
+    label = (label or "").strip()
+    if label.endswith(")") and "(" in label:
+        name, _, score = label[:-1].rpartition("(")
+        try:
+            return name.strip(), float(score)
+        except ValueError:
+            pass
+    return label, None
+
+
+class StorageIndex:
+    def __init__(self, storage_dir, db_name="index.sqlite"):
+        self.storage_dir = storage_dir
+        os.makedirs(storage_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(storage_dir, db_name), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS captures ("
+            " filename TEXT PRIMARY KEY, prefix TEXT, emotion TEXT, score REAL,"
+            " scores TEXT, boxes TEXT, created REAL NOT NULL, thumb TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS captures_created ON captures (created DESC)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def add(self, filename, img_bgr=None, label=None, prefix=None, scores=None, boxes=None, created=None,
+            thumb=None, commit=True):
+        """Thêm / cập nhật 1 ảnh. Truyền img_bgr để tạo thumbnail ngay (ảnh đang có sẵn trong RAM)."""
+        emotion, score = split_label(label)
+        if thumb is None and img_bgr is not None:
+            thumb = make_thumbnail(img_bgr)
+        row = (
+            filename, prefix or filename.split("_")[0], emotion, score,
+            json.dumps(scores) if scores is not None else None,
+            json.dumps([[int(v) for v in b] for b in boxes]) if boxes is not None else None,
+            created if created is not None else time.time(), thumb,
+        )
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            if commit:
+                self._db.commit()
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def remove(self, filename):
+        with self._lock:
+            self._db.execute("DELETE FROM captures WHERE filename = ?", (filename,))
+            self._db.commit()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM captures").fetchone()[0]
+
+    def page(self, offset=0, limit=30):
+        """1 trang ảnh, mới nhất trước."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM captures ORDER BY created DESC LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def get(self, filename):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM captures WHERE filename = ?", (filename,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    @staticmethod
+    def _to_dict(row):
+        d = dict(row)
+        d["scores"] = json.loads(d["scores"]) if d["scores"] else None
+        d["boxes"] = json.loads(d["boxes"]) if d["boxes"] else None
+        return d
+
+    def sync(self):
+        """Đồng bộ với thư mục: chỉ ảnh CHƯA có trong chỉ mục mới phải đọc để tạo thumbnail."""
+        on_disk = {f for f in os.listdir(self.storage_dir) if f.lower().endswith(IMAGE_EXTS)}
+        with self._lock:
+            indexed = {r[0] for r in self._db.execute("SELECT filename FROM captures")}
+        added = 0
+        for fname in sorted(on_disk - indexed):
+            path = os.path.join(self.storage_dir, fname)
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            self.add(fname, img, created=os.path.getmtime(path), commit=False)
+            added += 1
+        with self._lock:
+            self._db.executemany("DELETE FROM captures WHERE filename = ?", [(f,) for f in indexed - on_disk])
+            self._db.commit()
+        return added, len(indexed - on_disk)
@@ -1,5 +1,4 @@
-import base64  # [KỸ THUẬT] Mã hóa dữ liệu nhị phân (ảnh) thành chuỗi ký tự để hiển thị lên giao diện Web/Flet
-import io      # Thư viện xử lý luồng dữ liệu vào/ra (Input/Output Stream)
+import startup # [ĐO ĐẠC] Import đầu tiên để bấm giờ khởi động (import, load mô hình, lần suy luận đầu)
 import os      # Tương tác với hệ điều hành (tạo thư mục, đường dẫn file)
 import threading # [KỸ THUẬT] Đa luồng: Giúp tách việc xử lý ảnh (nặng) ra khỏi việc vẽ giao diện (nhẹ) để App không bị đơ
 import time    # Dùng để đo thời gian hoặc tạo độ trễ (sleep) giảm tải CPU
@@ -9,24 +8,75 @@ from typing import List, Tuple, Optional # Type Hinting: Giúp code rõ ràng, d
 import cv2     # [THỊ GIÁC MÁY TÍNH] OpenCV: Thư viện xử lý ảnh số 1 thế giới (Đọc camera, biến đổi ma trận ảnh)
 import flet as ft # [GIAO DIỆN] Framework UI hiện đại
 import numpy as np # [TOÁN HỌC] Thư viện xử lý ma trận. Máy tính "nhìn" ảnh là một ma trận số khổng lồ (Height x Width x Channels)
-from fer.fer import FER # [TRÍ TUỆ NHÂN TẠO] Thư viện nhận diện cảm xúc tích hợp sẵn Deep Learning
-from PIL import Image, ImageDraw, ImageFont # Pillow: Thư viện xử lý file ảnh bổ trợ
+# [TRÍ TUỆ NHÂN TẠO] Thư viện FER (kéo theo TensorFlow) KHÔNG import ở đây: mô hình lấy từ kho dùng chung (model_registry.py)
+from tracker import FaceTracker # [TỐI ƯU] Bám khuôn mặt giữa các keyframe, không cần detect lại mỗi frame
+from preview import PreviewEncoder, FrameChangeDetector, boxes_stable # [TỐI ƯU] Mã hóa JPEG + bỏ qua frame không đổi
+from detectors import default_detector
+from function import EMOTION_LABELS, STILL_MAX_SIDE, get_face_finder, _get_classifier, detect_faces, classify_boxes, find_and_score, results_from_scores # [TỐI ƯU] Mô hình dùng chung, không load trùng
+from result_cache import default_cache # [TỐI ƯU] Cache kết quả theo nội dung ảnh: mở lại ảnh cũ không phải chạy AI
+from model_registry import REGISTRY
+from storage_index import StorageIndex # [TỐI ƯU] Chỉ mục kho ảnh: thumbnail tạo sẵn + phân trang
+from capture_writer import CaptureWriter # [TỐI ƯU] Ghi ảnh ở luồng nền, không chặn giao diện
+from session_recorder import SessionRecorder, new_session_dir # [LƯU TRỮ] Ghi dòng thời gian cảm xúc dạng cột (phân tích sau)
+from scheduler import AdaptiveScheduler, box_motion # [TỐI ƯU] Lịch chạy AI thích nghi thay cho "mỗi 3 frame"
+from roi import RoiDetector # [TỐI ƯU] Keyframe chỉ tìm mặt trong vùng quanh vị trí cũ
+from frame_pool import FramePool, BufferCache, total_allocations # [TỐI ƯU] Buffer frame cấp phát sẵn, dùng lại mỗi vòng
+from perf import PERF # [ĐO ĐẠC] Thời gian từng đoạn của vòng lặp camera + bảng HUD
 
 # -------------------------- 1. CẤU HÌNH & KHỞI TẠO AI -------------------------- #
 
 STORAGE_DIR = "storage"
 os.makedirs(STORAGE_DIR, exist_ok=True)
+# Chỉ mục SQLite nằm trong storage/: nhãn, điểm số, thời điểm lưu + thumbnail của từng ảnh
+storage_index = StorageIndex(STORAGE_DIR)
+STORAGE_PAGE_SIZE = 30 # Số thẻ ảnh mỗi lần tải thêm trong thư viện
+# Luồng ghi nền: PNG nén mức 3 (không mất dữ liệu). Muốn nhanh + nhẹ hơn: fmt="jpeg" hoặc "webp"
+capture_writer = CaptureWriter(STORAGE_DIR, storage_index, fmt="png", quality=3)
+AUTO_CAPTURE_INTERVAL = 1.0 # Chế độ tự động lưu: tối đa 1 ảnh mỗi giây
 
 #  Khởi tạo bộ phát hiện khuôn mặt
-# Tham số mtcnn=True: Sử dụng mạng nơ-ron MTCNN (Multi-task Cascaded Convolutional Networks).
+# Ảnh tĩnh dùng MTCNN (Multi-task Cascaded Convolutional Networks) - profile "accurate".
 # - MTCNN gồm 3 mạng con (P-Net, R-Net, O-Net) hoạt động tuần tự.
 # - Ưu điểm: Chính xác hơn Haar Cascade truyền thống, tìm được mặt nghiêng, mặt bị che khuất một phần.
-# - Nhược điểm: Chậm hơn Haar một chút, nhưng máy hiện đại xử lý tốt.
-fer_detector = FER(mtcnn=True)
+# - Nhược điểm: Chậm hơn Haar nhiều lần -> camera dùng profile "fast" (Haar) để giữ FPS.
+# [PROFILE] Đổi bộ tìm mặt ở 2 hằng số dưới: fast (Haar) / balanced (OpenCV DNN SSD) / accurate (MTCNN).
+# Chạy `python detectors.py` để đo từng profile trên máy này; nếu máy đủ mạnh, camera tự dùng profile tốt hơn.
+#
+# [TỐI ƯU KHỞI ĐỘNG] Import TensorFlow + load MTCNN mất vài giây.
+# Nếu làm ngay khi import file này, cửa sổ phải chờ dù người dùng chỉ mở thư viện ảnh.
+# -> Tạo lười (lazy) lần đầu cần dùng, và warm_up() chạy sẵn ở luồng nền khi app mở.
+#
+# [TỐI ƯU BỘ NHỚ] Trước đây FER(mtcnn=True) ở đây và FER() trong function.py mỗi bên load 1 bản
+# mô hình Keras riêng. Giờ MTCNN (tìm mặt) và bộ phân loại Keras tách ra, đều lấy từ REGISTRY:
+# mỗi mô hình chỉ nằm trong RAM 1 lần, dùng chung với CameraStreamer và các công cụ batch.
+# Xem RAM từng mô hình: print(REGISTRY.format_report())
+LIVE_DETECTOR = default_detector("live")
+STILL_DETECTOR = default_detector("still")
+
+def get_finder(live: bool = False):
+    return get_face_finder(LIVE_DETECTOR if live else STILL_DETECTOR)
+
+
+def warm_up():
+    """Load mô hình + chạy thử 1 frame đen ở luồng nền, rồi in báo cáo thời gian khởi động."""
+    with startup.timed("model_load"):
+        get_finder(live=True)
+        get_finder()
+        _get_classifier()
+    with startup.timed("first_inference"):
+        analyze_frame(np.zeros((240, 320, 3), dtype=np.uint8))
+    startup.mark("models_ready")
+    print(startup.report())
+    print(REGISTRY.format_report())
 
 
 # -------------------------- 2. CÁC HÀM XỬ LÝ ẢNH (IMAGE PROCESSING) -------------------------- #
 
+# Bộ mã hóa preview dùng chung: JPEG chất lượng 80, thu nhỏ về 480px.
+# Xem thời gian mã hóa và dung lượng mỗi frame qua preview_encoder.stats()
+preview_encoder = PreviewEncoder("jpeg", quality=80, max_width=480)
+
+
 def frame_to_base64(frame: np.ndarray) -> str:
     """
     [XỬ LÝ ẢNH] Chuyển đổi Ma trận ảnh (OpenCV) -> Chuỗi Base64 (Web UI).
@@ -38,25 +88,22 @@ def frame_to_base64(frame: np.ndarray) -> str:
         # [TỐI ƯU HIỆU NĂNG] Resize ảnh trước khi hiển thị
         # Ảnh gốc từ Camera có thể là HD/FullHD (rất nặng).
         # Ta thu nhỏ về chiều ngang 480px để truyền tải lên giao diện nhanh hơn, giảm độ trễ (Lag).
-        # Hàm cv2.resize sử dụng thuật toán nội suy (Interpolation) để tính toán lại điểm ảnh.
-        h, w = frame.shape[:2]
-        if w > 480:
-            scale = 480 / w
-            frame = cv2.resize(frame, (480, int(h * scale)))
-            
-        # Nén ma trận ảnh thành định dạng PNG trong bộ nhớ đệm (RAM)
-        _, buf = cv2.imencode(".png", frame)
-        # Mã hóa thành chuỗi ASCII
-        return base64.b64encode(buf).decode("utf-8")
+        # Bộ mã hóa tái sử dụng buffer resize giữa các frame cùng kích thước.
+        #
+        # [TỐI ƯU HIỆU NĂNG] Nén JPEG thay vì PNG
+        # PNG nén không mất dữ liệu -> chậm vài ms/frame và dung lượng lớn phải đẩy qua websocket.
+        # JPEG chất lượng 80 nhanh hơn nhiều và nhẹ hơn ~5-10 lần, mắt thường khó thấy khác biệt.
+        return preview_encoder.to_base64(frame)
     except: return ""
 
 
-def bgr_and_rgb(frame):
+def bgr_and_rgb(frame, need_rgb: bool = True):
     """
     [LÝ THUYẾT MÀU SẮC] Chuyển đổi không gian màu.
     - OpenCV mặc định đọc ảnh theo chuẩn BGR (Blue-Green-Red).
     - Mắt người và các Model AI (như FER) lại nhìn theo chuẩn RGB (Red-Green-Blue).
     - Nếu không chuyển đổi: Môi màu đỏ (Red) sẽ bị AI nhìn thành màu xanh dương (Blue) -> Nhận diện sai.
+    - need_rgb=False: chỉ cần bản BGR (detect_faces/classify_boxes tự đổi màu trên buffer dùng lại) -> rgb = None.
     """
     if frame is None:
         return None, None
@@ -66,30 +113,52 @@ def bgr_and_rgb(frame):
         frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
     
     # Ép kiểu dữ liệu về uint8 (số nguyên không dấu 0-255) - chuẩn của ảnh số
-    frame = frame.astype(np.uint8)
+    # [TỐI ƯU BỘ NHỚ] Frame camera vốn đã là uint8 -> không tạo bản sao
+    if frame.dtype != np.uint8:
+        frame = frame.astype(np.uint8)
     
     # Dùng hàm cvtColor (Convert Color) để đảo vị trí kênh màu
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if need_rgb else None
     
     # Trả về cả 2: frame (để vẽ giao diện OpenCV), rgb (để AI phân tích)
     return frame, rgb
 
 
-def analyze_frame(frame: np.ndarray) -> Tuple[np.ndarray, str, List[str], List[Tuple[int, int, int, int]], List[str]]:
+def find_faces(frame: np.ndarray, live: bool = True) -> List[Tuple[int, int, int, int]]:
+    """[PHÁT HIỆN] Chỉ tìm vị trí khuôn mặt (mặc định bộ tìm mặt nhanh của camera), không phân loại cảm xúc."""
+    bgr, _ = bgr_and_rgb(frame, need_rgb=False)
+    return detect_faces(bgr, get_finder(live))
+
+
+def analyze_frame(frame: np.ndarray, boxes: Optional[List[Tuple[int, int, int, int]]] = None, cache=None, scores_out: Optional[list] = None, max_side: Optional[int] = None, tiled: bool = False, draw_buffers: Optional[BufferCache] = None) -> Tuple[np.ndarray, str, List[str], List[Tuple[int, int, int, int]], List[str]]:
     """
     [TRÁI TIM HỆ THỐNG] Hàm phân tích cảm xúc chính.
     Quy trình: Input Frame -> Tiền xử lý -> Detect khuôn mặt -> Phân loại cảm xúc -> Vẽ kết quả -> Output.
+    - boxes: Nếu đã biết vị trí mặt (từ tracker) thì bỏ qua bước Detect, chỉ phân loại các vùng này.
+    - cache: ResultCache cho ảnh tĩnh (không dùng cho camera: frame nào cũng khác nhau).
+    - scores_out: truyền 1 list vào để nhận điểm đầy đủ 7 cảm xúc của từng mặt được chấp nhận (để lưu kèm ảnh).
+    - max_side: [TỐI ƯU ẢNH LỚN] MTCNN chạy trên bản thu nhỏ (cạnh dài <= max_side), box được nhân ngược
+      về ảnh gốc và mặt vẫn được cắt từ ảnh GỐC để phân loại -> ảnh 4K nhanh hơn nhiều mà không mất chi tiết mặt.
+    - tiled: [ẢNH ĐÔNG NGƯỜI] Chia ảnh thành các ô chồng nhau, tìm mặt song song từng ô ở độ phân giải gốc
+      (mặt nhỏ xíu không bị mất khi thu nhỏ), mặt trùng ở mép ô gộp bằng NMS, rồi phân loại chung 1 batch.
+    - draw_buffers: [TỐI ƯU BỘ NHỚ] Camera truyền BufferCache để ảnh kết quả được vẽ vào buffer dùng lại
+      (ảnh trả về bị ghi đè ở frame sau). Ảnh tĩnh không truyền -> nhận bản sao riêng.
     """
     # Bước 1: Chuẩn hóa màu sắc
-    bgr_for_draw, rgb_for_fer = bgr_and_rgb(frame)
+    bgr_for_draw, _ = bgr_and_rgb(frame, need_rgb=False)
     
-    # Bước 2: Gọi thư viện FER để quét khuôn mặt và dự đoán
-    # Hàm này trả về list các dictionary, mỗi dict chứa: box (tọa độ), emotions (điểm số các cảm xúc)
-    results = fer_detector.detect_emotions(rgb_for_fer)
+    # Bước 2: Quét khuôn mặt (MTCNN) rồi phân loại cảm xúc (Keras) - cả 2 mô hình dùng chung qua REGISTRY
+    # Kết quả là list các dictionary, mỗi dict chứa: box (tọa độ), emotions (điểm số các cảm xúc)
+    if boxes is None:
+        # Ảnh tĩnh: tra cache theo hash nội dung ảnh + mô hình trước khi chạy AI
+        results = results_from_scores(*find_and_score(bgr_for_draw, get_finder(), _get_classifier(), cache, max_side, tiled))
+    else:
+        results = classify_boxes(bgr_for_draw, boxes, _get_classifier())
     
     label = "Không phát hiện"
     detail_lines = []
-    annotated = bgr_for_draw.copy() # Tạo bản sao (Copy) để vẽ đè lên, giữ nguyên ảnh gốc sạch
+    # Tạo bản sao (Copy) để vẽ đè lên, giữ nguyên ảnh gốc sạch
+    annotated = draw_buffers.copy("annotated", bgr_for_draw) if draw_buffers is not None else bgr_for_draw.copy()
     
     # [LỌC NHIỄU] Thiết lập ngưỡng diện tích
     # Nếu khuôn mặt nhỏ hơn 40x40 pixel -> Coi là nhiễu hoặc quá xa -> Bỏ qua.
@@ -128,6 +197,7 @@ def analyze_frame(frame: np.ndarray) -> Tuple[np.ndarray, str, List[str], List[T
         label = this_label # Cập nhật nhãn chung (lấy cái cuối cùng)
         accepted_boxes.append((x, y, w, h)) # Lưu tọa độ hợp lệ
         all_labels.append(this_label)       # Lưu tên cảm xúc vào danh sách
+        if scores_out is not None: scores_out.append(emotions)
         
         # Lưu log chi tiết cho từng mặt
         detail_lines.append(
@@ -156,16 +226,15 @@ def analyze_frame(frame: np.ndarray) -> Tuple[np.ndarray, str, List[str], List[T
     return annotated, label, detail_lines, accepted_boxes, all_labels
 
 
-def save_image_with_label(img_bgr, label, prefix):
-    """Hàm lưu ảnh xuống ổ cứng."""
-    # Tạo tên file duy nhất dựa trên thời gian (Timestamp) để tránh ghi đè
-    filename = f"{prefix}_{datetime.now():%Y%m%d_%H%M%S}.png"
-    path = os.path.join(STORAGE_DIR, filename)
-    
-    # Chuyển hệ màu về RGB để thư viện PIL lưu đúng màu (vì OpenCV đang giữ BGR)
-    pil_img = Image.fromarray(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB))
-    pil_img.save(path)
-    return path
+def save_image_with_label(img_bgr, label, prefix, scores=None, boxes=None, block=True):
+    """
+    Hàm lưu ảnh xuống ổ cứng + ghi vào chỉ mục kho (nhãn, điểm số, box, thumbnail).
+    [TỐI ƯU] Không còn đổi BGR->RGB qua PIL rồi ghi PNG ngay trên luồng giao diện:
+    ảnh được copy vào hàng đợi, luồng ghi nền (capture_writer) mã hóa thẳng từ BGR bằng OpenCV,
+    tạo thumbnail và ghi chỉ mục theo lô. Hàm trả về ngay đường dẫn file sẽ được ghi.
+    - block=False: hàng đợi đầy thì bỏ ảnh này (trả None) - dùng cho chế độ tự động lưu của camera.
+    """
+    return capture_writer.submit(img_bgr, label, prefix, scores=scores, boxes=boxes, block=block)
 
 
 # -------------------------- 3. XÂY DỰNG GIAO DIỆN (UI BUILDERS) -------------------------- #
@@ -222,6 +291,13 @@ def live_view(page: ft.Page) -> ft.View:
     preview = ft.Image(width=480, height=360, fit=ft.ImageFit.CONTAIN)
     label_text = ft.Text("Chưa nhận diện", size=20, weight="bold")
     log_list = ft.ListView(expand=1, spacing=5, height=160)
+    # Tự động lưu frame có cảm xúc (ghi nền qua capture_writer, không làm khựng video)
+    auto_capture = ft.Switch(label="Tự động lưu", value=False)
+    capture_text = ft.Text("", size=12, color=ft.Colors.GREY_600)
+    scheduler_text = ft.Text("", size=12, color=ft.Colors.GREY_600) # Quyết định hiện tại của bộ lập lịch AI
+    # [ĐO ĐẠC] Bật: đo từng đoạn (capture, tìm mặt, phân loại, vẽ, mã hóa, page.update) và vẽ bảng lên preview.
+    # Tắt: mọi điểm đo gần như không tốn gì.
+    hud_switch = ft.Switch(label="HUD hiệu năng", value=PERF.enabled, on_change=lambda e: PERF.enable(e.control.value))
 
     # Cấu hình BottomSheet (bảng thông tin trượt từ dưới lên)
     bottom_sheet = ft.BottomSheet(
@@ -257,56 +333,155 @@ def live_view(page: ft.Page) -> ft.View:
             label_text.value = "Không mở được camera"; page.update(); return
             
         frame_count = 0
-        # Bộ nhớ tạm để lưu kết quả của frame trước (dùng cho frame skipping)
-        last_boxes = []
+        # [TỐI ƯU 3] Tracker: bộ tìm mặt (LIVE_DETECTOR) chỉ chạy mỗi 5 frame (keyframe) hoặc khi bám mất dấu.
+        # Giữa các keyframe, box được dịch theo optical flow và giữ nguyên ID của từng người.
+        # Mỗi keyframe chỉ tìm quanh vị trí mặt đang bám (ROI), 4 keyframe mới quét cả khung 1 lần.
+        def timed_find_faces(img):
+            with PERF.span("detect"):
+                return find_faces(img)
+        tracker = FaceTracker(RoiDetector(timed_find_faces), keyframe_interval=5)
+        # Bộ nhớ tạm: nhãn cảm xúc gần nhất của từng track ID (dùng cho frame skipping)
+        track_labels = {}
         last_label = ""
+        tracks = []
+        
+        # [TỐI ƯU 4] Phát hiện cảnh tĩnh (so ảnh thu nhỏ 32x24 với frame trước đó)
+        # - scene_change: camera đứng yên + box không đổi -> không chạy tracker/AI
+        # - preview_change: ảnh hiển thị không đổi -> không mã hóa, không page.update()
+        # Máy kiosk không có ai đứng trước thì gần như không tốn CPU.
+        scene_change = FrameChangeDetector()
+        preview_change = FrameChangeDetector()
+        prev_boxes = None
+        stable = False
+        static_skips = 0
+        shown_label = None
+        last_capture = 0.0
+        
+        # [LƯU TRỮ] Log trên màn hình chỉ giữ 100 dòng; toàn bộ phiên được ghi vào sessions/<phiên>/
+        # (mỗi mặt mỗi lần phân tích: thời điểm, track ID, box, 7 điểm số float32 ~ 60 byte).
+        # Bộ đệm cố định trong RAM, tự ghi xuống đĩa mỗi 2 giây -> chạy hàng giờ vẫn nhẹ.
+        # Đọc lại + thống kê: python analyze_session.py sessions/<phiên>
+        recorder = SessionRecorder(new_session_dir(), EMOTION_LABELS)
+        
+        # [TỐI ƯU 5] Lịch chạy AI thích nghi (scheduler.py)
+        # Thay cho "mỗi 3 frame" + sleep cố định: đo thời gian suy luận thật và CPU còn rảnh,
+        # tự chọn khoảng cách giữa 2 lần chạy AI sao cho hình vẫn đạt ~20 FPS và kết quả không cũ quá 0.5 giây.
+        # Mặt đang di chuyển / cảm xúc đang đổi -> chạy dày hơn; cảnh ổn định -> giãn dần ra.
+        scheduler = AdaptiveScheduler(target_fps=20, max_staleness=0.5)
+        infer_boxes = None
+        
+        # [TỐI ƯU 6] Không cấp phát mảng mới mỗi frame
+        # - frame_pool: cap.read() ghi thẳng vào 2 buffer dùng luân phiên
+        # - display: ảnh có vẽ khung/nhãn nằm trong 1 buffer hiển thị riêng (thay cho frame.copy())
+        # Số lần cấp phát hiện cạnh quyết định của bộ lập lịch: chạy ổn định thì con số đứng yên.
+        frame_pool = FramePool(size=2)
+        display = BufferCache()
         
         # Vòng lặp vô hạn đọc camera
-        while live_state.running:
-            ret, frame = live_state.cap.read()
-            if not ret: continue
+        try:
+            while live_state.running:
+                with PERF.span("capture"):
+                    frame = frame_pool.read(live_state.cap)
+                if frame is None: continue
+                scheduler.begin_frame()
+                PERF.tick("frame")
             
-            frame_count += 1
+                frame_count += 1
+                # Cảnh tĩnh vẫn được làm mới sau 30 frame để không kẹt kết quả cũ mãi
+                static = not scene_change.has_changed(frame) and stable and static_skips < 30
+                if static:
+                    static_skips += 1
+                else:
+                    static_skips = 0
+                    with PERF.span("track"):
+                        tracks = tracker.update(frame)
+                    boxes_now = [t.box for t in tracks]
+                    stable = boxes_stable(prev_boxes, boxes_now)
+                    prev_boxes = boxes_now
+                logged = False
             
-            # [TỐI ƯU 2] Kỹ thuật Frame Skipping (Nhảy cóc khung hình)
-            # AI rất nặng, nếu chạy trên mọi frame (30FPS) sẽ làm CPU quá tải -> Lag.
-            # Ta chỉ chạy AI trên frame thứ 0, 3, 6... (Mỗi 3 frame chạy 1 lần).
-            if frame_count % 3 == 0:
-                # Gọi AI phân tích
-                annotated, lbl, details, boxes, _ = analyze_frame(frame)
+                # [TỐI ƯU 2] Kỹ thuật Frame Skipping (Nhảy cóc khung hình)
+                # AI rất nặng, nếu chạy trên mọi frame (30FPS) sẽ làm CPU quá tải -> Lag.
+                # Bộ lập lịch quyết định frame nào được chạy AI (xem [TỐI ƯU 5]).
+                if scheduler.should_infer() and not static:
+                    # Gọi AI phân tích - chỉ phân loại các vùng mặt đang được bám
+                    face_scores = []
+                    tracked_boxes = [t.box for t in tracks]
+                    t_infer = time.perf_counter()
+                    annotated, lbl, details, boxes, labels = analyze_frame(frame, boxes=tracked_boxes, scores_out=face_scores, draw_buffers=display)
+                    PERF.record("classify", (time.perf_counter() - t_infer) * 1000.0)
+                    PERF.tick("infer")
+                    scheduler.report(time.perf_counter() - t_infer,
+                                     motion=box_motion(infer_boxes, tracked_boxes) if tracked_boxes else 0.0,
+                                     emotion_changed=lbl.split('(')[0] != last_label.split('(')[0])
+                    infer_boxes = tracked_boxes
+                    scheduler_text.value = f"{scheduler.describe()} | cấp phát buffer {total_allocations()}"
                 
-                # Lưu kết quả vào bộ nhớ tạm
-                last_boxes = boxes
-                last_label = lbl
+                    # Lưu kết quả vào bộ nhớ tạm theo ID
+                    by_box = dict(zip(boxes, labels))
+                    track_labels = {t.track_id: by_box[t.box] for t in tracks if t.box in by_box}
+                    last_label = lbl
                 
-                # Cập nhật UI
-                label_text.value = lbl
-                timestamp = datetime.now().strftime('%H:%M:%S')
-                if "Không phát hiện" not in lbl:
-                    log_list.controls.append(ft.Text(f"{timestamp} - {lbl}", size=12))
-                    # Xóa bớt log cũ nếu quá dài để tiết kiệm RAM
-                    if len(log_list.controls) > 100: log_list.controls.pop(0)
-            else:
-                # Ở các frame bị bỏ qua (1, 2, 4, 5...), ta KHÔNG chạy AI.
-                # Thay vào đó, ta lấy kết quả của frame trước vẽ lại lên frame hiện tại.
-                # Điều này tạo cảm giác video mượt mà (30FPS) dù AI chỉ chạy 10FPS.
-                annotated = frame.copy()
-                for (x, y, w, h) in last_boxes:
-                    cv2.rectangle(annotated, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    # Lấy tên cảm xúc (bỏ phần điểm số trong ngoặc cho gọn)
-                    short_lbl = last_label.split('(')[0] if '(' in last_label else last_label
-                    cv2.putText(annotated, short_lbl, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+                    # Ghi phiên: điểm đầy đủ của từng mặt kèm track ID
+                    if boxes:
+                        id_of = {t.box: t.track_id for t in tracks}
+                        recorder.record([id_of.get(b, -1) for b in boxes], boxes,
+                                        [[sc.get(k, 0.0) for k in EMOTION_LABELS] for sc in face_scores])
                 
-                label_text.value = last_label
+                    # Cập nhật UI
+                    label_text.value = lbl
+                    timestamp = datetime.now().strftime('%H:%M:%S')
+                    if "Không phát hiện" not in lbl:
+                        log_list.controls.append(ft.Text(f"{timestamp} - {lbl}", size=12))
+                        logged = True
+                        # Xóa bớt log cũ nếu quá dài để tiết kiệm RAM
+                        if len(log_list.controls) > 100: log_list.controls.pop(0)
+                    
+                        # Tự động lưu: chỉ đưa vào hàng đợi (copy frame), luồng ghi nền lo phần còn lại
+                        if auto_capture.value and time.time() - last_capture >= AUTO_CAPTURE_INTERVAL:
+                            last_capture = time.time()
+                            save_image_with_label(annotated, lbl, "live", scores=face_scores, boxes=boxes, block=False)
+                            st = capture_writer.stats()
+                            capture_text.value = f"Đã lưu {st['written']} | chờ ghi {st['backlog']} | bỏ qua {st['dropped']}"
+                else:
+                    # Ở các frame bị bỏ qua (1, 2, 4, 5...), ta KHÔNG chạy AI.
+                    # Box đã được tracker dịch theo chuyển động, ta chỉ vẽ lại nhãn cũ của từng ID.
+                    # Điều này tạo cảm giác video mượt mà (30FPS) dù AI chỉ chạy 10FPS.
+                    with PERF.span("draw"):
+                        annotated = display.copy("annotated", frame)
+                        for t in tracks:
+                            if t.track_id not in track_labels: continue
+                            (x, y, w, h) = t.box
+                            cv2.rectangle(annotated, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                            # Lấy tên cảm xúc (bỏ phần điểm số trong ngoặc cho gọn)
+                            short_lbl = track_labels[t.track_id].split('(')[0]
+                            cv2.putText(annotated, short_lbl, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+                
+                    label_text.value = last_label
 
-            # Cập nhật ảnh lên giao diện
-            preview.src_base64 = frame_to_base64(annotated)
-            page.update()
+                # HUD: FPS + p50/p95 từng đoạn vẽ đè góc trái (chỉ khi bật)
+                if PERF.enabled:
+                    PERF.gauge("alloc", total_allocations())
+                    PERF.draw_hud(annotated)
             
-            # Ngủ cực ngắn (10ms) để nhường tài nguyên CPU cho việc vẽ giao diện
-            time.sleep(0.01)
+                # Cập nhật ảnh lên giao diện - chỉ khi ảnh hoặc chữ thực sự thay đổi
+                ui_changed = label_text.value != shown_label or logged
+                if preview_change.has_changed(annotated) or ui_changed:
+                    shown_label = label_text.value
+                    with PERF.span("encode"):
+                        preview.src_base64 = frame_to_base64(annotated)
+                    with PERF.span("page_update"):
+                        page.update()
             
-        if live_state.cap: live_state.cap.release()
+                # Trả buffer về pool (ảnh lưu / preview đã được copy hoặc mã hóa xong)
+                frame_pool.release(frame)
+                # Chỉ ngủ phần còn thiếu để đạt FPS mục tiêu (frame đã chậm thì không ngủ thêm)
+                scheduler.end_frame()
+            
+        finally:
+            if live_state.cap: live_state.cap.release()
+            # Luôn đóng phiên (header closed=True) kể cả khi vòng lặp lỗi giữa chừng
+            recorder.close()
 
     def start_stream():
         if live_state.running: return
@@ -325,7 +500,7 @@ def live_view(page: ft.Page) -> ft.View:
         route="/live",
         controls=[
             ft.AppBar(title=ft.Text("Nhận diện thời gian thực"), leading=ft.IconButton(icon=ft.Icons.ARROW_BACK, on_click=back)),
-            ft.Row([ft.Container(preview, expand=True, border=ft.border.all(1, ft.Colors.GREY)), ft.Column([ft.Text("Cảm xúc"), label_text], expand=True)], expand=True),
+            ft.Row([ft.Container(preview, expand=True, border=ft.border.all(1, ft.Colors.GREY)), ft.Column([ft.Text("Cảm xúc"), label_text, auto_capture, capture_text, scheduler_text, hud_switch], expand=True)], expand=True),
             ft.Text("Kéo thanh dưới để xem log"), ft.Container(height=4), ft.Row([peek_bar], alignment="center"),
         ],
         vertical_alignment="start",
@@ -342,8 +517,11 @@ def photo_view(page: ft.Page) -> ft.View:
     analyzed_image: List[np.ndarray] = [None] # Ảnh gốc đã vẽ khung xanh
     photo_boxes: List[List[Tuple[int, int, int, int]]] = [[]] # Danh sách tọa độ các mặt
     face_labels: List[List[str]] = [[]] # Danh sách tên cảm xúc của từng mặt
+    photo_scores: List[list] = [[]] # Điểm đầy đủ 7 cảm xúc của từng mặt (lưu kèm ảnh)
     
     logs = ft.ListView(expand=True, spacing=4, height=200)
+    # [ẢNH ĐÔNG NGƯỜI] Bật để tìm mặt theo ô (ảnh nhóm, ảnh sự kiện rất lớn có nhiều mặt nhỏ)
+    tiled_switch = ft.Switch(label="Ảnh đông người (chia ô)", value=False)
 
     # Bottom Sheet hiển thị chi tiết
     bottom_sheet = ft.BottomSheet(
@@ -374,13 +552,15 @@ def photo_view(page: ft.Page) -> ft.View:
         if frame is None:
             label_text.value = "Không đọc được ảnh"; page.update(); return
             
-        # Gọi hàm phân tích
-        annotated, lbl, details, boxes, labels_list = analyze_frame(frame)
+        # Gọi hàm phân tích (ảnh đã mở trước đó -> lấy kết quả từ cache ngay)
+        face_scores = []
+        annotated, lbl, details, boxes, labels_list = analyze_frame(frame, cache=default_cache(), scores_out=face_scores, max_side=STILL_MAX_SIDE, tiled=tiled_switch.value)
         
         # Lưu kết quả vào biến nhớ
         analyzed_image[0] = annotated
         photo_boxes[0] = boxes
         face_labels[0] = labels_list 
+        photo_scores[0] = face_scores
         
         label_text.value = lbl
         detail_text.value = "\n".join(details)
@@ -442,7 +622,7 @@ def photo_view(page: ft.Page) -> ft.View:
 
     def save_to_storage(_):
         if analyzed_image[0] is None: return
-        save_image_with_label(analyzed_image[0], label_text.value, "photo")
+        save_image_with_label(analyzed_image[0], label_text.value, "photo", scores=photo_scores[0], boxes=photo_boxes[0])
         page.snack_bar = ft.SnackBar(ft.Text("Đã lưu vào storage/")); page.snack_bar.open = True; page.update()
 
     return ft.View(
@@ -454,6 +634,7 @@ def photo_view(page: ft.Page) -> ft.View:
                 ft.Column([
                     ft.Text("Cảm xúc"), label_text,
                     ft.ElevatedButton("Chọn ảnh", on_click=lambda _: picker.pick_files(allow_multiple=False)),
+                    tiled_switch,
                     ft.ElevatedButton("Lưu vào thư viện", on_click=save_to_storage)
                 ], expand=True, spacing=10)
             ], expand=True),
@@ -463,52 +644,71 @@ def photo_view(page: ft.Page) -> ft.View:
     )
 
 
-def storage_cards(selected: List[str], refresh_callback):
-    """Tạo danh sách thẻ ảnh (Card) trong kho lưu trữ"""
-    files = [f for f in os.listdir(STORAGE_DIR) if f.lower().endswith(".png")]
+def storage_cards(selected: List[str], on_select, offset: int = 0, limit: int = STORAGE_PAGE_SIZE):
+    """
+    Tạo 1 trang thẻ ảnh (Card) trong kho lưu trữ.
+    [TỐI ƯU] Dữ liệu lấy từ chỉ mục (storage_index): thumbnail đã tạo sẵn lúc lưu,
+    không còn os.listdir + mở từng ảnh bằng PIL + nén lại PNG mỗi lần refresh.
+    """
     cards = []
-    for fname in sorted(files, reverse=True):
-        path = os.path.join(STORAGE_DIR, fname)
-        try:
-            img = Image.open(path)
-            thumbnail = img.copy()
-            thumbnail.thumbnail((180, 140)) # Tạo ảnh nhỏ thumbnail để load nhanh
-            buf = io.BytesIO()
-            thumbnail.save(buf, format="PNG")
-            b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-            label = fname.split("_")[0]
-            
-            cards.append(ft.Card(content=ft.Container(
-                padding=10, on_click=lambda e, p=path: (selected.clear(), selected.append(p), refresh_callback()),
-                content=ft.Column([ft.Image(src_base64=b64, width=180, height=140, fit=ft.ImageFit.COVER), ft.Text(label, weight="bold"), ft.Text(fname, size=12)])
-            )))
-        except: pass
+    for row in storage_index.page(offset, limit):
+        path = os.path.join(STORAGE_DIR, row["filename"])
+        label = row["emotion"] or row["prefix"]
+        cards.append(ft.Card(data=path, content=ft.Container(
+            padding=10, on_click=lambda e, p=path: (selected.clear(), selected.append(p), on_select()),
+            content=ft.Column([ft.Image(src_base64=row["thumb"], width=180, height=140, fit=ft.ImageFit.COVER), ft.Text(label, weight="bold"), ft.Text(row["filename"], size=12)])
+        )))
     return cards
 
 def storage_view(page: ft.Page) -> ft.View:
     selected: List[str] = []
-    grid = ft.GridView(expand=True, runs_count=3, max_extent=220, spacing=10, run_spacing=10)
+    total = [0]
+    
+    # [TỐI ƯU] Tải lười (lazy): chỉ dựng trang đầu, cuộn gần cuối mới tải thêm trang tiếp theo
+    def on_scroll(e: ft.OnScrollEvent):
+        if e.pixels >= e.max_scroll_extent - 300 and len(grid.controls) < total[0]:
+            grid.controls.extend(storage_cards(selected, on_select, len(grid.controls)))
+            page.update()
 
-    def refresh():
-        grid.controls = storage_cards(selected, refresh)
+    grid = ft.GridView(expand=True, runs_count=3, max_extent=220, spacing=10, run_spacing=10, on_scroll=on_scroll)
+
+    def on_select():
         delete_btn.disabled = export_btn.disabled = not selected
         page.update()
 
+    def refresh():
+        # Dựng lại từ trang đầu (ảnh mới lưu nằm trên cùng)
+        total[0] = storage_index.count()
+        grid.controls = storage_cards(selected, on_select)
+        on_select()
+
     def back(_): page.go("/")
     def delete_file(_):
         if selected:
-            try: os.remove(selected[0]); selected.clear(); refresh()
+            try:
+                path = selected[0]
+                os.remove(path); storage_index.remove(os.path.basename(path)); selected.clear()
+                # Chỉ gỡ đúng thẻ vừa xóa, không dựng lại cả thư viện
+                grid.controls = [c for c in grid.controls if c.data != path]
+                total[0] -= 1
+                on_select()
             except: pass
     
     def export_file(_):
         if selected:
             img = cv2.imread(selected[0])
-            label = os.path.basename(selected[0]).split("_")[0]
-            new_path = save_image_with_label(img, label, "export")
+            info = storage_index.get(os.path.basename(selected[0])) or {}
+            label = info.get("emotion") or os.path.basename(selected[0]).split("_")[0]
+            new_path = save_image_with_label(img, label, "export", scores=info.get("scores"), boxes=info.get("boxes"))
+            capture_writer.flush(timeout=2.0) # Chờ ảnh xuất ghi xong để hiện ngay trong thư viện
             page.snack_bar = ft.SnackBar(ft.Text(f"Đã xuất: {new_path}")); page.snack_bar.open = True; page.update(); refresh()
 
     delete_btn = ft.ElevatedButton("Xóa", icon=ft.Icons.DELETE, disabled=True, on_click=delete_file)
     export_btn = ft.ElevatedButton("Xuất", icon=ft.Icons.OUTBOX, disabled=True, on_click=export_file)
+    # Ảnh vừa chụp còn trong hàng đợi ghi -> chờ ghi xong (có giới hạn) trước khi đọc chỉ mục
+    capture_writer.flush(timeout=2.0)
+    # Ảnh lưu từ phiên bản cũ (chưa có chỉ mục) chỉ phải tạo thumbnail 1 lần ở đây
+    storage_index.sync()
     refresh()
 
     return ft.View(route="/storage", controls=[ft.AppBar(title=ft.Text("Lưu trữ"), leading=ft.IconButton(icon=ft.Icons.ARROW_BACK, on_click=back)), ft.Row([delete_btn, export_btn], spacing=10, alignment="start"), grid])
@@ -518,6 +718,8 @@ def storage_view(page: ft.Page) -> ft.View:
 
 def main(page: ft.Page):
     """Hàm main: Thiết lập cửa sổ và điều hướng"""
+    # Bắt đầu load mô hình ở luồng nền ngay khi app mở (không chặn giao diện)
+    threading.Thread(target=warm_up, daemon=True).start()
     page.title = "Emotion Tracker"
     page.horizontal_alignment = "center"; page.vertical_alignment = "center"
     page.window_width = 1000; page.window_height = 720
@@ -536,6 +738,7 @@ def main(page: ft.Page):
     page.on_route_change = route_change
     page.on_view_pop = lambda _: page.go(page.views[-1].route if len(page.views) > 1 else "/")
     page.go(page.route or "/")
+    startup.mark("ui_ready") # Mốc: màn hình chính đã hiện, người dùng thao tác được
 
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
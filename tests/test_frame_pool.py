@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+
+from frame_pool import BufferCache, total_allocations
+from function import detect_faces
+from roi import RoiDetector
+
+
+class VaryingFinder:
+    """Bộ tìm mặt giả: mỗi lần gọi trả 1 mặt cỡ khác, lệch dần -> vùng ROI đổi cỡ mỗi keyframe."""
+
+    def __init__(self):
+        self.t = 0
+
+    def find_faces(self, img, bgr=True):
+        self.t += 1
+        h, w = img.shape[:2]
+        s = min(h, w, 40 + (self.t * 17) % 80)
+        x = min(w - s, w // 2 - s // 2 + (self.t * 5) % 20)
+        y = min(h - s, h // 2 - s // 2 + (self.t * 3) % 15)
+        return [(max(0, x), max(0, y), s, s)]
+
+
+def test_detect_faces_allocations_flat_with_moving_rois():
+    finder = VaryingFinder()
+    detector = RoiDetector(lambda img: detect_faces(img, finder), full_every=4)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    for _ in range(20):
+        detector(frame)
+    before = total_allocations()
+    for _ in range(200):
+        detector(frame)
+    assert detector.roi_scans > 100
+    assert total_allocations() == before
+
+
+def test_cvt_view_grows_only_for_larger_sources():
+    cache = BufferCache()
+    big = np.zeros((120, 160, 3), dtype=np.uint8)
+    cache.cvt_view("rgb", big, cv2.COLOR_BGR2RGB)
+    for h, w in ((30, 50), (90, 20), (120, 160), (64, 64)):
+        out = cache.cvt_view("rgb", np.zeros((h, w, 3), dtype=np.uint8), cv2.COLOR_BGR2RGB)
+        assert out.shape == (h, w, 3)
+    assert cache.allocations == 1
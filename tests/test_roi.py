@@ -0,0 +1,18 @@
+from roi import scale_boxes
+
+
+def test_scale_boxes_inside_bounds_unchanged():
+    assert scale_boxes([(10, 20, 30, 40)], 2.0, bounds=(200, 200)) == [(20, 40, 60, 80)]
+
+
+def test_scale_boxes_clips_left_and_top_edge():
+    # Box thò ra ngoài mép trái/trên: cắt phần thừa, góc phải/dưới giữ nguyên
+    assert scale_boxes([(-10, -5, 40, 30)], 1.0, bounds=(100, 100)) == [(0, 0, 30, 25)]
+
+
+def test_scale_boxes_clips_right_and_bottom_edge():
+    assert scale_boxes([(80, 90, 40, 30)], 1.0, bounds=(100, 100)) == [(80, 90, 20, 10)]
+
+
+def test_scale_boxes_drops_box_outside_image():
+    assert scale_boxes([(-50, 10, 20, 20)], 1.0, bounds=(100, 100)) == []
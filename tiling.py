@@ -0,0 +1,183 @@
+# ===============================================
+# tiling.py
+# -----------------------------------------------
+# Tìm mặt theo ô (tile) cho ảnh nhóm / ảnh sự kiện rất lớn, nhiều mặt nhỏ
+#   - Chia ảnh thành các ô chồng lên nhau (overlap) ở độ phân giải gốc
+#     -> mặt nhỏ không bị mất như khi thu nhỏ cả ảnh
+#   - Thêm 1 lượt quét toàn ảnh (thu nhỏ) để bắt mặt to hơn 1 ô
+#   - Overlap tự tăng theo kích thước ảnh: mặt nằm vắt qua đường nối 2 ô mà quá nhỏ cho lượt
+#     toàn ảnh vẫn phải nằm trọn trong 1 ô; ảnh quá lớn thì thêm mức trung gian (xem plan)
+#   - Các ô chạy song song trong thread pool, mỗi luồng có bộ tìm mặt riêng
+#   - Mặt trùng ở mép ô được gộp bằng NMS
+#   python tiling.py images/people-3.jpg      # so tốc độ + số mặt với cách quét 1 lượt
+# ===============================================
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from roi import detect_multiscale, downscale, nms, scale_boxes
+
+
+def make_tiles(width, height, tile=640, overlap=0.25):
+    """Các ô (x0, y0, x1, y1) phủ kín ảnh, 2 ô kề nhau chồng lên nhau overlap * tile."""
+    step = max(1, int(tile * (1 - overlap)))
+
+    def starts(size):
+        if size <= tile:
+            return [0]
+        pos = list(range(0, size - tile, step))
+        return pos + [size - tile]   # ô cuối áp sát mép ảnh
+
+    return [(x, y, min(width, x + tile), min(height, y + tile)) for y in starts(height) for x in starts(width)]
+
+
+class TiledDetector:
+    """
+    finder_factory(): bộ tìm mặt cho 1 luồng, gọi 1 lần mỗi luồng trong pool. Haar cần 1 bản riêng mỗi luồng
+    (CascadeClassifier không an toàn đa luồng); backend có khóa (dnn, mtcnn) thì trả về cùng 1 bản dùng chung
+    (xem function.tile_finder_factory).
+    detect_fn(finder, img) -> list box: cách gọi bộ tìm mặt trên 1 ảnh BGR.
+    overlap: overlap tối thiểu (tỉ lệ cạnh ô); min_face: mặt nhỏ nhất bộ tìm mặt bắt được (px),
+    dùng để tính overlap thật theo kích thước ảnh.
+    """
+
+    # Box của bộ tìm mặt hơi rộng / lệch so với mặt thật -> chừa thêm 20% khi tính overlap
+    seam_margin = 1.2
+
+    def __init__(self, finder_factory, detect_fn, tile=640, overlap=0.25, workers=None,
+                 iou_threshold=0.4, contain_threshold=0.7, global_pass=True, min_face=50):
+        self.finder_factory = finder_factory
+        self.detect_fn = detect_fn
+        self.tile = tile
+        self.overlap = overlap
+        self.min_face = min_face
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.iou_threshold = iou_threshold
+        self.contain_threshold = contain_threshold
+        self.global_pass = global_pass
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.last_stats = {}
+
+    def _finder(self):
+        finder = getattr(self._local, "finder", None)
+        if finder is None:
+            finder = self._local.finder = self.finder_factory()
+        return finder
+
+    def plan(self, width, height):
+        """
+        Các mức chia ô -> list (tỉ lệ thu nhỏ, overlap). Mặt vắt qua đường nối 2 ô chỉ chắc chắn được bắt
+        nếu nằm trọn trong 1 ô (cạnh mặt <= overlap) hoặc đủ lớn cho lượt toàn ảnh
+        (>= min_face * cạnh dài / (2 * tile) px gốc). Overlap cần quá nửa ô -> giữ nửa ô và thêm 1 mức
+        trên ảnh thu nhỏ, bắt tiếp dải mặt mà mức trước chưa chắc bắt được.
+        """
+        long_side = max(width, height)
+        half = self.tile / 2
+        global_scale = min(1.0, 2 * self.tile / long_side) if self.global_pass else 0.0
+        levels, scale = [], 1.0
+        while True:
+            if long_side * scale <= self.tile:
+                levels.append((scale, self.overlap))   # cả ảnh vừa 1 ô: không có đường nối
+                break
+            # Mặt lớn nhất (px ở mức này) mà lượt toàn ảnh chưa chắc bắt được
+            need = self.min_face * self.seam_margin * scale / global_scale if global_scale else float("inf")
+            if need <= half:
+                levels.append((scale, max(self.overlap, need / self.tile)))
+                break
+            levels.append((scale, 0.5))
+            scale *= min(0.5, self.min_face * self.seam_margin / half)
+        return levels
+
+    def _detect_tile(self, img, rect, factor=1.0, bounds=None):
+        x0, y0, x1, y1 = rect
+        boxes = self.detect_fn(self._finder(), img[y0:y1, x0:x1])
+        boxes = [(int(x) + x0, int(y) + y0, int(w), int(h)) for x, y, w, h in boxes]
+        return scale_boxes(boxes, factor, bounds=bounds) if factor != 1.0 else boxes
+
+    def _detect_global(self, frame):
+        return detect_multiscale(frame, lambda img: self.detect_fn(self._finder(), img), self.tile * 2)
+
+    def detect(self, frame):
+        t0 = time.perf_counter()
+        h, w = frame.shape[:2]
+        levels = self.plan(w, h)
+        futures, n_tiles = [], 0
+        for scale, overlap in levels:
+            img, factor = downscale(frame, round(max(w, h) * scale)) if scale < 1.0 else (frame, 1.0)
+            tiles = make_tiles(img.shape[1], img.shape[0], self.tile, overlap)
+            n_tiles += len(tiles)
+            futures += [self._pool.submit(self._detect_tile, img, r, factor, (w, h)) for r in tiles]
+        if self.global_pass and n_tiles > 1:
+            futures.append(self._pool.submit(self._detect_global, frame))
+        found = [b for f in futures for b in f.result()]
+        boxes = nms(found, self.iou_threshold, self.contain_threshold)
+        self.last_stats = {
+            "tiles": n_tiles,
+            "levels": len(levels),
+            "overlap": round(levels[0][1], 3),
+            "workers": self.workers,
+            "raw_boxes": len(found),
+            "faces": len(boxes),
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+        return boxes
+
+
+def compare(frame, tiled, single_fn, repeat=3):
+    """So tìm mặt theo ô với quét 1 lượt: thời gian (lấy lần nhanh nhất), số mặt, tốc độ gấp mấy lần."""
+    def best(fn):
+        times, out = [], None
+        for _ in range(repeat):
+            t = time.perf_counter()
+            out = fn(frame)
+            times.append(time.perf_counter() - t)
+        return min(times), out
+
+    single_s, single_boxes = best(single_fn)
+    tiled_s, tiled_boxes = best(tiled.detect)
+    return {
+        "single_ms": round(single_s * 1000, 1),
+        "tiled_ms": round(tiled_s * 1000, 1),
+        "speedup": round(single_s / tiled_s, 2) if tiled_s else None,
+        "single_faces": len(single_boxes),
+        "tiled_faces": len(tiled_boxes),
+        **{k: v for k, v in tiled.last_stats.items() if k in ("tiles", "workers")},
+    }
+
+
+def main(argv=None):
+    import argparse
+    import cv2
+    from detectors import FACE_FINDERS, detector_choices, resolve_detector
+    from function import detect_faces, get_face_finder, tile_finder_factory
+
+    parser = argparse.ArgumentParser(description="So tìm mặt theo ô với quét 1 lượt trên ảnh lớn.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--detector", choices=detector_choices(), default="haar")
+    parser.add_argument("--tile", type=int, default=640)
+    parser.add_argument("--overlap", type=float, default=0.25, help="Overlap tối thiểu (tự tăng theo kích thước ảnh)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    factory, workers = tile_finder_factory(args.detector)
+    tiled = TiledDetector(factory, lambda f, img: detect_faces(img, f), args.tile, args.overlap, args.workers or workers,
+                          min_face=FACE_FINDERS[resolve_detector(args.detector)].min_face_size)
+    single = get_face_finder(args.detector)
+    for path in args.images:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"{path}: không mở được ảnh", file=sys.stderr)
+            continue
+        r = compare(img, tiled, lambda im: detect_faces(im, single))
+        print(f"{path} ({img.shape[1]}x{img.shape[0]}): 1 lượt {r['single_ms']} ms / {r['single_faces']} mặt, "
+              f"chia {r['tiles']} ô x {r['workers']} luồng {r['tiled_ms']} ms / {r['tiled_faces']} mặt "
+              f"-> x{r['speedup']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# ===============================================
+# tracker.py
+# -----------------------------------------------
+# Bám khuôn mặt giữa các keyframe
+#   - Chỉ chạy detector (MTCNN/Haar) mỗi K frame
+#     hoặc khi độ tin cậy bám giảm
+#   - Giữa các keyframe: dịch box bằng optical flow (Lucas-Kanade)
+#   - Gán ID ổn định cho mỗi mặt bằng IoU
+# ===============================================
+
+import cv2
+import numpy as np
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.points = None       # điểm đặc trưng trong box (N x 1 x 2, float32)
+        self.confidence = 1.0    # tỉ lệ điểm bám thành công ở frame gần nhất
+        self.misses = 0          # số keyframe liên tiếp không khớp detection
+
+    def __repr__(self):
+        return f"Track(id={self.track_id}, box={self.box}, conf={self.confidence:.2f})"
+
+
+class FaceTracker:
+    """
+    detect_fn(frame_bgr) -> list box (x, y, w, h): hàm phát hiện mặt đầy đủ (tốn kém).
+    detect_fn có thuộc tính accepts_hints (vd roi.RoiDetector) thì được truyền thêm hints = box đang bám.
+    update(frame) trả về danh sách Track hiện tại; is_keyframe cho biết frame vừa rồi có chạy detector không.
+    """
+
+    def __init__(self, detect_fn, keyframe_interval=5, min_confidence=0.5,
+                 iou_threshold=0.3, max_misses=2, max_points=30):
+        self.detect_fn = detect_fn
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.min_confidence = min_confidence
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.max_points = max_points
+
+        self.tracks = []
+        self.is_keyframe = False
+        self.detections = 0
+        self._next_id = 1
+        self._since_keyframe = 0
+        self._prev_gray = None
+        # 2 buffer ảnh xám dùng luân phiên (frame trước / frame hiện tại), không cấp phát mỗi frame
+        self._gray_bufs = [None, None]
+        self._gray_slot = 0
+
+    def reset(self):
+        self.tracks = []
+        self._prev_gray = None
+        self._since_keyframe = 0
+
+    def update(self, frame_bgr, gray=None):
+        if gray is None:
+            self._gray_slot ^= 1
+            buf = self._gray_bufs[self._gray_slot]
+            if buf is not None and buf.shape != frame_bgr.shape[:2]:
+                buf = None
+            gray = self._gray_bufs[self._gray_slot] = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY, dst=buf)
+
+        need_detect = (
+            self._prev_gray is None
+            or self._since_keyframe >= self.keyframe_interval - 1
+            or any(t.confidence < self.min_confidence for t in self.tracks)
+        )
+
+        if need_detect:
+            self._keyframe(frame_bgr, gray)
+        else:
+            self._flow(gray)
+            self._since_keyframe += 1
+
+        self._prev_gray = gray
+        return self.tracks
+
+    # ---------- Keyframe: detect + gán ID ----------
+    def _keyframe(self, frame_bgr, gray):
+        if getattr(self.detect_fn, "accepts_hints", False):
+            found = self.detect_fn(frame_bgr, hints=[t.box for t in self.tracks])
+        else:
+            found = self.detect_fn(frame_bgr)
+        boxes = [tuple(int(v) for v in b) for b in found]
+        self.detections += 1
+        self.is_keyframe = True
+        self._since_keyframe = 0
+
+        # Ghép tham lam theo IoU lớn nhất
+        pairs = sorted(
+            ((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)),
+            reverse=True,
+        )
+        used_t, used_b = set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in used_t or bi in used_b:
+                continue
+            used_t.add(ti)
+            used_b.add(bi)
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.misses = 0
+
+        kept = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_t:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            kept.append(track)
+        for bi, box in enumerate(boxes):
+            if bi not in used_b:
+                kept.append(Track(self._next_id, box))
+                self._next_id += 1
+
+        self.tracks = kept
+        for track in self.tracks:
+            track.confidence = 1.0
+            track.points = self._features(gray, track.box)
+
+    def _features(self, gray, box):
+        x, y, w, h = box
+        H, W = gray.shape[:2]
+        x1, y1, x2, y2 = max(0, x), max(0, y), min(W, x + w), min(H, y + h)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        return cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, 5, mask=mask)
+
+    # ---------- Giữa keyframe: optical flow ----------
+    def _flow(self, gray):
+        self.is_keyframe = False
+        live = [t for t in self.tracks if t.points is not None and len(t.points)]
+        for t in self.tracks:
+            if t.points is None or not len(t.points):
+                t.confidence = 0.0
+        if not live:
+            return
+
+        # Một lần gọi LK cho điểm của tất cả các mặt
+        counts = [len(t.points) for t in live]
+        pts = np.concatenate([t.points for t in live]).astype(np.float32)
+        new_pts, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._prev_gray, gray, pts, None, winSize=(15, 15), maxLevel=2
+        )
+        status = status.reshape(-1).astype(bool)
+
+        start = 0
+        for track, n in zip(live, counts):
+            end = start + n
+            ok = status[start:end]
+            old, new = pts[start:end][ok], new_pts[start:end][ok]
+            start = end
+
+            track.confidence = ok.mean() if n else 0.0
+            if len(new) < 3:
+                track.confidence = 0.0
+                track.points = None
+                continue
+
+            dx, dy = np.median((new - old).reshape(-1, 2), axis=0)
+            x, y, w, h = track.box
+            track.box = (int(round(x + dx)), int(round(y + dy)), w, h)
+            track.points = new.reshape(-1, 1, 2)
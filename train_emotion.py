@@ -11,6 +11,7 @@ from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropou
 from tensorflow.keras.preprocessing.image import ImageDataGenerator # Công cụ tăng cường dữ liệu ảnh
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint # Các công cụ hỗ trợ thông minh khi train
 import os
+import json
 
 # --- CẤU HÌNH HỆ THỐNG ---
 # [LÝ THUYẾT] Tại sao 96x96?
@@ -67,6 +68,11 @@ val_generator = val_datagen.flow_from_directory(
     class_mode='categorical'
 )
 
+# Lưu thứ tự lớp (flow_from_directory đánh số theo tên thư mục A-Z)
+# để export_models.py ghi đúng nhãn cho bản ONNX/TFLite.
+with open('class_indices.json', 'w') as f:
+    json.dump(train_generator.class_indices, f)
+
 # --- 2. XÂY DỰNG MODEL (CNN ARCHITECTURE) ---
 
 # Nhóm thiết kế mạng CNN theo phong cách VGG (Visual Geometry Group) nhưng thu nhỏ.
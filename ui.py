@@ -6,6 +6,8 @@ from function import (
     get_quote_for_emotion,
     detect_emotion_from_image_path,
 )
+from preview import FrameChangeDetector, PreviewEncoder
+from perf import PERF
 
 # Tắt một số tối ưu hóa của TensorFlow/oneDNN để tránh hiện tượng crash/giảm hiệu năng trên một số máy.
 # Một số người dùng gặp lỗi khi dùng onednn; thiết lập này là "biện pháp phòng" thường thấy.
@@ -32,6 +34,12 @@ class AppUI:
         self.camera_expanded = False
         # Biến giữ đối tượng CameraStreamer (nếu đang mở camera)
         self.streamer = None
+        # Bộ mã hóa ảnh preview cho camera: JPEG nhanh + nhẹ hơn PNG nhiều lần,
+        # thu nhỏ về 640px vì khung hiển thị không lớn hơn thế.
+        self.preview_encoder = PreviewEncoder("jpeg", quality=80, max_width=640)
+        # Phát hiện frame không đổi: cảnh tĩnh thì không mã hóa + không đẩy UI lại
+        self.preview_change = FrameChangeDetector()
+        self._last_sent_emotion = None
 
         # FILE PICKER
         # Dùng để chọn file ảnh từ máy người dùng cho chế độ "nhận diện qua ảnh".
@@ -67,6 +75,9 @@ class AppUI:
             color="#ffffff",
         )
 
+        # Dòng nhỏ hiển thị quyết định của bộ lập lịch AI (bao lâu chạy 1 lần, vì sao)
+        self.scheduler_text = ft.Text("", size=11, color="#94a3b8")
+
         # Xây dựng trang mở đầu (Start Page)
         self.build_start_page()
 
@@ -208,6 +219,7 @@ class AppUI:
                 back_row,
                 ft.Container(content=main_row, alignment=ft.alignment.center, expand=True),
                 emotion_bar,
+                self.scheduler_text,
             ],
             alignment=ft.MainAxisAlignment.CENTER,
             horizontal_alignment=ft.CrossAxisAlignment.CENTER,
@@ -222,8 +234,13 @@ class AppUI:
         # Nếu streamer cũ còn đang chạy thì stop trước khi tạo streamer mới
         if self.streamer:
             self.streamer.stop()
-        # Tạo CameraStreamer với callback on_new_frame, fps = 8
-        self.streamer = CameraStreamer(callback=self.on_new_frame, fps=8)
+        # Tạo CameraStreamer với callback on_new_frame, AI tối đa 8 lần/giây
+        # (tốc độ thật do AdaptiveScheduler tự chỉnh theo độ trễ suy luận + CPU + chuyển động)
+        self.preview_change.reset()
+        self._last_sent_emotion = None
+        # PERF=1: đo thời gian từng đoạn + vẽ bảng số liệu (FPS, ms mỗi đoạn, hàng đợi) lên góc ảnh
+        self.streamer = CameraStreamer(callback=self.on_new_frame, fps=8, record_dir="sessions",
+                                       hud=PERF.enabled)
         self.streamer.start()
 
         # Khi click page (không phải ảnh), có thể thu nhỏ ảnh nếu đang mở lớn
@@ -270,8 +287,16 @@ class AppUI:
         - boxes: list chứa box khuôn mặt (x, y, w, h)
         Mục tiêu: chuyển frame -> base64 -> cập nhật image và text trên UI.
         """
-        # Chuyển frame (BGR) sang base64 PNG để dùng trong Flet (src_base64).
-        b64 = frame_to_base64_png(frame_bgr)
+        # Ảnh gần như y hệt frame đã gửi và cảm xúc không đổi -> bỏ qua cả mã hóa lẫn page.update()
+        shown = (emotion, round(score, 2))
+        if not self.preview_change.has_changed(frame_bgr) and shown == self._last_sent_emotion:
+            return
+        self._last_sent_emotion = shown
+
+        # Chuyển frame (BGR) sang base64 JPEG để dùng trong Flet (src_base64).
+        # Thời gian mã hóa + kích thước từng frame xem qua self.preview_encoder.stats().
+        with PERF.span("encode"):
+            b64 = self.preview_encoder.to_base64(frame_bgr)
 
         # Đóng gói update UI vào hàm nội bộ để dễ gọi với invoke_later
         def update_ui():
@@ -281,8 +306,12 @@ class AppUI:
             self.emotion_bar.value = f"Cảm xúc: {emotion.upper()}  ({score:.2f})"
             # Cập nhật quote theo cảm xúc
             self.quote_text.value = get_quote_for_emotion(emotion)
+            # Quyết định hiện tại của bộ lập lịch
+            if self.streamer:
+                self.scheduler_text.value = self.streamer.scheduler.describe()
             # Cập nhật page
-            self.page.update()
+            with PERF.span("page_update"):
+                self.page.update()
 
         # Một số phiên bản Flet không có invoke_later -> dùng try/except
         # invoke_later hữu ích khi callback được gọi từ thread khác (ở đây CameraStreamer chạy thread)